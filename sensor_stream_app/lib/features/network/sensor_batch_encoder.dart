@@ -0,0 +1,51 @@
+import 'dart:typed_data';
+
+/// Packs sensor samples into binary frames of the receiver's wire protocol
+/// (see pc_receiver/protocol.py):
+///
+///   header  'SS', version u8, frame type u8, record count u32
+///   record  sensor u8, timestamp i64 (microseconds since epoch), x/y/z f32
+class SensorBatchEncoder {
+  static const int protocolVersion = 1;
+  static const int frameSensorBatch = 1;
+  static const int headerSize = 8;
+  static const int recordSize = 21;
+
+  static const Map<String, int> sensorCodes = {
+    'accelerometer': 1,
+    'gyroscope': 2,
+    'magnetometer': 3,
+  };
+
+  final List<Map<String, dynamic>> _pending = [];
+
+  int get length => _pending.length;
+  bool get isEmpty => _pending.isEmpty;
+
+  void add(Map<String, dynamic> sample) => _pending.add(sample);
+
+  /// Encode all pending samples into one frame and clear the batch
+  Uint8List takeFrame() {
+    final data = ByteData(headerSize + _pending.length * recordSize);
+    data.setUint8(0, 0x53); // 'S'
+    data.setUint8(1, 0x53); // 'S'
+    data.setUint8(2, protocolVersion);
+    data.setUint8(3, frameSensorBatch);
+    data.setUint32(4, _pending.length, Endian.little);
+
+    var offset = headerSize;
+    for (final sample in _pending) {
+      final values = sample['values'] as Map<String, dynamic>;
+      // Samples carry millisecondsSinceEpoch
+      final timestampUs = (sample['timestamp'] as int) * 1000;
+      data.setUint8(offset, sensorCodes[sample['sensorType']] ?? 0);
+      data.setInt64(offset + 1, timestampUs, Endian.little);
+      data.setFloat32(offset + 9, (values['x'] as num).toDouble(), Endian.little);
+      data.setFloat32(offset + 13, (values['y'] as num).toDouble(), Endian.little);
+      data.setFloat32(offset + 17, (values['z'] as num).toDouble(), Endian.little);
+      offset += recordSize;
+    }
+    _pending.clear();
+    return data.buffer.asUint8List();
+  }
+}
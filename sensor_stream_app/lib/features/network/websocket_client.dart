@@ -1,6 +1,8 @@
 import 'dart:convert';
+import 'dart:typed_data';
 import 'package:web_socket_channel/web_socket_channel.dart';
 import 'package:web_socket_channel/status.dart' as status;
+import 'sensor_batch_encoder.dart';
 
 class WebSocketClient {
   static final WebSocketClient _instance = WebSocketClient._internal();
@@ -11,20 +13,26 @@ class WebSocketClient {
   WebSocketChannel? _channel;
   bool _isConnected = false;
   String? _serverAddress;
+  // Set once the server's hello says it accepts our binary frames
+  bool _binarySupported = false;
 
   bool get isConnected => _isConnected;
   String? get serverAddress => _serverAddress;
+  bool get binarySupported => _binarySupported;
 
   Future<bool> connect(String address) async {
     try {
       _serverAddress = address;
+      _binarySupported = false;
       _channel = WebSocketChannel.connect(Uri.parse(address));
       _isConnected = true;
       print('Connected to WebSocket server at $address');
 
       // Listen for server messages
       _channel?.stream.listen((message) {
-        print('Received: $message');
+        if (!_handleHello(message)) {
+          print('Received: $message');
+        }
       }, onError: (error) {
         print('WebSocket error: $error');
         _isConnected = false;
@@ -41,6 +49,21 @@ class WebSocketClient {
     }
   }
 
+  /// Receivers that accept binary frames greet us with
+  /// {"type": "hello", "binary": <protocol version>}; older ones say nothing
+  bool _handleHello(dynamic message) {
+    if (message is! String) return false;
+    try {
+      final data = jsonDecode(message);
+      if (data is! Map || data['type'] != 'hello') return false;
+      _binarySupported = data['binary'] == SensorBatchEncoder.protocolVersion;
+      print('Server hello, binary frames: $_binarySupported');
+      return true;
+    } on FormatException {
+      return false;
+    }
+  }
+
   void sendData(Map<String, dynamic> data) {
     if (_isConnected && _channel != null) {
       try {
@@ -51,9 +74,20 @@ class WebSocketClient {
     }
   }
 
+  void sendBinary(Uint8List frame) {
+    if (_isConnected && _channel != null) {
+      try {
+        _channel!.sink.add(frame);
+      } catch (e) {
+        print('Error sending data: $e');
+      }
+    }
+  }
+
   void disconnect() {
     _channel?.sink.close(status.goingAway);
     _isConnected = false;
+    _binarySupported = false;
     _serverAddress = null;
   }
 }
@@ -1,7 +1,9 @@
+import 'dart:async';
 import 'package:flutter/material.dart';
 import 'package:flutter_riverpod/flutter_riverpod.dart';
 import 'features/sensors/sensor_manager.dart';
 import 'features/network/websocket_client.dart';
+import 'features/network/sensor_batch_encoder.dart';
 
 void main() {
   runApp(const ProviderScope(child: MyApp()));
@@ -37,6 +39,12 @@ class _SensorStreamPageState extends State<SensorStreamPage> {
       TextEditingController(text: 'ws://192.168.1.100:8082');
   bool _isStreaming = false;
 
+  // Once the server says it accepts them, samples go in batched binary
+  // frames instead of one JSON message each
+  static const Duration _batchInterval = Duration(milliseconds: 20);
+  final _batchEncoder = SensorBatchEncoder();
+  Timer? _batchTimer;
+
   @override
   void initState() {
     super.initState();
@@ -49,22 +57,34 @@ class _SensorStreamPageState extends State<SensorStreamPage> {
   }
 
   void _handleSensorData(Map<String, dynamic> data) {
-    if (_webSocketClient.isConnected) {
+    if (!_webSocketClient.isConnected) return;
+    if (_webSocketClient.binarySupported) {
+      _batchEncoder.add(data);
+    } else {
       _webSocketClient.sendData(data);
     }
   }
 
+  void _flushBatch() {
+    if (_batchEncoder.isEmpty) return;
+    _webSocketClient.sendBinary(_batchEncoder.takeFrame());
+  }
+
   Future<void> _toggleStreaming() async {
     if (!_isStreaming) {
       // Start streaming
       final connected = await _webSocketClient.connect(_serverController.text);
       if (connected) {
         _sensorManager.startSensors();
+        _batchTimer = Timer.periodic(_batchInterval, (_) => _flushBatch());
         setState(() => _isStreaming = true);
       }
     } else {
       // Stop streaming
       _sensorManager.stopSensors();
+      _batchTimer?.cancel();
+      _batchTimer = null;
+      _flushBatch();
       _webSocketClient.disconnect();
       setState(() => _isStreaming = false);
     }
@@ -73,6 +93,7 @@ class _SensorStreamPageState extends State<SensorStreamPage> {
   @override
   void dispose() {
     _sensorManager.stopSensors();
+    _batchTimer?.cancel();
     _webSocketClient.disconnect();
     _serverController.dispose();
     super.dispose();
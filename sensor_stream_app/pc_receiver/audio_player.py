@@ -1,9 +1,10 @@
-import os
-import pyaudio
-import numpy as np
+import argparse
+import datetime
+import mmap
+import re
+import struct
 import time
 from pathlib import Path
-import glob
 
 # Path to recordings
 RECORDINGS_DIR = Path("recordings")
@@ -11,126 +12,318 @@ RECORDINGS_DIR = Path("recordings")
 # Audio settings
 SAMPLE_RATE = 44100  # Hz
 CHANNELS = 1
-FORMAT = pyaudio.paInt16
+FORMAT = 8  # pyaudio.paInt16
+SAMPLE_WIDTH = 2  # 16-bit audio
 CHUNK = 1024
 
+# PortAudio callback results (pyaudio.paContinue, pyaudio.paComplete); PyAudio itself
+# is only imported to play, so listing and reading recordings work without it
+PA_CONTINUE = 0
+PA_COMPLETE = 1
+
+# audio_<YYYYmmdd_HHMMSS>[_<device>].wav|pcm
+AUDIO_NAME = re.compile(r'^audio_(\d{8}_\d{6})(?:_(.+))?\.(wav|pcm)$')
+
+
+class AudioFile:
+    """One recording, memory-mapped; `data` is a zero-copy view of its PCM bytes"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.sample_rate = SAMPLE_RATE
+        self.channels = CHANNELS
+        self.sample_width = SAMPLE_WIDTH
+        self.start_time = None
+        self.device = None
+        match = AUDIO_NAME.match(self.path.name)
+        if match:
+            self.start_time = datetime.datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')
+            self.device = match.group(2)
+
+        self._file = open(self.path, 'rb')
+        size = self.path.stat().st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        view = memoryview(self._mmap) if self._mmap else memoryview(b'')
+        offset, length = 0, size
+        if self.path.suffix == '.wav':
+            offset, length = self._parse_wav(view)
+        # Only whole frames, and never past the end of a file that is still growing
+        length = min(length, len(view) - offset)
+        self.data = view[offset:offset + length - length % self.frame_size]
+        view.release()
+
+    def _parse_wav(self, view):
+        """Read the fmt chunk and return (offset, length) of the data chunk"""
+        if len(view) < 12 or view[:4] != b'RIFF' or view[8:12] != b'WAVE':
+            raise ValueError(f"{self.path}: not a WAV file")
+        pos = 12
+        while pos + 8 <= len(view):
+            chunk_id = bytes(view[pos:pos + 4])
+            chunk_size, = struct.unpack_from('<I', view, pos + 4)
+            if chunk_id == b'fmt ':
+                _, self.channels, self.sample_rate, _, _, bits = struct.unpack_from('<HHIIHH', view, pos + 8)
+                self.sample_width = bits // 8
+            elif chunk_id == b'data':
+                # A file whose session is still open has no final length yet
+                if chunk_size == 0:
+                    chunk_size = len(view) - pos - 8
+                return pos + 8, chunk_size
+            pos += 8 + chunk_size + chunk_size % 2
+        return pos, 0
+
+    @property
+    def frame_size(self):
+        return self.channels * self.sample_width
+
+    @property
+    def duration(self):
+        return len(self.data) / (self.frame_size * self.sample_rate)
+
+    @property
+    def end_time(self):
+        return self.start_time + datetime.timedelta(seconds=self.duration)
+
+    def close(self):
+        self.data.release()
+        if self._mmap:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # A chunk is still in use; the mapping goes away with it
+        self._file.close()
+
+
+class AudioStream:
+    """Play several recordings back to back as one continuous PCM stream.
+
+    Chunks are memoryview slices of the mapped files, so memory use does not
+    depend on the recording length; only a chunk that spans two files is
+    copied, to stitch them together without a gap. Offsets and durations
+    are in stream time, i.e. pauses between files are skipped.
+    """
+
+    def __init__(self, files, start_offset=0.0, duration=None):
+        if not files:
+            raise ValueError("No audio files to play")
+        formats = {(f.sample_rate, f.channels, f.sample_width) for f in files}
+        if len(formats) > 1:
+            raise ValueError("Audio files have different formats and cannot be played together")
+        self.files = files
+        self.sample_rate, self.channels, self.sample_width = formats.pop()
+        self.frame_size = self.channels * self.sample_width
+
+        self._index = 0
+        self._pos = int(start_offset * self.sample_rate) * self.frame_size
+        self._remaining = None
+        if duration is not None:
+            self._remaining = int(duration * self.sample_rate) * self.frame_size
+
+    @property
+    def duration(self):
+        return sum(len(f.data) for f in self.files) / (self.frame_size * self.sample_rate)
+
+    def read(self, frame_count):
+        """Return up to frame_count frames (fewer only at the end of the stream)"""
+        size = frame_count * self.frame_size
+        if self._remaining is not None:
+            size = min(size, self._remaining)
+        pieces = []
+        while size > 0 and self._index < len(self.files):
+            data = self.files[self._index].data
+            piece = data[self._pos:self._pos + size]
+            self._pos += len(piece)
+            size -= len(piece)
+            if len(piece):
+                pieces.append(piece)
+            if self._pos >= len(data):
+                self._index += 1
+                self._pos = 0
+        chunk = pieces[0] if len(pieces) == 1 else b''.join(pieces)
+        if self._remaining is not None:
+            self._remaining -= len(chunk)
+        return chunk
+
+    def callback(self, in_data, frame_count, time_info, status):
+        """PyAudio stream callback"""
+        chunk = self.read(frame_count)
+        if len(chunk) < frame_count * self.frame_size:
+            return (bytes(chunk), PA_COMPLETE)
+        return (chunk, PA_CONTINUE)
+
+
+def list_audio_files(directory=RECORDINGS_DIR):
+    """All WAV and legacy PCM audio files in a directory, oldest first"""
+    files = list(Path(directory).glob('audio_*.wav')) + list(Path(directory).glob('audio_*.pcm'))
+    return sorted(files, key=lambda p: (p.name[6:21], p.name))
+
+
+def files_in_range(paths, start=None, end=None, device=None):
+    """Open the recordings of a device that overlap [start, end], in time order"""
+    selected = []
+    for path in paths:
+        audio = AudioFile(path)
+        if audio.start_time is None or (device and audio.device != device):
+            audio.close()
+            continue
+        if (end and audio.start_time >= end) or (start and audio.end_time <= start):
+            audio.close()
+            continue
+        selected.append(audio)
+    return selected
+
+
 class AudioPlayer:
     def __init__(self):
+        import pyaudio
         self.pyaudio = pyaudio.PyAudio()
         self.stream = None
-        
-    def play_audio_file(self, file_path):
-        """Play a PCM audio file"""
+
+    def play(self, audio_stream):
+        """Play an AudioStream in callback mode, blocking until it ends"""
+        self.stream = self.pyaudio.open(
+            format=self.pyaudio.get_format_from_width(audio_stream.sample_width),
+            channels=audio_stream.channels,
+            rate=audio_stream.sample_rate,
+            output=True,
+            frames_per_buffer=CHUNK,
+            stream_callback=audio_stream.callback,
+        )
         try:
-            # Read PCM data
-            with open(file_path, 'rb') as f:
-                audio_data = f.read()
-                
-            # Calculate duration
-            bytes_per_sample = 2  # 16-bit audio
-            num_samples = len(audio_data) // bytes_per_sample
-            duration = num_samples / SAMPLE_RATE
-            
-            print(f"Playing audio file: {file_path}")
-            print(f"File size: {len(audio_data)} bytes")
-            print(f"Duration: {duration:.2f} seconds")
-            
-            # Open audio stream
-            self.stream = self.pyaudio.open(
-                format=FORMAT,
-                channels=CHANNELS,
-                rate=SAMPLE_RATE,
-                output=True
-            )
-            
-            # Play audio in chunks
-            offset = 0
-            chunk_size = CHUNK * 2  # 2 bytes per sample
-            
-            while offset < len(audio_data):
-                chunk = audio_data[offset:offset + chunk_size]
-                self.stream.write(chunk)
-                offset += chunk_size
-                
-            # Close stream
+            while self.stream.is_active():
+                time.sleep(0.1)
+        finally:
             self.stream.stop_stream()
             self.stream.close()
             self.stream = None
-            
+
+    def play_files(self, file_paths, start_offset=0.0, duration=None):
+        """Play one or more audio files gaplessly"""
+        files = []
+        try:
+            files = [AudioFile(path) for path in file_paths]
+            audio_stream = AudioStream(files, start_offset, duration)
+
+            print(f"Playing {len(files)} audio file(s): {', '.join(f.path.name for f in files)}")
+            print(f"Duration: {duration if duration is not None else audio_stream.duration - start_offset:.2f} seconds")
+            self.play(audio_stream)
             return True
         except Exception as e:
-            print(f"Error playing audio file: {e}")
-            
-            if self.stream:
-                self.stream.stop_stream()
-                self.stream.close()
-                self.stream = None
-                
+            print(f"Error playing audio: {e}")
+            return False
+        finally:
+            for audio in files:
+                audio.close()
+
+    def play_audio_file(self, file_path):
+        """Play a WAV or raw PCM audio file"""
+        return self.play_files([file_path])
+
+    def play_range(self, start=None, end=None, device=None):
+        """Play everything a device recorded between start and end (datetimes)"""
+        files = files_in_range(self.list_audio_files(), start, end, device)
+        if not files:
+            print("No audio recorded in that time range.")
             return False
-            
+        devices = {f.device for f in files}
+        if len(devices) > 1:
+            print(f"Several devices recorded audio in that time range ({', '.join(sorted(map(str, devices)))}); "
+                  "pick one with --device.")
+            for audio in files:
+                audio.close()
+            return False
+        paths = [f.path for f in files]
+        start_offset = max(0.0, (start - files[0].start_time).total_seconds()) if start else 0.0
+        duration = None
+        if end:
+            duration = (end - max(start or files[0].start_time, files[0].start_time)).total_seconds()
+        for audio in files:
+            audio.close()
+        return self.play_files(paths, start_offset, duration)
+
     def list_audio_files(self):
-        """List all PCM audio files in the recordings directory"""
-        files = sorted(list(RECORDINGS_DIR.glob('audio_*.pcm')))
-        return files
-        
+        """List all WAV and legacy PCM audio files in the recordings directory"""
+        return list_audio_files(RECORDINGS_DIR)
+
     def close(self):
         """Close PyAudio"""
         if self.stream:
             self.stream.stop_stream()
             self.stream.close()
-            
+
         self.pyaudio.terminate()
-        
+
+
 def interactive_menu(player):
     """Display an interactive menu for playing audio files"""
     while True:
         print("\n== Audio Player Menu ==")
-        
+
         # List audio files
         files = player.list_audio_files()
-        
+
         if not files:
             print("No audio files found in recordings directory.")
             choice = input("\nPress Enter to refresh or 'q' to quit: ").strip().lower()
             if choice == 'q':
                 break
             continue
-            
+
         print("\nAvailable audio files:")
         for i, file_path in enumerate(files):
             print(f"{i+1}. {file_path.name}")
-            
+
         # Get user choice
-        choice = input("\nEnter file number to play, 'r' to refresh, or 'q' to quit: ").strip().lower()
-        
+        choice = input("\nEnter a file number or range (e.g. 3-7) to play, 'r' to refresh, or 'q' to quit: ").strip().lower()
+
         if choice == 'q':
             break
         elif choice == 'r':
             continue
-        
+
         try:
-            file_idx = int(choice) - 1
-            if 0 <= file_idx < len(files):
-                player.play_audio_file(files[file_idx])
+            first, _, last = choice.partition('-')
+            first = int(first) - 1
+            last = int(last) - 1 if last else first
+            if 0 <= first <= last < len(files):
+                player.play_files(files[first:last + 1])
             else:
                 print("Invalid file number.")
         except ValueError:
-            print("Invalid input. Please enter a number, 'r', or 'q'.")
-            
-def main():
+            print("Invalid input. Please enter a number, a range, 'r', or 'q'.")
+
+
+def parse_time(value):
+    """Parse an ISO date/time, or a time of day (today)"""
+    try:
+        return datetime.datetime.fromisoformat(value)
+    except ValueError:
+        return datetime.datetime.combine(datetime.date.today(), datetime.time.fromisoformat(value))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play recorded audio")
+    parser.add_argument('--interactive', action='store_true', help="Pick files from a menu (default)")
+    parser.add_argument('--start', type=parse_time, help="Play from this time (ISO date/time or HH:MM:SS)")
+    parser.add_argument('--end', type=parse_time, help="Play until this time")
+    parser.add_argument('--device', help="Only play recordings of this device")
+    args = parser.parse_args(argv)
+
     print("Starting Audio Player")
-    
+
     # Create audio player
     player = AudioPlayer()
-    
+
     try:
-        # Run interactive menu
-        interactive_menu(player)
+        if args.start or args.end or args.device:
+            player.play_range(args.start, args.end, args.device)
+        else:
+            # Run interactive menu
+            interactive_menu(player)
     finally:
         # Clean up
         player.close()
-        
+
     print("Audio Player closed.")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -0,0 +1,104 @@
+"""JSON codec and event loop, using the fast implementations when they are installed.
+
+    JSON        orjson, else msgspec, else the standard library's json
+    event loop  uvloop, else asyncio's default loop
+
+Everything on the hot path (decoding messages, serializing recording lines
+and subscriber messages, reading recordings back) goes through loads() and
+dumps() here. The choice can be forced with configure() (server.py's
+--json-backend and --loop) or the SENSOR_STREAM_JSON / SENSOR_STREAM_LOOP
+environment variables, which pool worker processes inherit:
+
+    python server.py --json-backend json --loop asyncio   # the standard library only
+"""
+import asyncio
+import json
+import os
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import uvloop
+except ImportError:
+    uvloop = None  # Not available on Windows
+
+JSON_BACKENDS = ('orjson', 'msgspec', 'json')
+LOOP_BACKENDS = ('uvloop', 'asyncio')
+AUTO = 'auto'
+
+JSON_ENV = 'SENSOR_STREAM_JSON'
+LOOP_ENV = 'SENSOR_STREAM_LOOP'
+
+_INSTALLED = {'orjson': orjson, 'msgspec': msgspec, 'json': json, 'uvloop': uvloop, 'asyncio': asyncio}
+
+json_backend = None
+loop_backend = None
+loads = json.loads
+dumps = json.dumps
+# What loads() raises for malformed input
+DecodeError = ValueError
+
+
+def _pick(requested, backends):
+    if requested in (None, '', AUTO):
+        return next(name for name in backends if _INSTALLED[name] is not None)
+    if requested not in backends:
+        raise ValueError(f"Unknown backend {requested!r}: expected {AUTO} or one of {', '.join(backends)}")
+    if _INSTALLED[requested] is None:
+        raise ValueError(f"{requested} is not installed")
+    return requested
+
+
+def configure(json_name=None, loop_name=None):
+    """Select the JSON codec and event loop (None or 'auto': the fastest installed)"""
+    global json_backend, loop_backend, loads, dumps, DecodeError
+    json_backend = _pick(json_name or os.environ.get(JSON_ENV), JSON_BACKENDS)
+    loop_backend = _pick(loop_name or os.environ.get(LOOP_ENV), LOOP_BACKENDS)
+    os.environ[JSON_ENV] = json_backend
+    os.environ[LOOP_ENV] = loop_backend
+
+    if json_backend == 'orjson':
+        loads = orjson.loads
+        # orjson writes bytes (and no spaces); NaN and infinities become null
+        dumps = lambda obj: orjson.dumps(obj).decode()  # noqa: E731
+        DecodeError = orjson.JSONDecodeError
+    elif json_backend == 'msgspec':
+        decoder = msgspec.json.Decoder()
+        encoder = msgspec.json.Encoder()
+        loads = decoder.decode
+        dumps = lambda obj: encoder.encode(obj).decode()  # noqa: E731
+        DecodeError = (msgspec.DecodeError, UnicodeDecodeError)
+    else:
+        loads = json.loads
+        dumps = json.dumps
+        DecodeError = ValueError
+
+
+def run(main):
+    """asyncio.run() on the selected event loop"""
+    if loop_backend == 'uvloop':
+        if hasattr(uvloop, 'run'):
+            return uvloop.run(main)
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return asyncio.run(main)
+
+
+def _version(name):
+    return getattr(_INSTALLED[name], '__version__', None)
+
+
+def describe():
+    """{'json': ..., 'loop': ...} with versions, e.g. for benchmark results"""
+    return {kind: f"{name} {_version(name)}" if _version(name) else name
+            for kind, name in (('json', json_backend), ('loop', loop_backend))}
+
+
+configure()
@@ -0,0 +1,134 @@
+"""Load shedding for the bounded stages between receiving and using samples.
+
+Every device's samples pass through these stages:
+
+    receive   websockets' incoming queue (RECEIVE_QUEUE messages per connection)
+    record    SensorRecorder's queue to its writer thread (RECORD_CAPACITY samples)
+    live      the session's samples waiting for the fusion filter and
+              resampler (LIVE_CAPACITY samples); the shared-memory ring
+              buffers of the visualizer overwrite their oldest samples anyway
+
+A LoadShedder decides per sensor what happens to samples entering a stage
+that is falling behind:
+
+    block         never drop; the server stops reading from the device until
+                  the stage has room, so the phone is slowed down through TCP
+                  (recording only: the live stage is never waited for)
+    drop-newest   drop samples arriving while the stage is full
+    drop-oldest   keep the newest samples (stages that can discard what they hold)
+    decimate      keep one in DECIMATE_FACTOR samples once the stage is
+                  HIGH_WATER full, none once it is full
+
+Policies are given as {sensor: policy}, with '*' for every other sensor:
+
+    python server.py --record-policy '*=block' --live-policy magnetometer=decimate
+"""
+from collections import defaultdict
+
+import numpy as np
+
+from recording_format import SENSOR_NAMES
+
+BLOCK = 'block'
+DROP_NEWEST = 'drop-newest'
+DROP_OLDEST = 'drop-oldest'
+DECIMATE = 'decimate'
+POLICIES = (BLOCK, DROP_NEWEST, DROP_OLDEST, DECIMATE)
+
+# Messages websockets buffers per connection before it stops reading the socket
+RECEIVE_QUEUE = 32
+
+# Capacities (samples)
+RECORD_CAPACITY = 50_000
+LIVE_CAPACITY = 1_000
+
+RECORD_POLICIES = {'*': BLOCK}
+LIVE_POLICIES = {'*': DROP_OLDEST}
+
+# Decimation: kept fraction, and how full the stage is when it starts
+DECIMATE_FACTOR = 4
+HIGH_WATER = 0.5
+
+
+def parse_policies(specs, defaults=None):
+    """{sensor: policy} from 'sensor=policy' strings ('*=policy' for the rest)"""
+    policies = dict(defaults or {})
+    for spec in specs or []:
+        sensor, _, policy = spec.partition('=')
+        if not sensor or policy not in POLICIES:
+            raise ValueError(f"Invalid policy {spec!r}: expected sensor=policy with policy one of {', '.join(POLICIES)}")
+        policies[sensor] = policy
+    return policies
+
+
+class LoadShedder:
+    """Per-sensor drop policy of one stage holding at most `capacity` samples.
+
+    admit_records() filters samples entering the stage, given how many it
+    holds (`backlog`); trim() discards the oldest drop-oldest samples of
+    what it holds. Dropped samples are counted per sensor.
+    """
+
+    def __init__(self, capacity, policies=None, decimate=DECIMATE_FACTOR, high_water=HIGH_WATER):
+        policies = dict(policies or {})
+        for sensor, policy in policies.items():
+            if policy not in POLICIES:
+                raise ValueError(f"Unknown policy for {sensor}: {policy}")
+        self.capacity = capacity
+        self.default = policies.pop('*', BLOCK)
+        self.policies = policies
+        self.decimate = decimate
+        self.high_water = high_water
+        self.dropped = defaultdict(int)
+        self._seen = defaultdict(int)  # Samples offered per sensor while decimating
+
+    def policy(self, sensor):
+        return self.policies.get(sensor, self.default)
+
+    def _keep_count(self, sensor, count, backlog):
+        """How many of `count` samples of a sensor to keep: (count, decimation step or None)"""
+        policy = self.policy(sensor)
+        if policy in (BLOCK, DROP_OLDEST) or backlog < self.capacity * (self.high_water if policy == DECIMATE else 1):
+            return count, None
+        if policy == DROP_NEWEST or backlog >= self.capacity:
+            return 0, None
+        return count, self.decimate
+
+    def admit_records(self, records, backlog):
+        """The records (recording_format.RECORD_DTYPE) to let into the stage"""
+        if not len(records) or backlog < self.capacity * self.high_water:
+            return records
+        codes = records['sensor']
+        mask = np.ones(len(records), dtype=bool)
+        for code in np.unique(codes):
+            sensor = SENSOR_NAMES.get(int(code), 'unknown')
+            selected = codes == code
+            count = int(np.count_nonzero(selected))
+            kept, step = self._keep_count(sensor, count, backlog)
+            if step:
+                keep = (np.arange(count) + self._seen[sensor]) % step == 0
+                self._seen[sensor] += count
+                mask[np.flatnonzero(selected)[~keep]] = False
+                kept = int(np.count_nonzero(keep))
+            elif not kept:
+                mask[selected] = False
+            if kept < count:
+                self.dropped[sensor] += count - kept
+        return records if mask.all() else records[mask]
+
+    def trim(self, records):
+        """Drop the oldest drop-oldest samples until at most `capacity` remain"""
+        surplus = len(records) - self.capacity
+        if surplus <= 0:
+            return records
+        codes = records['sensor']
+        droppable = np.zeros(len(records), dtype=bool)
+        for code in np.unique(codes):
+            if self.policy(SENSOR_NAMES.get(int(code), 'unknown')) == DROP_OLDEST:
+                droppable |= codes == code
+        oldest = np.flatnonzero(droppable)[:surplus]
+        if not len(oldest):
+            return records
+        for code, count in zip(*np.unique(codes[oldest], return_counts=True)):
+            self.dropped[SENSOR_NAMES.get(int(code), 'unknown')] += int(count)
+        return np.delete(records, oldest)
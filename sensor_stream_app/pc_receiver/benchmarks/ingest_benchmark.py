@@ -0,0 +1,115 @@
+"""Throughput of the server's message decoding with each ingest pool.
+
+Simulated connections each decode a stream of phone messages the way the
+server's consumers do (ingest_pool: MAX_BATCH messages at a time, one batch
+in flight per connection) while a probe measures how long the event loop
+stalls. Decoding on the loop is bounded by one core; the process pool
+scales with the cores available:
+
+    python benchmarks/ingest_benchmark.py --clients 8 --messages 20000
+    python benchmarks/ingest_benchmark.py --pools inline process --workers 1 2 4 --json result.json
+    python benchmarks/ingest_benchmark.py --json-backend json   # the standard library's decoder
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import backends  # noqa: E402
+from ingest_pool import IngestPool, MAX_BATCH, POOLS  # noqa: E402
+from measure import percentiles  # noqa: E402
+from load_test import probe_loop_lag, _ms, _fmt  # noqa: E402
+from simulator import SENSORS, _values  # noqa: E402
+
+
+def make_messages(count, start=1_700_000_000.0, rate=200):
+    """`count` JSON sample messages as the app sends them"""
+    messages = []
+    for i in range(count):
+        sensor = SENSORS[i % len(SENSORS)]
+        t = start + i / rate
+        messages.append(json.dumps({'sensorType': sensor, 'timestamp': int(t * 1000), 'values': _values(sensor, t)}))
+    return messages
+
+
+async def run_pool(kind, workers, clients, messages, encode_lines=True):
+    """Decode every client's messages concurrently; returns the results as a dict"""
+    pool = IngestPool(kind, workers)
+    await pool.start()
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(probe_loop_lag(lags, stop))
+
+    async def client():
+        samples = 0
+        for first in range(0, len(messages), MAX_BATCH):
+            items, _ = await pool.decode(messages[first:first + MAX_BATCH], encode_lines)
+            samples += sum(len(item[1]) for item in items if item[0] == 'records')
+        return samples
+
+    start = time.perf_counter()
+    samples = sum(await asyncio.gather(*[client() for _ in range(clients)]))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    await lag_task
+    pool.close()
+    return {
+        'pool': kind,
+        'workers': workers,
+        'samples': samples,
+        'seconds': elapsed,
+        'messages_per_second': clients * len(messages) / elapsed,
+        'loop_lag_ms': _ms(percentiles(lags)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark message decoding with each ingest pool")
+    parser.add_argument('--clients', type=int, default=8, help="Concurrent connections")
+    parser.add_argument('--messages', type=int, default=20000, help="Messages per connection")
+    parser.add_argument('--pools', nargs='+', choices=POOLS, default=list(POOLS))
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=sorted({1, min(4, os.cpu_count() or 1), os.cpu_count() or 1}),
+                        help="Pool sizes to try (thread and process pools)")
+    parser.add_argument('--json-backend', choices=(backends.AUTO,) + backends.JSON_BACKENDS,
+                        help="JSON codec (default: the fastest installed)")
+    parser.add_argument('--loop', choices=(backends.AUTO,) + backends.LOOP_BACKENDS,
+                        help="Event loop (default: uvloop if installed)")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON ('-' for stdout only)")
+    args = parser.parse_args(argv)
+    backends.configure(args.json_backend, args.loop)
+
+    messages = make_messages(args.messages)
+    results = []
+    for kind in args.pools:
+        for workers in ([1] if kind == 'inline' else args.workers):
+            results.append(backends.run(run_pool(kind, workers, args.clients, messages)))
+            if args.json != '-':
+                result = results[-1]
+                print(f"{kind:8} {workers:2} workers: {result['messages_per_second']:9.0f} messages/s, "
+                      f"loop lag p99 {_fmt(result['loop_lag_ms']['p99'])} ms", flush=True)
+
+    inline = next((r['messages_per_second'] for r in results if r['pool'] == 'inline'), None)
+    best = max(results, key=lambda r: r['messages_per_second'])
+    output = {'cpus': os.cpu_count(), 'clients': args.clients, 'messages': args.messages,
+              'backends': backends.describe(), 'results': results}
+    if inline:
+        output['best_speedup'] = best['messages_per_second'] / inline
+    if args.json == '-':
+        print(json.dumps(output, indent=2))
+        return
+    if inline:
+        print(f"Best: {best['pool']} with {best['workers']} workers, {output['best_speedup']:.2f}x inline "
+              f"on {os.cpu_count()} CPUs")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(output, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
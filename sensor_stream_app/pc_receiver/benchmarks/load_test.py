@@ -0,0 +1,204 @@
+"""Multi-client load test for SensorStreamServer.
+
+Runs the server in this process (recording into a temporary directory) and
+simulated phones (simulator.py) in a separate process, then reports:
+
+    throughput   samples and audio bytes received per second
+    latency      sample creation on the phone to the end of its handling by the server
+    loop lag     how long the server's event loop was stalled
+    resources    CPU use of the server process and its peak memory
+
+    python benchmarks/load_test.py --clients 20 --rate 200 --duration 10
+    python benchmarks/load_test.py --binary --audio-chunk 4096 --json result.json
+    python benchmarks/load_test.py --json-backend json --loop asyncio   # without orjson/uvloop
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import backends  # noqa: E402
+import server as server_module  # noqa: E402
+from logging_utils import setup_logging  # noqa: E402
+from measure import CpuMeter, peak_rss_mb, percentiles  # noqa: E402
+from simulator import SENSORS, run_clients  # noqa: E402
+
+# Interval of the event-loop lag probe (seconds)
+LAG_PROBE_INTERVAL = 0.005
+
+
+async def probe_loop_lag(lags, stop):
+    """Record how late the event loop wakes up a sleeping task"""
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lags.append(time.perf_counter() - start - LAG_PROBE_INTERVAL)
+
+
+def _ms(stats):
+    return {key: None if value is None else value * 1000 for key, value in stats.items()}
+
+
+def _fmt(value):
+    return 'n/a' if value is None else f"{value:.1f}"
+
+
+def track_latency(server, latencies):
+    """Wrap the server's sample handler to record seconds from sample creation to handled.
+
+    The phones run on this machine, so their timestamps share our clock
+    (JSON timestamps are whole milliseconds, adding up to 1 ms). Every
+    decoded batch adds the latency of its newest sample.
+    """
+    handle_sensor_batch = server.handle_sensor_batch
+
+    async def timed_sensor_batch(records, session, lines=None):
+        await handle_sensor_batch(records, session, lines)
+        if len(records):
+            latencies.append(time.time() - float(records['timestamp'].max()))
+
+    server.handle_sensor_batch = timed_sensor_batch
+
+
+async def run_load_test(args):
+    """Run one load test; returns the results as a dict"""
+    server_module.RECORDINGS_DIR = Path(tempfile.mkdtemp(prefix='sensor_load_'))
+    server = server_module.SensorStreamServer(host='127.0.0.1', port=args.port,
+                                              shared_prefix=f"sensor_load_{os.getpid()}",
+                                              metrics_port=args.port + 1, pool=args.pool, workers=args.workers)
+    # Keep hold of sessions so their stats survive the disconnect
+    seen_sessions = set()
+    release_session = server.release_session
+    def track_release(session):
+        seen_sessions.add(session)
+        release_session(session)
+    server.release_session = track_release
+    latencies = []
+    track_latency(server, latencies)
+    server_task = asyncio.create_task(server.start_server())
+    await server.ready.wait()
+
+    sensors = SENSORS[:args.sensors]
+    result_queue = multiprocessing.Queue()
+    clients = multiprocessing.Process(target=run_clients, args=(
+        f"ws://127.0.0.1:{args.port}", args.clients, sensors, args.rate, args.duration,
+        args.binary, args.audio_chunk, result_queue))
+
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(probe_loop_lag(lags, stop))
+    cpu = CpuMeter().start()
+    start = time.perf_counter()
+    clients.start()
+    await asyncio.get_running_loop().run_in_executor(None, clients.join)
+    elapsed = time.perf_counter() - start
+    await asyncio.sleep(0.5)
+    stop.set()
+    await lag_task
+    cpu_seconds, cpu_percent = cpu.stop()
+
+    sent = result_queue.get()
+    seen_sessions.update(server.sessions.values())
+    received = sum(sum(s.stats.samples.values()) for s in seen_sessions)
+    audio_received = sum(s.stats.audio_bytes for s in seen_sessions)
+    errors = sum(s.stats.errors for s in seen_sessions)
+    server.stop()
+    await server_task
+
+    return {
+        'scenario': {
+            'clients': args.clients, 'sensors': len(sensors), 'rate': args.rate, 'duration': args.duration,
+            'protocol': 'binary' if args.binary else 'json', 'audio_chunk': args.audio_chunk,
+            'pool': args.pool, 'workers': args.workers, 'backends': backends.describe(),
+        },
+        'sessions': len(seen_sessions),
+        'sent_samples': sent['samples'],
+        'received_samples': received,
+        'samples_per_second': received / elapsed,
+        'sent_audio_bytes': sent['audio_bytes'],
+        'received_audio_bytes': audio_received,
+        'messages': sent['messages'],
+        'errors': errors,
+        'latency_ms': _ms(percentiles(latencies)),
+        'loop_lag_ms': _ms(percentiles(lags)),
+        'cpu_seconds': cpu_seconds,
+        'cpu_percent': cpu_percent,
+        'peak_rss_mb': peak_rss_mb(),
+        'recordings': str(server_module.RECORDINGS_DIR),
+    }
+
+
+def format_result(result):
+    """Human-readable summary of run_load_test()'s result"""
+    scenario = result['scenario']
+    latency = result['latency_ms']
+    lag = result['loop_lag_ms']
+    lines = [
+        f"Clients: {scenario['clients']}, sensors: {scenario['sensors']}, rate: {scenario['rate']} Hz per sensor, "
+        f"{'binary' if scenario['protocol'] == 'binary' else 'JSON'} protocol"
+        + (f", audio chunks of {scenario['audio_chunk']} bytes" if scenario['audio_chunk'] else '')
+        + f", {scenario['pool']} decoding ({scenario['workers']} workers)",
+        f"Backends: JSON {scenario['backends']['json']}, event loop {scenario['backends']['loop']}",
+        f"Sessions seen: {result['sessions']}",
+        f"Sent {result['sent_samples']} samples, received {result['received_samples']} "
+        f"({result['samples_per_second']:.0f} samples/s), {result['errors']} errors",
+    ]
+    if scenario['audio_chunk']:
+        lines.append(f"Audio: sent {result['sent_audio_bytes']} bytes, received {result['received_audio_bytes']}")
+    lines += [
+        f"Latency: p50 {_fmt(latency['p50'])} ms, p95 {_fmt(latency['p95'])} ms, "
+        f"p99 {_fmt(latency['p99'])} ms, max {_fmt(latency['max'])} ms",
+        f"Event loop lag: p99 {_fmt(lag['p99'])} ms, max {_fmt(lag['max'])} ms",
+        f"Server CPU: {result['cpu_percent']:.0f}% of one core, peak memory {_fmt(result['peak_rss_mb'])} MiB",
+        f"Recordings written to {result['recordings']}",
+    ]
+    return '\n'.join(lines)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the sensor stream server")
+    parser.add_argument('--clients', type=int, default=20, help="Number of simulated phones")
+    parser.add_argument('--rate', type=int, default=200, help="Samples per second per sensor")
+    parser.add_argument('--sensors', type=int, default=2, choices=[1, 2, 3],
+                        help="Sensors per phone (accelerometer, gyroscope, magnetometer)")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds to stream")
+    parser.add_argument('--binary', action='store_true',
+                        help="Send batched binary frames (protocol.py) instead of JSON messages")
+    parser.add_argument('--audio-chunk', type=int, default=0,
+                        help="Also stream audio in chunks of this many bytes (0: no audio)")
+    parser.add_argument('--pool', choices=server_module.POOLS, default=server_module.DEFAULT_POOL,
+                        help="Where the server decodes messages")
+    parser.add_argument('--workers', type=int, default=server_module.DEFAULT_WORKERS, help="Workers of the pool")
+    parser.add_argument('--json-backend', choices=(backends.AUTO,) + backends.JSON_BACKENDS,
+                        help="Server JSON codec (default: the fastest installed)")
+    parser.add_argument('--loop', choices=(backends.AUTO,) + backends.LOOP_BACKENDS,
+                        help="Server event loop (default: uvloop if installed)")
+    parser.add_argument('--port', type=int, default=8799)
+    parser.add_argument('--log-level', default='WARNING', help="Server log level during the test")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON ('-' for stdout only)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    backends.configure(args.json_backend, args.loop)
+    setup_logging(args.log_level)
+    result = backends.run(run_load_test(args))
+    if args.json == '-':
+        print(json.dumps(result, indent=2))
+        return
+    print(format_result(result))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Throughput of bulk_loader against the naive one-json.loads-per-line loop.
+
+Loads a recordings directory (by default the receiver's own recordings/)
+three ways and reports samples per second:
+
+    naive     json.loads + sample_to_record per line, one file at a time
+    fast      bulk_loader with one worker (regex/NumPy parser only)
+    parallel  bulk_loader sharded across a process pool
+
+    python benchmarks/loader_benchmark.py recordings --workers 4
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from bulk_loader import find_recordings, load_recordings, merge_records  # noqa: E402
+from recording_format import RECORD_DTYPE, sample_to_record  # noqa: E402
+
+
+def naive_load(paths):
+    """The loop bulk_loader replaces"""
+    parts = []
+    for path in paths:
+        records = []
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    records.append(sample_to_record(json.loads(line)))
+                except json.JSONDecodeError:
+                    continue
+        parts.append(np.array(records, dtype=RECORD_DTYPE))
+    return merge_records(parts)
+
+
+def timed(label, load, baseline=None):
+    start = time.perf_counter()
+    data = load()
+    elapsed = time.perf_counter() - start
+    samples = sum(len(records) for records in data.values())
+    speedup = f", {baseline / elapsed:.1f}x naive" if baseline else ''
+    print(f"{label:9} {samples} samples in {elapsed:.2f} s ({samples / elapsed:,.0f} samples/s{speedup})")
+    return elapsed, data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the bulk recording loader")
+    parser.add_argument('directory', nargs='?', default=str(Path(__file__).resolve().parent.parent / 'recordings'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    paths = [p for p in find_recordings(args.directory) if p.suffix == '.json']
+    print(f"{len(paths)} JSON-lines files in {args.directory}, {os.cpu_count()} CPUs")
+
+    naive_time, expected = timed('naive', lambda: naive_load(paths))
+    _, fast = timed('fast', lambda: load_recordings(paths, workers=1), naive_time)
+    _, parallel = timed('parallel', lambda: load_recordings(paths, workers=args.workers), naive_time)
+
+    for data in (fast, parallel):
+        for sensor, records in expected.items():
+            assert np.array_equal(data[sensor], records), f"{sensor} differs from the naive loader"
+    print("Results identical")
+
+
+if __name__ == "__main__":
+    main()
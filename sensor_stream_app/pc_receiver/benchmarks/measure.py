@@ -0,0 +1,57 @@
+"""Measurement helpers shared by the benchmarks: percentiles and process CPU/memory"""
+import os
+import sys
+import time
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None  # Windows
+
+
+def percentiles(values, points=(50, 95, 99)):
+    """{'p50': ..., 'max': ...} of a list of numbers (None entries when it is empty)"""
+    values = sorted(values)
+    result = {}
+    for point in points:
+        result[f"p{point}"] = values[min(len(values) - 1, int(len(values) * point / 100))] if values else None
+    result['max'] = values[-1] if values else None
+    return result
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MiB (None if it cannot be measured)"""
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10
+    if psutil is not None:
+        # Windows keeps the peak working set
+        info = psutil.Process().memory_info()
+        return getattr(info, 'peak_wset', info.rss) / 2 ** 20
+    return None
+
+
+class CpuMeter:
+    """CPU time used by this process (all threads) between start() and stop()"""
+
+    def start(self):
+        self._cpu = self._cpu_seconds()
+        self._wall = time.perf_counter()
+        return self
+
+    def stop(self):
+        """Returns (cpu seconds, percent of one core over the wall time)"""
+        cpu = self._cpu_seconds() - self._cpu
+        wall = max(time.perf_counter() - self._wall, 1e-9)
+        return cpu, 100.0 * cpu / wall
+
+    @staticmethod
+    def _cpu_seconds():
+        times = os.times()
+        return times.user + times.system
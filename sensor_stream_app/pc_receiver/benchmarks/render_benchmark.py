@@ -0,0 +1,76 @@
+"""Frame rate of the visualizer renderers.
+
+Renders the phone spinning for a number of frames, without a window
+(matplotlib renders into an off-screen Agg canvas) and with the data
+source stubbed out, and compares the frame rate with the visualizer's
+target of one frame per UPDATE_INTERVAL.
+
+    python benchmarks/render_benchmark.py --frames 200 --json render.json
+"""
+import argparse
+import contextlib
+import json
+import sys
+import time
+from pathlib import Path
+
+import matplotlib
+matplotlib.use('Agg')
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import visualizer as visualizer_module  # noqa: E402
+from measure import percentiles  # noqa: E402
+
+
+def run(frames):
+    """Render `frames` frames; returns the frame times in seconds"""
+    vis = visualizer_module.SensorDataVisualizer('matplotlib')
+    vis.check_new_data = lambda: None
+    vis.accel_data = {'x': 0.0, 'y': 0.0, 'z': 9.81}
+    vis.fig.canvas.draw()  # Initial full draw caches the background
+
+    times = []
+    for frame in range(frames):
+        start = time.perf_counter()
+        vis.yaw += 0.05
+        vis.roll += 0.02
+        vis.update_plot(frame)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def run_benchmark(frames):
+    """Render `frames` frames; returns the results as a dict"""
+    # Keep the visualizer's console output out of machine-readable output
+    with contextlib.redirect_stdout(sys.stderr):
+        times = run(frames)
+    return {
+        'frames': frames,
+        'fps': len(times) / sum(times),
+        'target_fps': visualizer_module.TARGET_FPS,
+        'frame_ms': {key: value * 1000 for key, value in percentiles(times).items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the visualizer renderer")
+    parser.add_argument('--frames', type=int, default=200)
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON ('-' for stdout only)")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.frames)
+    fps, target, frame_ms = result['fps'], result['target_fps'], result['frame_ms']
+    if args.json == '-':
+        print(json.dumps(result, indent=2))
+    else:
+        print(f"matplotlib renderer: {fps:.1f} fps ({1000 / fps:.1f} ms/frame, p99 {frame_ms['p99']:.1f} ms), "
+              f"target {target:.0f} fps: {'ok' if fps >= target else 'below target'}")
+    if args.json and args.json != '-':
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    return 0 if fps >= target else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
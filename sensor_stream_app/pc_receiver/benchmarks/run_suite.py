@@ -0,0 +1,142 @@
+"""Run the benchmark suite and write one machine-readable result file.
+
+Every scenario runs in its own process (so CPU and peak memory are its
+own): load tests of the server with JSON and binary phones, with and
+without audio, the visualizer renderer and the server's cold start. Load
+tests use the fastest installed JSON codec and event loop (backends.py);
+json_stdlib repeats the JSON test with the standard library's to show
+what they gain. Results are compared with a previous run to catch
+regressions:
+
+    python benchmarks/run_suite.py -o baseline.json
+    ... change server.py / visualizer.py ...
+    python benchmarks/run_suite.py -o current.json --baseline baseline.json
+
+The comparison fails (exit status 1) when a metric got worse by more than
+--tolerance (relative).
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+from pathlib import Path
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+
+# name: (script, arguments); load tests also get --duration, the renderer --frames
+SCENARIOS = {
+    'json': ('load_test.py', ['--clients', '5', '--rate', '100']),
+    'json_stdlib': ('load_test.py', ['--clients', '5', '--rate', '100', '--json-backend', 'json', '--loop', 'asyncio']),
+    'binary': ('load_test.py', ['--clients', '5', '--rate', '100', '--binary']),
+    'json_audio': ('load_test.py', ['--clients', '5', '--rate', '100', '--audio-chunk', '4096']),
+    'binary_audio': ('load_test.py', ['--clients', '5', '--rate', '100', '--binary', '--audio-chunk', '4096']),
+    'render': ('render_benchmark.py', []),
+    'startup': ('startup_benchmark.py', ['--runs', '5']),
+}
+
+# Metrics compared against the baseline: (path in the result, True if higher is better)
+METRICS = [
+    (('samples_per_second',), True),
+    (('latency_ms', 'p50'), False),
+    (('latency_ms', 'p99'), False),
+    (('loop_lag_ms', 'p99'), False),
+    (('cpu_percent',), False),
+    (('peak_rss_mb',), False),
+    (('fps',), True),
+    (('frame_ms', 'p99'), False),
+    (('startup_ms', 'p50'), False),
+]
+
+
+def run_scenario(name, duration=5.0, frames=200):
+    """Run one scenario in a subprocess and return its parsed JSON result"""
+    script, arguments = SCENARIOS[name]
+    if script == 'load_test.py':
+        arguments = arguments + ['--duration', str(duration)]
+    elif script == 'render_benchmark.py':
+        arguments = arguments + ['--frames', str(frames)]
+    output = subprocess.run([sys.executable, str(BENCHMARKS_DIR / script), *arguments, '--json', '-'],
+                            stdout=subprocess.PIPE, check=True, cwd=BENCHMARKS_DIR.parent).stdout
+    return json.loads(output)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=BENCHMARKS_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _metric(result, path):
+    for key in path:
+        if not isinstance(result, dict) or key not in result:
+            return None
+        result = result[key]
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """[(scenario, metric, baseline, current, change)] of the metrics that regressed"""
+    regressions = []
+    for name, result in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if previous is None:
+            continue
+        for path, higher_is_better in METRICS:
+            old, new = _metric(previous, path), _metric(result, path)
+            if old is None or new is None or old == 0:
+                continue
+            change = (new - old) / abs(old)
+            if (-change if higher_is_better else change) > tolerance:
+                regressions.append((name, '.'.join(path), old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the receiver benchmark suite")
+    parser.add_argument('scenarios', nargs='*', help=f"Scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="Result file")
+    parser.add_argument('--baseline', help="Result file of an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Relative change that counts as a regression (default: 0.2)")
+    parser.add_argument('--duration', type=float, default=5.0, help="Seconds per load test (default: 5)")
+    parser.add_argument('--frames', type=int, default=200, help="Frames for the renderer (default: 200)")
+    args = parser.parse_args()
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    results = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'scenarios': {},
+    }
+    for name in args.scenarios or SCENARIOS:
+        print(f"Running {name}...", flush=True)
+        results['scenarios'][name] = run_scenario(name, args.duration, args.frames)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, metric, old, new, change in regressions:
+            print(f"REGRESSION {name} {metric}: {old:.2f} -> {new:.2f} ({change:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+"""Synthetic phones for load testing the receiver.
+
+Each simulated phone streams the same messages as the Flutter app: one
+SensorManager JSON object per sample ({sensorType, timestamp, values},
+timestamp in millisecondsSinceEpoch), or protocol.py batch frames every
+10 ms in binary mode. Audio, if enabled, is sent in chunks of the given
+size at the real 44.1 kHz 16-bit mono data rate (base64 JSON messages, or
+binary audio frames).
+
+Against a running server:
+
+    python benchmarks/simulator.py ws://192.168.1.10:8082 --clients 5 --rate 100 --audio-chunk 4096
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from protocol import encode_audio, encode_samples  # noqa: E402
+from recorder import AUDIO_SAMPLE_RATE, AUDIO_SAMPLE_WIDTH, AUDIO_CHANNELS  # noqa: E402
+
+SENSORS = ['accelerometer', 'gyroscope', 'magnetometer']
+
+# Send loop tick (seconds); binary mode sends one batch frame per tick
+TICK = 0.01
+
+AUDIO_BYTES_PER_SECOND = AUDIO_SAMPLE_RATE * AUDIO_SAMPLE_WIDTH * AUDIO_CHANNELS
+
+
+def _values(sensor, t):
+    """Plausible, slowly moving readings"""
+    if sensor == 'accelerometer':
+        return {'x': 0.3 * math.sin(t), 'y': 0.2 * math.cos(t), 'z': 9.81}
+    if sensor == 'gyroscope':
+        return {'x': 0.05 * math.cos(t), 'y': 0.0, 'z': 0.1 * math.sin(0.5 * t)}
+    return {'x': 20.0 * math.cos(0.1 * t), 'y': -5.0, 'z': -30.0 * math.sin(0.1 * t)}
+
+
+async def simulate_phone(uri, device, sensors, rate, duration, binary=False, audio_chunk=0):
+    """Stream `rate` samples/s per sensor (and audio) for `duration` seconds.
+
+    Returns {'samples': ..., 'audio_bytes': ..., 'messages': ...} sent.
+    """
+    import websockets
+
+    per_tick = rate * TICK
+    audio_interval = audio_chunk / AUDIO_BYTES_PER_SECOND if audio_chunk else None
+    silence = bytes(audio_chunk)
+    sent = {'samples': 0, 'audio_bytes': 0, 'messages': 0}
+    async with websockets.connect(f"{uri}/?device={device}") as websocket:
+        start = time.perf_counter()
+        due = 0.0
+        next_audio = start
+        while time.perf_counter() - start < duration:
+            due += per_tick
+            batch = []
+            for _ in range(int(due)):
+                now = time.time()
+                for sensor in sensors:
+                    sample = {
+                        'sensorType': sensor,
+                        'timestamp': int(now * 1000),
+                        'values': _values(sensor, now),
+                    }
+                    if binary:
+                        batch.append(sample)
+                    else:
+                        await websocket.send(json.dumps(sample))
+                        sent['messages'] += 1
+                    sent['samples'] += 1
+            if batch:
+                await websocket.send(encode_samples(batch))
+                sent['messages'] += 1
+            due -= int(due)
+
+            while audio_interval and time.perf_counter() >= next_audio:
+                if binary:
+                    await websocket.send(encode_audio(silence))
+                else:
+                    await websocket.send(json.dumps({'type': 'audio', 'data': base64.b64encode(silence).decode()}))
+                sent['audio_bytes'] += audio_chunk
+                sent['messages'] += 1
+                next_audio += audio_interval
+
+            next_tick = start + TICK * (int((time.perf_counter() - start) / TICK) + 1)
+            await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    return sent
+
+
+async def simulate_phones(uri, clients, sensors, rate, duration, binary=False, audio_chunk=0):
+    """Run `clients` phones concurrently; returns the summed counters"""
+    results = await asyncio.gather(*[
+        simulate_phone(uri, f"sim-{i}", sensors, rate, duration, binary, audio_chunk) for i in range(clients)
+    ])
+    return {key: sum(result[key] for result in results) for key in results[0]} if results else {}
+
+
+def run_clients(uri, clients, sensors, rate, duration, binary, audio_chunk, result_queue):
+    """Client process entry point: puts the summed counters on result_queue"""
+    result_queue.put(asyncio.run(simulate_phones(uri, clients, sensors, rate, duration, binary, audio_chunk)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate phones streaming to a sensor stream server")
+    parser.add_argument('uri', nargs='?', default='ws://127.0.0.1:8082')
+    parser.add_argument('--clients', type=int, default=1)
+    parser.add_argument('--rate', type=int, default=100, help="Samples per second per sensor")
+    parser.add_argument('--sensors', nargs='+', default=SENSORS[:2], choices=SENSORS)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--binary', action='store_true', help="Send protocol.py frames instead of JSON")
+    parser.add_argument('--audio-chunk', type=int, default=0, help="Audio chunk size in bytes (0: no audio)")
+    args = parser.parse_args()
+
+    sent = asyncio.run(simulate_phones(args.uri, args.clients, args.sensors, args.rate, args.duration,
+                                       args.binary, args.audio_chunk))
+    print(json.dumps(sent))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Cold-start time of the headless server.
+
+Launches the server as a fresh interpreter, waits until its port accepts
+connections, and stops it again, a number of times. Compares starting
+server.py directly with the run_receiver.py entry point. Also reports how
+long importing the server module takes:
+
+    python benchmarks/startup_benchmark.py --runs 10
+    python benchmarks/startup_benchmark.py --json startup.json
+"""
+import argparse
+import json
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from measure import percentiles  # noqa: E402
+
+RECEIVER_DIR = Path(__file__).resolve().parent.parent
+
+# name: command line after the interpreter (the port is appended)
+COMMANDS = {
+    'run_receiver': [str(RECEIVER_DIR / 'run_receiver.py'), '--server-only', '--metrics-port', '0', '--port'],
+    'server': [str(RECEIVER_DIR / 'server.py'), '--metrics-port', '0', '--port'],
+}
+
+# Give up on a server that is not listening after this long
+TIMEOUT = 30  # seconds
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def time_startup(command, cwd):
+    """Seconds from launching `command` until its port accepts connections"""
+    port = free_port()
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, *command, str(port), '--log-level', 'WARNING'], cwd=cwd,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return time.perf_counter() - start
+            except OSError:
+                if process.poll() is not None:
+                    raise RuntimeError(f"{' '.join(command)} exited with status {process.returncode}")
+                if time.perf_counter() - start > TIMEOUT:
+                    raise RuntimeError(f"{' '.join(command)} was not listening after {TIMEOUT} s")
+                time.sleep(0.002)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def time_import(module, runs):
+    """Seconds to import `module` in a fresh interpreter (median of `runs`)"""
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    times = sorted(float(subprocess.run([sys.executable, '-c', code], cwd=RECEIVER_DIR, capture_output=True,
+                                        text=True, check=True).stdout) for _ in range(runs))
+    return times[len(times) // 2]
+
+
+def run_benchmark(runs):
+    """Start each command `runs` times; returns the results as a dict"""
+    results = {'runs': runs}
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, command in COMMANDS.items():
+            times = [time_startup(command, cwd) for _ in range(runs)]
+            results[name] = {key: value * 1000 for key, value in percentiles(times).items()}
+    # The entry point's numbers are the ones compared across runs
+    results['startup_ms'] = results['run_receiver']
+    results['server_import_ms'] = time_import('server', min(runs, 5)) * 1000
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the server's cold-start time")
+    parser.add_argument('--runs', type=int, default=10, help="Starts per command")
+    parser.add_argument('--json', metavar='PATH', help="Also write the results as JSON ('-' for stdout only)")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.runs)
+    if args.json == '-':
+        print(json.dumps(result, indent=2))
+        return
+    for name in COMMANDS:
+        times = result[name]
+        print(f"{name:12} listening after p50 {times['p50']:.0f} ms, max {times['max']:.0f} ms")
+    print(f"import server: {result['server_import_ms']:.0f} ms")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
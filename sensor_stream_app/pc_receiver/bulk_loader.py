@@ -0,0 +1,163 @@
+"""Load many recordings at once for offline analysis.
+
+Files are sharded across a process pool; every worker parses its files into
+one record array (recording_format.parse_jsonl, which skips json.loads for
+lines in the server's own format), and the shards are merged in timestamp
+order and split per sensor:
+
+    from bulk_loader import load_recordings
+    data = load_recordings('recordings', progress=lambda done, total, samples: print(done, total))
+    data['accelerometer']['timestamp']
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+
+from recording_format import RECORD_DTYPE, SENSOR_NAMES, FILE_SUFFIX, open_records, parse_jsonl
+from session_archive import ARCHIVE_SUFFIX, SessionArchive
+
+# Shards per worker: more shards balance better, fewer pickle less
+SHARDS_PER_WORKER = 4
+
+# Files parsed together when loading without workers
+LOCAL_BATCH_FILES = 256
+
+
+def find_recordings(inputs):
+    """Expand files and directories into the recording files they contain"""
+    if isinstance(inputs, (str, Path)):
+        inputs = [inputs]
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if item.is_dir():
+            paths.extend(sorted(item.glob('sensor_data_*.json')))
+            paths.extend(sorted(item.glob(f"*{FILE_SUFFIX}")))
+            paths.extend(sorted(item.glob(f"*{ARCHIVE_SUFFIX}")))
+        else:
+            paths.append(item)
+    return paths
+
+
+def load_file(path):
+    """Read one JSON-lines, binary or session archive file into a record array"""
+    path = Path(path)
+    if path.suffix == FILE_SUFFIX:
+        return np.array(open_records(path))
+    if path.suffix == ARCHIVE_SUFFIX:
+        return SessionArchive(path).read()
+    return parse_jsonl(path.read_bytes())
+
+
+def load_shard(paths):
+    """Worker: read a list of files into one record array.
+
+    The JSON-lines files are parsed as one buffer, so the per-call cost of
+    the parser is paid once per shard rather than once per small file.
+    """
+    parts = []
+    text = []
+    for path in paths:
+        if str(path).endswith((FILE_SUFFIX, ARCHIVE_SUFFIX)):
+            parts.append(load_file(path))
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        text.append(data if not data or data.endswith(b'\n') else data + b'\n')
+    if text:
+        parts.append(parse_jsonl(b''.join(text)))
+    return np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+
+
+def shard_files(paths, shards):
+    """Split files into `shards` lists of roughly equal total size"""
+    shards = max(1, min(shards, len(paths)))
+    groups = [[] for _ in range(shards)]
+    sizes = [0] * shards
+    for path in sorted(paths, key=lambda p: os.path.getsize(p), reverse=True):
+        smallest = sizes.index(min(sizes))
+        groups[smallest].append(path)
+        sizes[smallest] += os.path.getsize(path)
+    return [group for group in groups if group]
+
+
+def merge_records(parts, sensors=None):
+    """Merge record arrays in timestamp order into {sensor: records}"""
+    records = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+    records = records[np.argsort(records['timestamp'], kind='stable')]
+    result = {}
+    codes = records['sensor']
+    for code in np.unique(codes):
+        sensor = SENSOR_NAMES.get(int(code), 'unknown')
+        if sensors is None or sensor in sensors:
+            result[sensor] = records[codes == code]
+    for sensor in sensors or []:
+        result.setdefault(sensor, np.empty(0, dtype=RECORD_DTYPE))
+    return result
+
+
+def load_recordings(inputs, workers=None, sensors=None, progress=None):
+    """Load recordings (files and/or directories) into {sensor: records sorted by time}.
+
+    workers: processes to use (default: one per CPU; 1 parses in this process)
+    sensors: sensor types to keep (default: all)
+    progress: called as progress(files_done, files_total, samples_loaded)
+    """
+    paths = find_recordings(inputs)
+    workers = workers or os.cpu_count() or 1
+    parts = []
+    samples = 0
+
+    done = 0
+    if workers <= 1:
+        # In this process, in batches so progress still gets reported
+        for first in range(0, len(paths), LOCAL_BATCH_FILES):
+            batch = paths[first:first + LOCAL_BATCH_FILES]
+            parts.append(load_shard(batch))
+            done += len(batch)
+            samples += len(parts[-1])
+            if progress:
+                progress(done, len(paths), samples)
+        return merge_records(parts, sensors)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(load_shard, shard): len(shard)
+                   for shard in shard_files(paths, workers * SHARDS_PER_WORKER)}
+        for future in as_completed(futures):
+            parts.append(future.result())
+            done += futures[future]
+            samples += len(parts[-1])
+            if progress:
+                progress(done, len(paths), samples)
+    return merge_records(parts, sensors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load recordings in parallel and save them as one .npz")
+    parser.add_argument('inputs', nargs='+', help="Recording files or directories")
+    parser.add_argument('-o', '--output', help="Save the per-sensor arrays to this .npz file")
+    parser.add_argument('--workers', type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument('--sensors', nargs='+', help="Sensor types to keep (default: all)")
+    args = parser.parse_args(argv)
+
+    def report(done, total, samples):
+        print(f"\r{done}/{total} files, {samples} samples", end='', flush=True)
+
+    start = time.perf_counter()
+    data = load_recordings(args.inputs, args.workers, args.sensors, progress=report)
+    print(f"\nLoaded in {time.perf_counter() - start:.2f} s")
+    for sensor, records in sorted(data.items()):
+        print(f"{sensor}: {len(records)} samples")
+    if args.output:
+        np.savez(args.output, **data)
+        print(f"Saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,210 @@
+"""Live fan-out of received samples to subscribed WebSocket consumers.
+
+Dashboards, analysis scripts or a remote visualizer subscribe on the
+server's /subscribe path, optionally filtered by device and sensor and
+decimated:
+
+    ws://<host>:8082/subscribe?sensors=accelerometer,gyroscope&decimate=4&device=pixel7&format=json
+
+JSON subscribers get {"device": ..., "samples": [...]} text messages with
+the phone's sample format (timestamps in epoch ms); binary subscribers get
+protocol.py sensor batch frames, which carry no device id (subscribe to one
+device to tell them apart).
+
+Publishing only filters and queues; every subscriber has its own bounded
+queue, drained by its own task, so a slow subscriber never delays ingest or
+the other subscribers. When its queue is full its oldest batches are dropped.
+
+    python fanout.py ws://127.0.0.1:8082 --sensors accelerometer --decimate 10
+"""
+import argparse
+import asyncio
+from collections import defaultdict, deque
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+
+import backends
+from protocol import records_to_frame
+from recording_format import SENSOR_CODES, records_to_samples
+from logging_utils import get_logger
+
+logger = get_logger('fanout')
+
+SUBSCRIBE_PATH = '/subscribe'
+FORMATS = ('json', 'binary')
+
+# Batches waiting per subscriber before the oldest are dropped
+SUBSCRIBER_QUEUE = 64
+
+
+class Subscription:
+    """One consumer's filter, decimation and bounded queue of (device, records) batches"""
+
+    def __init__(self, sensors=None, devices=None, decimate=1, format='json', queue_size=SUBSCRIBER_QUEUE):
+        if format not in FORMATS:
+            raise ValueError(f"Unknown format: {format}")
+        if decimate < 1:
+            raise ValueError("decimate must be at least 1")
+        unknown = set(sensors or ()) - set(SENSOR_CODES)
+        if unknown:
+            raise ValueError(f"Unknown sensors: {', '.join(sorted(unknown))}")
+        self.codes = np.array([SENSOR_CODES[sensor] for sensor in sensors]) if sensors else None
+        self.devices = set(devices) if devices else None
+        self.decimate = decimate
+        self.format = format
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.sent = 0
+        self.dropped = 0
+        self._seen = defaultdict(int)  # Samples per sensor code, for decimation
+        self._ready = asyncio.Event()
+
+    @classmethod
+    def from_path(cls, path):
+        """Subscription from the query of a /subscribe URL (ValueError if it is invalid)"""
+        query = parse_qs(urlparse(path).query)
+        def values(key):
+            return [value for item in query.get(key, []) for value in item.split(',') if value]
+        return cls(sensors=values('sensors'), devices=values('device'),
+                   decimate=int(query.get('decimate', ['1'])[0]), format=query.get('format', ['json'])[0])
+
+    def offer(self, device_id, records):
+        """Queue the matching, decimated part of a batch (never blocks)"""
+        if self.devices is not None and device_id not in self.devices:
+            return
+        if self.codes is not None:
+            records = records[np.isin(records['sensor'], self.codes)]
+        if self.decimate > 1 and len(records):
+            codes = records['sensor']
+            keep = np.zeros(len(records), dtype=bool)
+            for code in np.unique(codes):
+                selected = np.flatnonzero(codes == code)
+                keep[selected] = (np.arange(len(selected)) + self._seen[code]) % self.decimate == 0
+                self._seen[code] += len(selected)
+            records = records[keep]
+        if not len(records):
+            return
+        if len(self.queue) >= self.queue_size:
+            self.dropped += len(self.queue.popleft()[1])
+        self.queue.append((device_id, records))
+        self._ready.set()
+
+    def _batches(self):
+        """Take everything queued, merging consecutive batches of the same device"""
+        batches = []
+        while self.queue:
+            device_id, records = self.queue.popleft()
+            if batches and batches[-1][0] == device_id:
+                batches[-1][1].append(records)
+            else:
+                batches.append((device_id, [records]))
+        return [(device_id, np.concatenate(chunks)) for device_id, chunks in batches]
+
+    def encode(self, device_id, records):
+        if self.format == 'binary':
+            return records_to_frame(records)
+        return backends.dumps({'device': device_id, 'samples': records_to_samples(records)})
+
+    async def send_queued(self, websocket):
+        """Send batches as they are queued, until the connection closes"""
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            for device_id, records in self._batches():
+                await websocket.send(self.encode(device_id, records))
+                self.sent += len(records)
+
+
+class FanOut:
+    """The server's subscribers; publish() hands every batch to each of them"""
+
+    def __init__(self):
+        self.subscriptions = set()
+        # Counters of subscribers that have left, so the totals never go down
+        self.retired_sent = 0
+        self.retired_dropped = 0
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    @property
+    def sent(self):
+        return self.retired_sent + sum(s.sent for s in self.subscriptions)
+
+    @property
+    def dropped(self):
+        return self.retired_dropped + sum(s.dropped for s in self.subscriptions)
+
+    def publish(self, device_id, records):
+        """Offer a record array (recording_format.RECORD_DTYPE) to every subscriber"""
+        for subscription in self.subscriptions:
+            subscription.offer(device_id, records)
+
+    async def serve(self, websocket, path):
+        """Handle a subscriber connection until it closes"""
+        try:
+            subscription = Subscription.from_path(path)
+        except ValueError as e:
+            logger.warning("Rejecting subscription %s: %s", path, e)
+            await websocket.close(code=1008, reason=str(e)[:120])
+            return
+        client = websocket.remote_address[0]
+        logger.info("Subscriber connected from %s (%s)", client, path)
+        self.subscriptions.add(subscription)
+        sender = asyncio.create_task(subscription.send_queued(websocket))
+        # Subscribers send nothing we need; reading detects the close
+        receiver = asyncio.create_task(self._drain(websocket))
+        try:
+            await asyncio.wait([sender, receiver], return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            sender.cancel()
+            receiver.cancel()
+            # Retrieve the tasks' results: a closed connection ends send_queued with ConnectionClosed
+            await asyncio.gather(sender, receiver, return_exceptions=True)
+            self.subscriptions.discard(subscription)
+            self.retired_sent += subscription.sent
+            self.retired_dropped += subscription.dropped
+            logger.info("Subscriber from %s left: %d samples sent, %d dropped",
+                        client, subscription.sent, subscription.dropped)
+
+    @staticmethod
+    async def _drain(websocket):
+        try:
+            async for _ in websocket:
+                pass
+        except Exception:
+            pass
+
+
+async def subscribe(uri, sensors=None, device=None, decimate=1):
+    """Print the samples of a running server as JSON lines"""
+    import websockets
+
+    query = [f"decimate={decimate}"]
+    if sensors:
+        query.append(f"sensors={','.join(sensors)}")
+    if device:
+        query.append(f"device={device}")
+    async with websockets.connect(f"{uri.rstrip('/')}{SUBSCRIBE_PATH}?{'&'.join(query)}") as websocket:
+        async for message in websocket:
+            batch = backends.loads(message)
+            for sample in batch['samples']:
+                print(backends.dumps({'device': batch['device'], **sample}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the live samples of a sensor stream server")
+    parser.add_argument('uri', nargs='?', default='ws://127.0.0.1:8082')
+    parser.add_argument('--sensors', nargs='+', choices=[s for s in SENSOR_CODES if s != 'unknown'])
+    parser.add_argument('--device', help="Only this device")
+    parser.add_argument('--decimate', type=int, default=1, help="Keep one in N samples per sensor")
+    args = parser.parse_args()
+    try:
+        backends.run(subscribe(args.uri, args.sensors, args.device, args.decimate))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+"""Quaternion sensor fusion for accelerometer, gyroscope and magnetometer data.
+
+Quaternions are [w, x, y, z] arrays rotating vectors from the phone (body)
+frame into the earth frame (x = magnetic north, y = west, z = up).
+
+The filters are recursive, so each sample depends on the previous estimate;
+the batch APIs do all per-sample preprocessing (time steps, normalization,
+holding the latest accel/mag value for every gyro sample) vectorized in
+NumPy and run only the small recursive update per sample.
+"""
+import abc
+import math
+import numpy as np
+from orientation import MAX_SAMPLE_DT
+from recording_format import SENSOR_CODES
+
+IDENTITY = np.array([1.0, 0.0, 0.0, 0.0])
+
+
+def quaternion_multiply(q, r):
+    """Hamilton product q * r"""
+    w0, x0, y0, z0 = q
+    w1, x1, y1, z1 = r
+    return np.array([
+        w0 * w1 - x0 * x1 - y0 * y1 - z0 * z1,
+        w0 * x1 + x0 * w1 + y0 * z1 - z0 * y1,
+        w0 * y1 - x0 * z1 + y0 * w1 + z0 * x1,
+        w0 * z1 + x0 * y1 - y0 * x1 + z0 * w1,
+    ])
+
+
+def quaternion_conjugate(q):
+    return np.array([q[0], -q[1], -q[2], -q[3]])
+
+
+def quaternion_to_matrix(q):
+    """3x3 rotation matrix (body to earth) for a unit quaternion"""
+    w, x, y, z = q
+    return np.array([
+        [1 - 2 * (y * y + z * z), 2 * (x * y - w * z), 2 * (x * z + w * y)],
+        [2 * (x * y + w * z), 1 - 2 * (x * x + z * z), 2 * (y * z - w * x)],
+        [2 * (x * z - w * y), 2 * (y * z + w * x), 1 - 2 * (x * x + y * y)],
+    ])
+
+
+def quaternion_to_euler(q):
+    """(roll, pitch, yaw) in radians for a unit quaternion"""
+    w, x, y, z = q
+    roll = math.atan2(2 * (w * x + y * z), 1 - 2 * (x * x + y * y))
+    pitch = math.asin(max(-1.0, min(1.0, 2 * (w * y - z * x))))
+    yaw = math.atan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+    return roll, pitch, yaw
+
+
+def _normalized_rows(v):
+    """Normalize the rows of an N x 3 array, leaving all-zero rows at zero"""
+    norm = np.linalg.norm(v, axis=1, keepdims=True)
+    return np.divide(v, norm, out=np.zeros_like(v), where=norm > 0)
+
+
+def _time_steps(timestamps, previous, max_dt):
+    """Per-sample time steps, clipped to [0, max_dt]"""
+    dt = np.diff(timestamps, prepend=timestamps[0] if previous is None else previous)
+    return np.clip(dt, 0.0, max_dt, out=dt)
+
+
+class _OrientationFilter(abc.ABC):
+    """Shared state and batch driver for the orientation filters"""
+
+    def __init__(self, max_dt=MAX_SAMPLE_DT):
+        self.q = IDENTITY.copy()
+        self.max_dt = max_dt
+        self.last_timestamp = None
+
+    def reset(self, q=None):
+        self.q = IDENTITY.copy() if q is None else np.asarray(q, dtype=np.float64)
+        self.last_timestamp = None
+
+    def update_batch(self, timestamps, gyro, accel=None, mag=None):
+        """Process N samples and return the N x 4 quaternion after each one.
+
+        timestamps: N epoch seconds; gyro: N x 3 rad/s; accel, mag: N x 3
+        readings taken at (or held from before) each gyro sample, any units.
+        All-zero accel/mag rows mean "no reading" and skip that correction.
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        n = len(timestamps)
+        out = np.empty((n, 4))
+        if n == 0:
+            return out
+        gyro = np.asarray(gyro, dtype=np.float64).reshape(n, 3)
+        accel = np.zeros((n, 3)) if accel is None else np.asarray(accel, dtype=np.float64).reshape(n, 3)
+        mag = np.zeros((n, 3)) if mag is None else np.asarray(mag, dtype=np.float64).reshape(n, 3)
+
+        dt = _time_steps(timestamps, self.last_timestamp, self.max_dt)
+        self._run(dt, gyro, _normalized_rows(accel), _normalized_rows(mag), out)
+        self.last_timestamp = timestamps[-1]
+        return out
+
+    def _run(self, dt, gyro, accel, mag, out):
+        # Plain floats are much faster than NumPy scalars for the recursive part
+        q0, q1, q2, q3 = self.q.tolist()
+        step = self._step
+        for i, (d, g, a, m) in enumerate(zip(dt.tolist(), gyro.tolist(), accel.tolist(), mag.tolist())):
+            q0, q1, q2, q3 = step(q0, q1, q2, q3, g, a, m, d)
+            out[i] = (q0, q1, q2, q3)
+        self.q = np.array([q0, q1, q2, q3])
+
+    @abc.abstractmethod
+    def _step(self, q0, q1, q2, q3, g, a, m, dt):
+        """One recursive update on plain floats; returns the new (q0, q1, q2, q3)"""
+
+
+class ComplementaryFilter(_OrientationFilter):
+    """Quaternion complementary filter (Mahony style, proportional correction).
+
+    The gyro is integrated and nudged towards the attitude given by gravity
+    (accelerometer) and magnetic north (magnetometer) with gain `kp`.
+    """
+
+    def __init__(self, kp=1.0, max_dt=MAX_SAMPLE_DT):
+        super().__init__(max_dt)
+        self.kp = kp
+
+    def _step(self, q0, q1, q2, q3, g, a, m, dt):
+        gx, gy, gz = g
+        ax, ay, az = a
+        if ax or ay or az:
+            # Estimated "up" in the body frame (third row of the rotation matrix)
+            ux = 2 * (q1 * q3 - q0 * q2)
+            uy = 2 * (q2 * q3 + q0 * q1)
+            uz = 1 - 2 * (q1 * q1 + q2 * q2)
+            ex = ay * uz - az * uy
+            ey = az * ux - ax * uz
+            ez = ax * uy - ay * ux
+
+            mx, my, mz = m
+            if mx or my or mz:
+                # Measured horizontal north: (up x m) x up
+                wx = ay * mz - az * my
+                wy = az * mx - ax * mz
+                wz = ax * my - ay * mx
+                nx = wy * az - wz * ay
+                ny = wz * ax - wx * az
+                nz = wx * ay - wy * ax
+                norm = math.sqrt(nx * nx + ny * ny + nz * nz)
+                if norm > 0:
+                    nx, ny, nz = nx / norm, ny / norm, nz / norm
+                    # Estimated north in the body frame (first row of the rotation matrix)
+                    hx = 1 - 2 * (q2 * q2 + q3 * q3)
+                    hy = 2 * (q1 * q2 - q0 * q3)
+                    hz = 2 * (q1 * q3 + q0 * q2)
+                    ex += ny * hz - nz * hy
+                    ey += nz * hx - nx * hz
+                    ez += nx * hy - ny * hx
+
+            gx += self.kp * ex
+            gy += self.kp * ey
+            gz += self.kp * ez
+
+        return _integrate(q0, q1, q2, q3, gx, gy, gz, 0.0, 0.0, 0.0, 0.0, dt)
+
+
+class MadgwickFilter(_OrientationFilter):
+    """Madgwick gradient-descent orientation filter (MARG, or IMU without magnetometer)"""
+
+    def __init__(self, beta=0.1, max_dt=MAX_SAMPLE_DT):
+        super().__init__(max_dt)
+        self.beta = beta
+
+    def _step(self, q0, q1, q2, q3, g, a, m, dt):
+        gx, gy, gz = g
+        ax, ay, az = a
+        mx, my, mz = m
+        s0 = s1 = s2 = s3 = 0.0
+
+        if (ax or ay or az) and (mx or my or mz):
+            _2q0mx = 2 * q0 * mx
+            _2q0my = 2 * q0 * my
+            _2q0mz = 2 * q0 * mz
+            _2q1mx = 2 * q1 * mx
+            _2q0 = 2 * q0
+            _2q1 = 2 * q1
+            _2q2 = 2 * q2
+            _2q3 = 2 * q3
+            _2q0q2 = 2 * q0 * q2
+            _2q2q3 = 2 * q2 * q3
+            q0q0 = q0 * q0
+            q0q1 = q0 * q1
+            q0q2 = q0 * q2
+            q0q3 = q0 * q3
+            q1q1 = q1 * q1
+            q1q2 = q1 * q2
+            q1q3 = q1 * q3
+            q2q2 = q2 * q2
+            q2q3 = q2 * q3
+            q3q3 = q3 * q3
+
+            # Reference direction of the earth's magnetic field
+            hx = (mx * q0q0 - _2q0my * q3 + _2q0mz * q2 + mx * q1q1 + _2q1 * my * q2
+                  + _2q1 * mz * q3 - mx * q2q2 - mx * q3q3)
+            hy = (_2q0mx * q3 + my * q0q0 - _2q0mz * q1 + _2q1mx * q2 - my * q1q1
+                  + my * q2q2 + _2q2 * mz * q3 - my * q3q3)
+            _2bx = math.sqrt(hx * hx + hy * hy)
+            _2bz = (-_2q0mx * q2 + _2q0my * q1 + mz * q0q0 + _2q1mx * q3 - mz * q1q1
+                    + _2q2 * my * q3 - mz * q2q2 + mz * q3q3)
+            _4bx = 2 * _2bx
+            _4bz = 2 * _2bz
+
+            # Objective function errors
+            fa1 = 2 * q1q3 - _2q0q2 - ax
+            fa2 = 2 * q0q1 + _2q2q3 - ay
+            fa3 = 1 - 2 * q1q1 - 2 * q2q2 - az
+            fm1 = _2bx * (0.5 - q2q2 - q3q3) + _2bz * (q1q3 - q0q2) - mx
+            fm2 = _2bx * (q1q2 - q0q3) + _2bz * (q0q1 + q2q3) - my
+            fm3 = _2bx * (q0q2 + q1q3) + _2bz * (0.5 - q1q1 - q2q2) - mz
+
+            # Gradient descent step
+            s0 = (-_2q2 * fa1 + _2q1 * fa2 - _2bz * q2 * fm1
+                  + (-_2bx * q3 + _2bz * q1) * fm2 + _2bx * q2 * fm3)
+            s1 = (_2q3 * fa1 + _2q0 * fa2 - 4 * q1 * fa3 + _2bz * q3 * fm1
+                  + (_2bx * q2 + _2bz * q0) * fm2 + (_2bx * q3 - _4bz * q1) * fm3)
+            s2 = (-_2q0 * fa1 + _2q3 * fa2 - 4 * q2 * fa3 + (-_4bx * q2 - _2bz * q0) * fm1
+                  + (_2bx * q1 + _2bz * q3) * fm2 + (_2bx * q0 - _4bz * q2) * fm3)
+            s3 = (_2q1 * fa1 + _2q2 * fa2 + (-_4bx * q3 + _2bz * q1) * fm1
+                  + (-_2bx * q0 + _2bz * q2) * fm2 + _2bx * q1 * fm3)
+        elif ax or ay or az:
+            _2q0 = 2 * q0
+            _2q1 = 2 * q1
+            _2q2 = 2 * q2
+            _2q3 = 2 * q3
+            _4q0 = 4 * q0
+            _4q1 = 4 * q1
+            _4q2 = 4 * q2
+            _8q1 = 8 * q1
+            _8q2 = 8 * q2
+            q0q0 = q0 * q0
+            q1q1 = q1 * q1
+            q2q2 = q2 * q2
+            q3q3 = q3 * q3
+
+            s0 = _4q0 * q2q2 + _2q2 * ax + _4q0 * q1q1 - _2q1 * ay
+            s1 = (_4q1 * q3q3 - _2q3 * ax + 4 * q0q0 * q1 - _2q0 * ay - _4q1
+                  + _8q1 * q1q1 + _8q1 * q2q2 + _4q1 * az)
+            s2 = (4 * q0q0 * q2 + _2q0 * ax + _4q2 * q3q3 - _2q3 * ay - _4q2
+                  + _8q2 * q1q1 + _8q2 * q2q2 + _4q2 * az)
+            s3 = 4 * q1q1 * q3 - _2q1 * ax + 4 * q2q2 * q3 - _2q2 * ay
+
+        norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+        if norm > 0:
+            k = self.beta / norm
+            s0, s1, s2, s3 = s0 * k, s1 * k, s2 * k, s3 * k
+        return _integrate(q0, q1, q2, q3, gx, gy, gz, s0, s1, s2, s3, dt)
+
+
+def _integrate(q0, q1, q2, q3, gx, gy, gz, s0, s1, s2, s3, dt):
+    """q += (0.5 * q * omega - s) * dt, then renormalize"""
+    d0 = (0.5 * (-q1 * gx - q2 * gy - q3 * gz) - s0) * dt
+    d1 = (0.5 * (q0 * gx + q2 * gz - q3 * gy) - s1) * dt
+    d2 = (0.5 * (q0 * gy - q1 * gz + q3 * gx) - s2) * dt
+    d3 = (0.5 * (q0 * gz + q1 * gy - q2 * gx) - s3) * dt
+    q0, q1, q2, q3 = q0 + d0, q1 + d1, q2 + d2, q3 + d3
+    norm = math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+    return q0 / norm, q1 / norm, q2 / norm, q3 / norm
+
+
+class SensorFusion:
+    """Run an orientation filter over interleaved sensor records.
+
+    Records use recording_format.RECORD_DTYPE and must be in arrival order.
+    Every gyroscope record produces one update, using the most recent
+    accelerometer and magnetometer readings at that point in the stream.
+    """
+
+    ACCEL = SENSOR_CODES['accelerometer']
+    GYRO = SENSOR_CODES['gyroscope']
+    MAG = SENSOR_CODES['magnetometer']
+
+    def __init__(self, orientation_filter=None):
+        self.filter = orientation_filter or MadgwickFilter()
+        self.last_accel = np.zeros(3)
+        self.last_mag = np.zeros(3)
+        self.timestamp = None
+
+    @property
+    def quaternion(self):
+        return self.filter.q.copy()
+
+    def _held(self, codes, values, code, last):
+        """Latest value of one sensor at every row (carried over from previous batches)"""
+        rows = np.arange(len(codes))
+        index = np.maximum.accumulate(np.where(codes == code, rows, -1))
+        held = np.vstack([last, values])[index + 1]
+        return held
+
+    def update_records(self, records):
+        """Feed a batch of records and return the quaternions for its gyro samples"""
+        if len(records) == 0:
+            return np.empty((0, 4))
+        codes = records['sensor']
+        values = np.column_stack([records['x'], records['y'], records['z']]).astype(np.float64)
+
+        accel = self._held(codes, values, self.ACCEL, self.last_accel)
+        mag = self._held(codes, values, self.MAG, self.last_mag)
+        self.last_accel = accel[-1]
+        self.last_mag = mag[-1]
+
+        gyro_rows = codes == self.GYRO
+        if not gyro_rows.any():
+            return np.empty((0, 4))
+        timestamps = records['timestamp'][gyro_rows]
+        self.timestamp = float(timestamps[-1])
+        return self.filter.update_batch(timestamps, values[gyro_rows], accel[gyro_rows], mag[gyro_rows])
@@ -0,0 +1,201 @@
+"""Decoding of received messages off the event loop.
+
+The server's receive loop only queues each connection's raw messages
+(MessageQueue). One consumer task per connection takes them in batches and
+has an IngestPool decode them: JSON parsing, sample conversion and, for
+JSON recordings, serializing the lines the recorder will write. The loop
+then applies the decoded items in the original order. Every connection has
+at most one batch in flight, so its order is kept while the batches of
+different connections decode in parallel.
+
+Pools:
+
+    inline    decode on the event loop (no hand-off cost; one core)
+    thread    a thread pool (overlaps decoding with network I/O)
+    process   a process pool (decoding of busy phones spreads over cores)
+"""
+import asyncio
+import base64
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import backends
+from protocol import decode_frame, is_binary_frame, wire_to_records, ProtocolError, FRAME_SENSOR_BATCH, FRAME_AUDIO
+from recording_format import sample_to_record, records_to_samples, pack_records
+
+POOLS = ('inline', 'thread', 'process')
+DEFAULT_POOL = 'thread'
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+
+# Messages decoded together, and queued per connection before reading pauses
+MAX_BATCH = 256
+MAX_PENDING = 1024
+
+
+def _sample_lines(samples):
+    return ''.join(backends.dumps(sample) + '\n' for sample in samples)
+
+
+def decode_messages(messages, encode_lines=False, arrivals=None):
+    """Decode one connection's raw messages, in order (runs in a pool worker).
+
+    arrivals are the messages' receive times (time.time_ns()), stored in
+    the records' receive_ns. Returns (items, timings). Items are, in
+    message order:
+
+        ('records', records, lines)  consecutive samples as one RECORD_DTYPE
+                                     array; lines are their JSON recording
+                                     lines (None unless encode_lines)
+        ('audio', pcm)
+        ('raw', message)                   not JSON
+        ('unknown', data)                  JSON of an unknown message type
+        ('error', reason)
+
+    timings are (format, seconds) per decoded message.
+    """
+    items = []
+    timings = []
+    run, lines = [], []
+
+    def flush():
+        if run:
+            items.append(('records', pack_records(run), ''.join(lines) if encode_lines else None))
+            run.clear()
+            lines.clear()
+
+    for index, message in enumerate(messages):
+        started = time.perf_counter()
+        receive_ns = arrivals[index] if arrivals else 0
+        if is_binary_frame(message):
+            try:
+                frame_type, payload = decode_frame(message)
+                if frame_type == FRAME_SENSOR_BATCH:
+                    payload = wire_to_records(payload)
+                    payload['receive_ns'] = receive_ns
+            except ProtocolError as e:
+                flush()
+                items.append(('error', f"Dropping binary frame: {e}"))
+                continue
+            timings.append(('binary', time.perf_counter() - started))
+            if frame_type == FRAME_SENSOR_BATCH:
+                run.append(payload)
+                if encode_lines:
+                    lines.append(_sample_lines(records_to_samples(payload)))
+            elif frame_type == FRAME_AUDIO:
+                flush()
+                items.append(('audio', bytes(payload)))
+            continue
+
+        try:
+            data = backends.loads(message)
+        except backends.DecodeError:
+            flush()
+            items.append(('raw', message))
+            continue
+        try:
+            if 'sensorType' in data and 'values' in data and 'timestamp' in data:
+                sample = data
+            elif data.get('type') == 'sensor':
+                sample = data.get('data', {})
+            elif data.get('type') == 'audio':
+                flush()
+                items.append(('audio', base64.b64decode(data.get('data', ''))))
+                continue
+            else:
+                flush()
+                items.append(('unknown', data))
+                continue
+            record = sample_to_record(sample, receive_ns)
+        except Exception as e:
+            flush()
+            items.append(('error', f"Error processing message: {e}"))
+            continue
+        timings.append(('json', time.perf_counter() - started))
+        run.append(record)
+        if encode_lines:
+            lines.append(backends.dumps(sample) + '\n')
+    flush()
+    return items, timings
+
+
+class IngestPool:
+    """The executor decode_messages() runs on (none for the inline pool)"""
+
+    def __init__(self, kind=DEFAULT_POOL, workers=DEFAULT_WORKERS):
+        if kind not in POOLS:
+            raise ValueError(f"Unknown pool: {kind}")
+        self.kind = kind
+        self.workers = workers
+        self.executor = None
+        if kind == 'thread':
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+        elif kind == 'process':
+            # Spawned, not forked: the server already runs recorder threads
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+    async def start(self):
+        """Start the workers now rather than on the first messages"""
+        if self.kind == 'process':
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(self.executor, decode_messages, [])
+                                   for _ in range(self.workers)])
+
+    async def decode(self, messages, encode_lines=False, arrivals=None):
+        if self.executor is None:
+            result = decode_messages(messages, encode_lines, arrivals)
+            # Let other connections in between batches
+            await asyncio.sleep(0)
+            return result
+        return await asyncio.get_running_loop().run_in_executor(self.executor, decode_messages, messages, encode_lines,
+                                                          arrivals)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+class MessageQueue:
+    """Raw messages of one connection with their arrival times, waiting for its consumer"""
+
+    def __init__(self, limit=MAX_PENDING):
+        self.limit = limit
+        self.messages = []
+        self.arrivals = []
+        self.closed = False
+        self._ready = asyncio.Event()
+        self._room = asyncio.Event()
+
+    def put(self, message, arrival_ns):
+        self.messages.append(message)
+        self.arrivals.append(arrival_ns)
+        self._ready.set()
+
+    @property
+    def full(self):
+        return len(self.messages) >= self.limit
+
+    async def wait_for_room(self):
+        while self.full and not self.closed:
+            self._room.clear()
+            await self._room.wait()
+
+    def close(self):
+        """No more messages: the consumer gets what is queued, then None"""
+        self.closed = True
+        self._ready.set()
+        self._room.set()
+
+    async def get_batch(self, size=MAX_BATCH):
+        """(messages, arrival times) of up to `size` queued messages; None once closed and empty"""
+        while not self.messages:
+            if self.closed:
+                return None
+            self._ready.clear()
+            await self._ready.wait()
+        messages, self.messages = self.messages[:size], self.messages[size:]
+        arrivals, self.arrivals = self.arrivals[:size], self.arrivals[size:]
+        self._room.set()
+        return messages, arrivals
@@ -0,0 +1,125 @@
+import logging
+import logging.handlers
+import queue
+import time
+
+# Parent logger of all receiver components (sensor_stream.server, ...)
+LOGGER_NAME = 'sensor_stream'
+
+LOG_FORMAT = '%(asctime)s %(levelname)-7s %(name)s: %(message)s'
+
+# Seconds between aggregated throughput summaries
+SUMMARY_INTERVAL = 5.0
+
+
+def get_logger(component):
+    return logging.getLogger(f"{LOGGER_NAME}.{component}")
+
+
+class RateLimitFilter(logging.Filter):
+    """Let through at most one record per message template per interval.
+
+    Suppressed records are counted and the count is appended to the next
+    record of the same template that gets through, so floods of identical
+    errors (e.g. one per malformed message) cannot swamp the console.
+    """
+
+    def __init__(self, interval=5.0, min_level=logging.DEBUG):
+        super().__init__()
+        self.interval = interval
+        self.min_level = min_level
+        self._last = {}
+        self._suppressed = {}
+
+    def filter(self, record):
+        if record.levelno < self.min_level:
+            return True
+        key = (record.name, record.levelno, record.msg)
+        now = time.monotonic()
+        if now - self._last.get(key, -self.interval) < self.interval:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+            return False
+        self._last[key] = now
+        suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            record.msg = f"{record.msg} ({suppressed} similar messages suppressed)"
+        return True
+
+
+def setup_logging(level='INFO', use_queue=False, rate_limit=5.0):
+    """Configure receiver logging; returns a QueueListener to stop at shutdown, or None.
+
+    With use_queue=True records are only queued by the caller and formatted
+    and written on a background thread, so the event loop never blocks on
+    console I/O.
+    """
+    logger = logging.getLogger(LOGGER_NAME)
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    if rate_limit:
+        handler.addFilter(RateLimitFilter(rate_limit, min_level=logging.WARNING))
+
+    if not use_queue:
+        logger.addHandler(handler)
+        return None
+
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+class ThroughputSummary:
+    """Turn per-session sample counters into periodic samples/s summaries"""
+
+    def __init__(self, logger):
+        self.logger = logger
+        self._last_time = time.monotonic()
+        self._last_counts = {}
+
+    def report(self, sessions):
+        """Log samples/s per sensor per client since the previous report"""
+        now = time.monotonic()
+        elapsed = max(now - self._last_time, 1e-9)
+        self._last_time = now
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        counts = {}
+        lines = []
+        for session in sessions:
+            rates = []
+            for sensor, count in sorted(session.stats.samples.items()):
+                key = (session.device_id, sensor)
+                counts[key] = count
+                previous = self._last_counts.get(key, 0)
+                if count < previous:
+                    previous = 0  # The device reconnected with a fresh session
+                rates.append(f"{sensor} {(count - previous) / elapsed:.0f}/s")
+            key = (session.device_id, None)
+            counts[key] = session.stats.messages
+            previous = self._last_counts.get(key, 0)
+            if session.stats.messages < previous:
+                previous = 0
+            details = [f"{(session.stats.messages - previous) / elapsed:.0f} msg/s"]
+            if session.clock.offset_ns is not None:
+                details.append(f"clock offset {session.clock.offset_ns / 1e6:+.1f} ms")
+            if session.recorder.backlog:
+                details.append(f"writer backlog {session.recorder.backlog}")
+            shed = sum(session.recorder.shedder.dropped.values()) + sum(session.live.dropped.values())
+            if shed:
+                details.append(f"{shed} shed")
+            gaps = sum(session.stats.gaps.values())
+            if gaps:
+                details.append(f"{gaps} gaps")
+            lines.append(f"{session.device_id}: {', '.join(rates) or 'idle'} ({', '.join(details)})")
+        self._last_counts = counts
+
+        if lines:
+            self.logger.info("Throughput (%d clients) - %s", len(lines), '; '.join(lines))
@@ -0,0 +1,148 @@
+"""Server metrics in the Prometheus text format, served on a local HTTP endpoint.
+
+The hot path only increments plain counters and Histogram buckets; all
+formatting happens when somebody scrapes, through the collector callbacks
+registered with MetricsRegistry:
+
+    registry = MetricsRegistry()
+    registry.add_collector(lambda: [('sensor_stream_up', 'gauge', 'Server running', [({}, 1)])])
+    metrics_server = await serve_metrics(registry, '127.0.0.1', METRICS_PORT)
+
+    curl http://127.0.0.1:8083/metrics
+"""
+import asyncio
+from bisect import bisect_left
+
+from logging_utils import get_logger
+
+logger = get_logger('metrics')
+
+# Local only by default: the endpoint has no authentication
+METRICS_HOST = '127.0.0.1'
+METRICS_PORT = 8083
+
+# Bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+INTERVAL_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram:
+    """Histogram with fixed buckets: observe() is one bisect and two additions.
+
+    Each instance must be observed from one thread only; reads from other
+    threads (scrapes) may be a moment out of date but never fail.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # Last one: above the largest bucket
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None when empty)"""
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def merge(self, other):
+        """Add another histogram with the same buckets into this one"""
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+        return self
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(labels, extra=None):
+    items = {**labels, **(extra or {})}
+    if not items:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in items.items()) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Metric families produced on demand by collector callbacks.
+
+    A collector returns [(name, type, help, [(labels, value)])]: type is
+    'counter' or 'gauge' with numeric values, or 'histogram' with Histogram
+    values.
+    """
+
+    def __init__(self):
+        self.collectors = []
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def collect(self):
+        for collector in self.collectors:
+            try:
+                yield from collector()
+            except Exception as e:
+                logger.error("Metrics collector failed: %s", e)
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for name, kind, help_text, samples in self.collect():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if kind != 'histogram':
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(value.buckets + (float('inf'),), list(value.counts)):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_labels(labels, {'le': _number(bound)})} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(value.sum)}")
+                lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return '\n'.join(lines) + '\n'
+
+
+async def serve_metrics(registry, host=METRICS_HOST, port=METRICS_PORT):
+    """Serve GET /metrics on a minimal HTTP server; returns the asyncio server"""
+    async def handle(reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=5)
+            method, path = (request.split(b' ', 2) + [b'', b''])[:2]
+            if method == b'GET' and path.split(b'?')[0] in (b'/metrics', b'/'):
+                status, body = '200 OK', registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not found\n'
+            writer.write(f"HTTP/1.1 {status}\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                         f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
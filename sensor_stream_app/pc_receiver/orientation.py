@@ -0,0 +1,110 @@
+import numpy as np
+
+# Longest time step credited to a single gyro sample (seconds); longer gaps
+# in the stream are treated as pauses rather than integrated
+MAX_SAMPLE_DT = 0.1
+
+
+class GyroIntegrator:
+    """Integrate gyroscope samples one by one using their own timestamps.
+
+    A whole batch is integrated in a single vectorized step (trapezoidal rule
+    between consecutive samples), so the cost per frame does not depend on how
+    many samples are skipped, and none of them are.
+    """
+
+    def __init__(self, gain=1.0, max_dt=MAX_SAMPLE_DT):
+        self.gain = gain
+        self.max_dt = max_dt
+        self.last_timestamp = None
+        self.last_rate = None
+
+    def reset(self):
+        """Forget the previous sample (the next batch starts a new stream)"""
+        self.last_timestamp = None
+        self.last_rate = None
+
+    def integrate(self, timestamps, rates):
+        """Return the (x, y, z) angle change in radians for a batch of samples.
+
+        timestamps: N epoch seconds in arrival order
+        rates: N x 3 angular rates in rad/s
+        """
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        rates = np.asarray(rates, dtype=np.float64).reshape(-1, 3)
+        if len(timestamps) == 0:
+            return np.zeros(3)
+
+        if self.last_timestamp is None:
+            # Nothing to integrate against for the very first sample
+            previous_t, previous_rate = timestamps[0], rates[0]
+        else:
+            previous_t, previous_rate = self.last_timestamp, self.last_rate
+
+        dt = np.diff(timestamps, prepend=previous_t)
+        np.clip(dt, 0.0, self.max_dt, out=dt)
+        mean_rates = 0.5 * (rates + np.vstack([previous_rate, rates[:-1]]))
+
+        self.last_timestamp = timestamps[-1]
+        self.last_rate = rates[-1]
+        return self.gain * (dt @ mean_rates)
+
+
+def mapping_matrix(axis_mapping, axis_signs):
+    """Signed permutation matrix of the visualizer's axis swaps and flips.
+
+    Output axis j takes input component axis_mapping[j], times axis_signs[j].
+    """
+    M = np.zeros((3, 3))
+    for j, axis in enumerate('xyz'):
+        M[j, axis_mapping[axis]] = axis_signs[axis]
+    return M
+
+
+class AxisTransform:
+    """Orientation and axis mapping folded into one cached 3x3 matrix.
+
+    The composed matrix (mapping @ rotation) is only rebuilt when the
+    mapping or the orientation changes; `version` increases every time it
+    is, so callers can skip work when nothing moved.
+    """
+
+    def __init__(self, axis_mapping=None, axis_signs=None):
+        self.mapping = np.eye(3)
+        self.signs = np.ones(3)
+        self.rotation = np.eye(3)
+        self.matrix = np.eye(3)
+        self.version = 0
+        self._rotation_key = None
+        if axis_mapping is not None:
+            self.set_mapping(axis_mapping, axis_signs)
+
+    def _rebuild(self):
+        self.matrix = self.mapping @ self.rotation
+        self.version += 1
+
+    def set_mapping(self, axis_mapping, axis_signs):
+        self.mapping = mapping_matrix(axis_mapping, axis_signs)
+        self.signs = np.array([axis_signs['x'], axis_signs['y'], axis_signs['z']], dtype=np.float64)
+        self._rebuild()
+
+    def set_rotation(self, key, build):
+        """Use build() as the rotation, unless `key` (the angles or quaternion it comes from) is unchanged"""
+        if key == self._rotation_key:
+            return
+        self._rotation_key = key
+        self.rotation = build()
+        self._rebuild()
+
+    def invalidate(self):
+        """Force the next set_rotation to rebuild, e.g. after the model changed"""
+        self._rotation_key = None
+        self.version += 1
+
+    def apply(self, points):
+        """Rotate and axis-map N x 3 points in one matmul"""
+        return points @ self.matrix.T
+
+    def map_vectors(self, vectors):
+        """Axis-map N x 3 sensor vectors; like the visualizer always did, this only applies the sign flips"""
+        return vectors * self.signs
@@ -0,0 +1,138 @@
+"""Binary WebSocket wire protocol.
+
+Every binary frame starts with an 8 byte little-endian header:
+
+    magic   2s   b'SS'
+    version u8   PROTOCOL_VERSION
+    type    u8   FRAME_SENSOR_BATCH, ...
+    count   u32  number of records that follow
+
+A sensor batch is followed by `count` packed 21 byte records:
+
+    sensor     u8    sensor code (recording_format.SENSOR_CODES)
+    timestamp  i64   device time, microseconds since the epoch
+    x, y, z    f32
+
+An audio frame is followed by `count` bytes of raw 16-bit little-endian
+mono PCM at 44.1 kHz.
+
+Text frames keep using the original one-JSON-object-per-sample format.
+The server greets every phone with the HELLO text message, which names the
+binary protocol version it accepts; the app sends JSON until it gets it,
+so it keeps working with receivers that predate binary frames.
+"""
+import json
+import struct
+import numpy as np
+from recording_format import RECORD_DTYPE, SENSOR_CODES
+
+MAGIC = b'SS'
+PROTOCOL_VERSION = 1
+
+FRAME_SENSOR_BATCH = 1
+FRAME_AUDIO = 2
+
+# First message to every phone
+HELLO = json.dumps({'type': 'hello', 'binary': PROTOCOL_VERSION})
+
+HEADER = struct.Struct('<2sBBI')
+HEADER_SIZE = HEADER.size
+
+WIRE_RECORD_DTYPE = np.dtype([
+    ('sensor', 'u1'),
+    ('timestamp', '<i8'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+])
+
+
+class ProtocolError(ValueError):
+    """A binary frame that cannot be decoded"""
+
+
+def is_binary_frame(message):
+    """True if a WebSocket message is a frame of this protocol"""
+    return isinstance(message, (bytes, bytearray, memoryview)) and bytes(message[:2]) == MAGIC
+
+
+def decode_frame(message):
+    """Decode a binary frame into (frame_type, payload).
+
+    For sensor batches the payload is a read-only WIRE_RECORD_DTYPE array
+    viewing the message buffer (no copy, no per-record parsing); for audio
+    frames it is a memoryview of the PCM bytes.
+    """
+    if len(message) < HEADER_SIZE:
+        raise ProtocolError("Frame shorter than its header")
+    magic, version, frame_type, count = HEADER.unpack_from(message)
+    if magic != MAGIC:
+        raise ProtocolError("Bad frame magic")
+    if version != PROTOCOL_VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+
+    if frame_type == FRAME_SENSOR_BATCH:
+        expected = HEADER_SIZE + count * WIRE_RECORD_DTYPE.itemsize
+        if len(message) != expected:
+            raise ProtocolError(f"Sensor batch of {count} records should be {expected} bytes, got {len(message)}")
+        return frame_type, np.frombuffer(message, dtype=WIRE_RECORD_DTYPE, count=count, offset=HEADER_SIZE)
+    if frame_type == FRAME_AUDIO:
+        if len(message) != HEADER_SIZE + count:
+            raise ProtocolError(f"Audio frame of {count} bytes has {len(message) - HEADER_SIZE}")
+        return frame_type, memoryview(message)[HEADER_SIZE:]
+    raise ProtocolError(f"Unknown frame type {frame_type}")
+
+
+def wire_to_records(wire):
+    """Convert wire records to recording_format.RECORD_DTYPE (receive_ns left 0)"""
+    records = np.empty(len(wire), dtype=RECORD_DTYPE)
+    records['timestamp'] = wire['timestamp'] / 1e6
+    records['device_ns'] = wire['timestamp'] * 1000
+    records['receive_ns'] = 0
+    records['sensor'] = wire['sensor']
+    records['x'] = wire['x']
+    records['y'] = wire['y']
+    records['z'] = wire['z']
+    return records
+
+
+def records_to_frame(records):
+    """Encode recording_format.RECORD_DTYPE records as a sensor batch frame"""
+    wire = np.empty(len(records), dtype=WIRE_RECORD_DTYPE)
+    wire['sensor'] = records['sensor']
+    wire['timestamp'] = np.round(records['timestamp'] * 1e6)
+    wire['x'] = records['x']
+    wire['y'] = records['y']
+    wire['z'] = records['z']
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, FRAME_SENSOR_BATCH, len(records)) + wire.tobytes()
+
+
+def encode_sensor_batch(sensors, timestamps_us, values):
+    """Reference encoder: build a sensor batch frame.
+
+    sensors: N sensor names or codes; timestamps_us: N ints (microseconds
+    since the epoch); values: N x 3 floats.
+    """
+    count = len(timestamps_us)
+    wire = np.empty(count, dtype=WIRE_RECORD_DTYPE)
+    wire['sensor'] = [SENSOR_CODES.get(s, 0) if isinstance(s, str) else s for s in sensors]
+    wire['timestamp'] = timestamps_us
+    values = np.asarray(values, dtype=np.float32).reshape(count, 3)
+    wire['x'] = values[:, 0]
+    wire['y'] = values[:, 1]
+    wire['z'] = values[:, 2]
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, FRAME_SENSOR_BATCH, count) + wire.tobytes()
+
+
+def encode_audio(pcm):
+    """Reference encoder: build an audio frame from raw PCM bytes"""
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, FRAME_AUDIO, len(pcm)) + bytes(pcm)
+
+
+def encode_samples(samples):
+    """Reference encoder for Flutter-style sample dicts (timestamps in ms)"""
+    return encode_sensor_batch(
+        [sample['sensorType'] for sample in samples],
+        [int(sample['timestamp']) * 1000 for sample in samples],
+        [[sample['values'].get(axis, 0) for axis in 'xyz'] for sample in samples],
+    )
@@ -0,0 +1,348 @@
+import queue
+import threading
+import time
+import datetime
+import wave
+from pathlib import Path
+import backends
+from recording_format import BinaryRecordingWriter, records_to_samples, pack_records
+from recording_index import RecordingIndex
+from logging_utils import get_logger
+from metrics import Histogram, INTERVAL_BUCKETS
+from backpressure import LoadShedder, RECORD_CAPACITY, RECORD_POLICIES, DROP_OLDEST
+
+logger = get_logger('recorder')
+
+# Flush policy: write out buffered lines once this many bytes are pending...
+FLUSH_BYTES = 64 * 1024
+# ...or once the oldest pending line is this old (seconds)
+FLUSH_INTERVAL = 0.5
+
+# Audio is 16-bit mono PCM at 44.1 kHz (see protocol.py)
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_CHANNELS = 1
+AUDIO_SAMPLE_WIDTH = 2
+# Write buffer of the WAV file: PCM is only handed to the OS once this much is pending
+AUDIO_BUFFER_BYTES = 256 * 1024
+
+# The clock log keeps one (receive, device) time pair per interval (seconds)
+CLOCK_LOG_INTERVAL = 1.0
+
+CLOCK_LOG_HEADER = 'receive_ns,device_ns,offset_ns\n'
+
+# Sentinel telling the writer thread to drain and exit
+_STOP = object()
+
+class SensorRecorder:
+    """Record sensor samples to one file per session.
+
+    Samples are handed over through an in-memory queue and serialized and
+    written by a background thread, so the caller never waits on disk.
+    With format='json' the session is a JSON-lines file; with
+    format='binary' it is a set of per-sensor files (see recording_format.py).
+    A device_id, if given, is appended to the file name. With index=True
+    every batch written is also added to the directory's RecordingIndex.
+
+    At most `capacity` samples wait for the writer; beyond that, samples are
+    shed per sensor according to `policies` (see backpressure.py). Sensors
+    with the block policy are always queued: the caller should wait while
+    over_capacity.
+    """
+
+    def __init__(self, recordings_dir, prefix='sensor_data', format='json', device_id=None,
+                 flush_bytes=FLUSH_BYTES, flush_interval=FLUSH_INTERVAL, index=False,
+                 capacity=RECORD_CAPACITY, policies=RECORD_POLICIES):
+        if format not in ('json', 'binary'):
+            raise ValueError(f"Unknown recording format: {format}")
+        if DROP_OLDEST in policies.values():
+            raise ValueError("Recording cannot drop its oldest samples, they are already queued")
+        self.recordings_dir = Path(recordings_dir)
+        self.prefix = prefix
+        self.format = format
+        self.device_id = device_id
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.use_index = index
+
+        self.path = None
+        self.index = None
+        self.file = None
+        self.samples_written = 0
+
+        # Metrics: samples queued (event loop), dropped on write errors, and
+        # per batch the write duration and how long its oldest sample waited (writer thread)
+        self.samples_queued = 0
+        self.samples_dropped = 0
+        self.write_seconds = Histogram()
+        self.write_lag = Histogram(INTERVAL_BUCKETS)
+        self.shedder = LoadShedder(capacity, policies)
+
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+
+    def start(self):
+        """Start the background writer thread"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='SensorRecorder', daemon=True)
+        self._thread.start()
+
+    def write_records(self, records, lines=None):
+        """Queue a record array (recording_format.RECORD_DTYPE) for recording (never blocks).
+
+        lines: the records already serialized as JSON lines (format='json'),
+        so the writer thread does not have to. Returns the number of samples shed.
+        """
+        if self._thread is None:
+            self.start()
+        kept = self.shedder.admit_records(records, self.backlog)
+        if len(kept):
+            self.samples_queued += len(kept)
+            # Lines of shed samples cannot be picked out; the kept records get re-serialized
+            if lines is not None and self.format == 'json' and len(kept) == len(records):
+                self._queue.put((lines, kept))
+            else:
+                self._queue.put(kept)
+        return len(records) - len(kept)
+
+    @property
+    def queue_depth(self):
+        """Batches waiting for the writer thread"""
+        return self._queue.qsize()
+
+    @property
+    def backlog(self):
+        """Samples queued but not yet written (or dropped)"""
+        return self.samples_queued - self.samples_written - self.samples_dropped
+
+    @property
+    def over_capacity(self):
+        """More samples waiting than `capacity` (only never-drop sensors get past it)"""
+        return self.backlog > self.shedder.capacity
+
+    def close(self):
+        """Flush everything still queued and close the session file"""
+        if self._thread is None:
+            return
+        self._queue.put(_STOP)
+        self._thread.join()
+        self._thread = None
+
+    def _open(self):
+        """Open the session file, named after the time of the first sample"""
+        self.recordings_dir.mkdir(exist_ok=True)
+        name = f"{self.prefix}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if self.device_id:
+            name += f"_{self.device_id}"
+        self.path = self.recordings_dir / name
+        if self.format == 'binary':
+            self.file = BinaryRecordingWriter(self.path)
+        else:
+            self.path = self.recordings_dir / f"{name}.json"
+            self.file = open(self.path, 'ab')
+        if self.use_index and self.index is None:
+            # Opened on the writer thread, which is the only one using it
+            self.index = RecordingIndex(self.recordings_dir)
+
+    def _write(self, pending):
+        """Write a batch of pending items to the session file"""
+        if self.file is None:
+            self._open()
+        if self.format == 'binary':
+            written = self.file.write_records(pack_records(pending))
+            self.file.flush()
+            chunks = [(path, offset, records.nbytes, records) for path, offset, records in written]
+        else:
+            data = ''.join(line for line, _ in pending).encode()
+            offset = self.file.tell()
+            self.file.write(data)
+            self.file.flush()
+            chunks = []
+            if self.index is not None:
+                chunks.append((self.path, offset, len(data), pack_records([record for _, record in pending])))
+
+        if self.index is not None:
+            try:
+                for path, offset, length, records in chunks:
+                    self.index.add_chunk(path, offset, length, records)
+            except Exception as e:
+                logger.error("Error indexing sensor recording: %s", e)
+
+    def _encode(self, item):
+        """Prepare a queued record array or (lines, records) for writing: (data, bytes, samples)"""
+        if isinstance(item, tuple):
+            lines, records = item
+            return (lines, records), len(lines), len(records)
+        if self.format == 'binary':
+            return item, item.nbytes, len(item)
+        # JSON lines keep their records alongside, for the index
+        lines = ''.join(backends.dumps(sample) + '\n' for sample in records_to_samples(item))
+        return (lines, item), len(lines), len(item)
+
+    def _run(self):
+        """Writer thread: batch queued samples and flush by size or age"""
+        pending = []
+        pending_bytes = 0
+        pending_samples = 0
+        first_pending = None
+        running = True
+
+        while running:
+            # Wait for the next sample, but wake up in time to honour the flush interval
+            timeout = None
+            if pending:
+                timeout = max(0.0, self.flush_interval - (time.monotonic() - first_pending))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            # Drain whatever else is already queued in one go
+            while item is not None:
+                if item is _STOP:
+                    running = False
+                    break
+                item, size, count = self._encode(item)
+                if not pending:
+                    first_pending = time.monotonic()
+                pending.append(item)
+                pending_bytes += size
+                pending_samples += count
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    item = None
+
+            if not pending:
+                continue
+            if (not running or pending_bytes >= self.flush_bytes
+                    or time.monotonic() - first_pending >= self.flush_interval):
+                started = time.monotonic()
+                try:
+                    self._write(pending)
+                    self.samples_written += pending_samples
+                except Exception as e:
+                    self.samples_dropped += pending_samples
+                    logger.error("Error writing sensor recording: %s", e)
+                self.write_seconds.observe(time.monotonic() - started)
+                self.write_lag.observe(started - first_pending)
+                pending = []
+                pending_bytes = 0
+                pending_samples = 0
+
+        if self.file:
+            self.file.close()
+            self.file = None
+        if self.index:
+            self.index.close()
+            self.index = None
+
+
+class AudioRecorder:
+    """Record a session's audio stream into one continuously growing WAV file.
+
+    PCM chunks go through a large write buffer without per-chunk flushing
+    or header updates; the RIFF/data sizes are patched once, on close.
+    """
+
+    def __init__(self, recordings_dir, prefix='audio', device_id=None,
+                 sample_rate=AUDIO_SAMPLE_RATE, channels=AUDIO_CHANNELS,
+                 sample_width=AUDIO_SAMPLE_WIDTH, buffer_bytes=AUDIO_BUFFER_BYTES):
+        self.recordings_dir = Path(recordings_dir)
+        self.prefix = prefix
+        self.device_id = device_id
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_width = sample_width
+        self.buffer_bytes = buffer_bytes
+
+        self.path = None
+        self.bytes_written = 0
+        self._file = None
+        self._wav = None
+
+    def _open(self):
+        """Open the WAV file, named after the time of the first chunk"""
+        self.recordings_dir.mkdir(exist_ok=True)
+        name = f"{self.prefix}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        if self.device_id:
+            name += f"_{self.device_id}"
+        self.path = self.recordings_dir / f"{name}.wav"
+        self._file = open(self.path, 'wb', buffering=self.buffer_bytes)
+        self._wav = wave.open(self._file, 'wb')
+        self._wav.setnchannels(self.channels)
+        self._wav.setsampwidth(self.sample_width)
+        self._wav.setframerate(self.sample_rate)
+
+    def write(self, pcm):
+        """Append a chunk of raw PCM (bytes-like)"""
+        if self._wav is None:
+            self._open()
+        # writeframesraw neither flushes nor rewrites the header, unlike writeframes
+        self._wav.writeframesraw(pcm)
+        self.bytes_written += len(pcm)
+
+    def close(self):
+        """Patch the WAV header with the final length and close the file"""
+        if self._wav is None:
+            return
+        try:
+            self._wav.close()
+        finally:
+            self._file.close()
+            self._wav = None
+            self._file = None
+
+
+class ClockLog:
+    """Keep a session's clock sync points in clock_<time>_<device>.csv.
+
+    Of the (receive, device) time pairs seen in each interval only the one
+    with the smallest transport delay is written, with the offset estimated
+    at that point: enough to map the recording's device times onto this
+    PC's clock afterwards (timestamps.ClockOffsetEstimator).
+    """
+
+    def __init__(self, recordings_dir, prefix='clock', device_id=None, interval=CLOCK_LOG_INTERVAL):
+        self.recordings_dir = Path(recordings_dir)
+        self.prefix = prefix
+        self.device_id = device_id
+        self.interval_ns = int(interval * 1e9)
+        self.path = None
+        self.file = None
+        self.best = None
+        self.interval_start = None
+
+    def add(self, device_ns, receive_ns, offset_ns):
+        """Consider one pair; writes out the best pair of the interval once it is over"""
+        if self.interval_start is None:
+            self.interval_start = receive_ns
+        if self.best is None or receive_ns - device_ns < self.best[0] - self.best[1]:
+            self.best = (receive_ns, device_ns, offset_ns)
+        if receive_ns - self.interval_start >= self.interval_ns:
+            self._write_best()
+            self.interval_start = receive_ns
+
+    def _write_best(self):
+        if self.best is None:
+            return
+        if self.file is None:
+            self.recordings_dir.mkdir(exist_ok=True)
+            name = f"{self.prefix}_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            if self.device_id:
+                name += f"_{self.device_id}"
+            self.path = self.recordings_dir / f"{name}.csv"
+            # Line buffered: at most one small write per interval
+            self.file = open(self.path, 'a', buffering=1)
+            self.file.write(CLOCK_LOG_HEADER)
+        self.file.write('%d,%d,%d\n' % self.best)
+        self.best = None
+
+    def close(self):
+        """Write the last pair and close the file"""
+        try:
+            self._write_best()
+        finally:
+            if self.file:
+                self.file.close()
+                self.file = None
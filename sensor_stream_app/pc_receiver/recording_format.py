@@ -0,0 +1,413 @@
+"""Compact binary recording format for sensor data.
+
+Each sensor of a recording gets its own append-only file
+``<name>.<sensor>.bin``: a 16 byte header followed by fixed-width records
+(float64 timestamp in epoch seconds, uint32 sensor code, three float32
+values, then the exact device time and this PC's receive time as int64
+epoch nanoseconds; receive time is 0 where it is unknown). The files can
+be memory-mapped straight into NumPy structured arrays, so reading them
+needs no parsing at all. Version 1 files (without the nanosecond fields)
+are still read.
+
+Convert legacy JSON-lines recordings with:
+
+    python recording_format.py convert recordings/ -o recordings/converted
+"""
+import argparse
+import datetime
+import re
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+import backends
+from timestamps import NS_PER_US, iso_to_epoch_ns, ns_to_seconds, to_epoch_ns
+
+MAGIC = b'SSRB'
+VERSION = 2
+
+# Header: magic, version, sensor code, record size, reserved
+HEADER = struct.Struct('<4sHHII')
+HEADER_SIZE = HEADER.size
+
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('sensor', '<u4'),
+    ('x', '<f4'),
+    ('y', '<f4'),
+    ('z', '<f4'),
+    ('device_ns', '<i8'),
+    ('receive_ns', '<i8'),
+])
+RECORD_SIZE = RECORD_DTYPE.itemsize
+
+# Records of version 1 files: no device_ns / receive_ns
+RECORD_DTYPE_V1 = np.dtype(RECORD_DTYPE.descr[:5])
+RECORD_DTYPES = {1: RECORD_DTYPE_V1, VERSION: RECORD_DTYPE}
+
+SENSOR_CODES = {
+    'unknown': 0,
+    'accelerometer': 1,
+    'gyroscope': 2,
+    'magnetometer': 3,
+}
+SENSOR_NAMES = {code: name for name, code in SENSOR_CODES.items()}
+
+FILE_SUFFIX = '.bin'
+
+# One JSON line exactly as the server writes it (the phone's sample dict
+# serialized by json, or without spaces by orjson/msgspec); parse_jsonl
+# converts runs of these without parsing JSON (numbers are matched loosely
+# and validated by the float conversion). The app and the simulator send
+# timestamp before values, older recordings have values first; a match has
+# 11 groups: sensor, then x, y, z, timestamp (number, string) for the older
+# order, then timestamp (number, string), x, y, z for the app's
+_NUMBER = rb'([-+.\deE]+)'
+_VALUES = rb'"values": ?\{"x": ?' + _NUMBER + rb', ?"y": ?' + _NUMBER + rb', ?"z": ?' + _NUMBER + rb'\}'
+_TIMESTAMP = rb'"timestamp": ?(?:' + _NUMBER + rb'|"([^"\\]*)")'
+_SAMPLE_LINE = re.compile(
+    rb'^\{"sensorType": ?"(\w*)", ?(?:' + _VALUES + rb', ?' + _TIMESTAMP + rb'|' + _TIMESTAMP + rb', ?' + _VALUES
+    + rb')\}\r?$', re.M)
+
+
+def to_epoch_seconds(timestamp, default=None):
+    """Convert a sample timestamp (ISO string or epoch ms/s number) to epoch seconds"""
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        # The phone sends millisecondsSinceEpoch
+        return timestamp / 1000.0 if timestamp > 1e11 else float(timestamp)
+    if isinstance(timestamp, str) and timestamp:
+        ns = to_epoch_ns(timestamp, default=False)
+        if ns is not False:
+            return ns_to_seconds(ns)
+    return default if default is not None else datetime.datetime.now().timestamp()
+
+
+def sample_to_record(sample, receive_ns=0):
+    """Convert a sample dict ({sensorType, values, timestamp}) to a record tuple"""
+    values = sample.get('values', {})
+    timestamp = sample.get('timestamp')
+    device_ns = to_epoch_ns(timestamp)
+    if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+        seconds = to_epoch_seconds(timestamp)
+    else:
+        seconds = ns_to_seconds(device_ns)
+    return (
+        seconds,
+        SENSOR_CODES.get(sample.get('sensorType'), 0),
+        values.get('x', 0), values.get('y', 0), values.get('z', 0),
+        device_ns, receive_ns,
+    )
+
+
+def upgrade_records(records):
+    """Convert version 1 records to RECORD_DTYPE (device_ns from the timestamps, receive_ns 0)"""
+    upgraded = np.zeros(len(records), dtype=RECORD_DTYPE)
+    for name in RECORD_DTYPE_V1.names:
+        upgraded[name] = records[name]
+    upgraded['device_ns'] = np.round(records['timestamp'] * 1e6).astype(np.int64) * NS_PER_US
+    return upgraded
+
+
+def records_to_samples(records):
+    """Unpack a record array into Flutter-style sample dicts (timestamps in epoch ms)"""
+    return [
+        {'sensorType': SENSOR_NAMES.get(code, 'unknown'),
+         'values': {'x': x, 'y': y, 'z': z},
+         'timestamp': timestamp * 1000.0}
+        for timestamp, code, x, y, z, *_ in records.tolist()
+    ]
+
+
+def pack_records(items):
+    """Build one record array from a mix of record tuples and record arrays, keeping order"""
+    chunks = []
+    run = []
+    for item in items:
+        if isinstance(item, tuple):
+            run.append(item)
+            continue
+        if run:
+            chunks.append(np.array(run, dtype=RECORD_DTYPE))
+            run = []
+        chunks.append(item)
+    if run:
+        chunks.append(np.array(run, dtype=RECORD_DTYPE))
+    if not chunks:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    return chunks[0] if len(chunks) == 1 else np.concatenate(chunks)
+
+
+def _fields_to_records(fields):
+    """Convert _SAMPLE_LINE matches to a record array (ValueError if a number is malformed)"""
+    fields = np.array(fields, dtype=bytes).reshape(-1, 11)
+    # sensor, x, y, z, timestamp number, timestamp string whichever the key order
+    app_order = fields[:, 1] == b''
+    fields = np.where(app_order[:, None], fields[:, [0, 8, 9, 10, 6, 7]], fields[:, :6])
+    records = np.empty(len(fields), dtype=RECORD_DTYPE)
+    names, inverse = np.unique(fields[:, 0], return_inverse=True)
+    codes = np.array([SENSOR_CODES.get(name.decode(), 0) for name in names], dtype=np.uint32)
+    records['sensor'] = codes[inverse.ravel()]
+    for i, axis in enumerate('xyz'):
+        records[axis] = fields[:, i + 1].astype(np.float64)
+
+    numeric = fields[:, 4] != b''
+    timestamps = np.empty(len(fields), dtype=np.float64)
+    device_ns = np.empty(len(fields), dtype=np.int64)
+    if numeric.any():
+        values = fields[numeric, 4].astype(np.float64)
+        # The phone sends millisecondsSinceEpoch; to the microsecond like to_epoch_ns
+        ms = values > 1e11
+        timestamps[numeric] = np.where(ms, values / 1000.0, values)
+        device_ns[numeric] = np.round(np.where(ms, values * 1e3, values * 1e6)).astype(np.int64) * NS_PER_US
+    if not numeric.all():
+        device_ns[~numeric] = iso_to_epoch_ns(fields[~numeric, 5])
+        timestamps[~numeric] = ns_to_seconds(device_ns[~numeric])
+    records['timestamp'] = timestamps
+    records['device_ns'] = device_ns
+    records['receive_ns'] = 0
+    return records
+
+
+def _line_to_record(line):
+    """Record tuple of one JSON line, or None if the line is not a sample.
+
+    Samples are told apart like ingest_pool.decode_messages does: a sample
+    dict, or a {"type": "sensor", "data": sample} message.
+    """
+    try:
+        data = backends.loads(line)
+    except backends.DecodeError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    if not ('sensorType' in data and 'values' in data and 'timestamp' in data):
+        if data.get('type') != 'sensor':
+            return None
+        data = data.get('data')
+    try:
+        return sample_to_record(data)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def _parse_lines(lines):
+    """Line-by-line parse_jsonl for input that is not purely in the server's format"""
+    fast, fast_at, slow, slow_at = [], [], [], []
+    for i, line in enumerate(lines):
+        match = _SAMPLE_LINE.match(line)
+        if match:
+            fast.append(match.groups())
+            fast_at.append(i)
+            continue
+        record = _line_to_record(line)
+        if record is not None:
+            slow.append(record)
+            slow_at.append(i)
+
+    parts = []
+    if fast:
+        try:
+            parts.append(_fields_to_records(fast))
+        except ValueError:
+            # Find the lines whose numbers the regex let through; only those take the slow path
+            kept_at = []
+            for fields, i in zip(fast, fast_at):
+                try:
+                    parts.append(_fields_to_records([fields]))
+                    kept_at.append(i)
+                except ValueError:
+                    record = _line_to_record(lines[i])
+                    if record is not None:
+                        slow.append(record)
+                        slow_at.append(i)
+            fast_at = kept_at
+    parts.append(np.array(slow, dtype=RECORD_DTYPE))
+    records = np.concatenate(parts)
+    return records[np.argsort(np.array(fast_at + slow_at, dtype=np.int64), kind='stable')]
+
+
+def parse_jsonl(data):
+    """Parse JSON-lines bytes into a record array, skipping malformed lines.
+
+    Lines in the server's own format are converted with one regex pass and
+    NumPy; anything else goes through backends.loads and sample_to_record,
+    and lines that are not samples are skipped.
+    """
+    fields = _SAMPLE_LINE.findall(data)
+    lines = data.count(b'\n') + (not data.endswith(b'\n'))
+    if data and len(fields) == lines:
+        try:
+            return _fields_to_records(fields)
+        except ValueError:
+            pass
+    return _parse_lines(data.splitlines())
+
+
+def sensor_file_path(base_path, sensor_type):
+    """Path of the per-sensor file for a recording base path"""
+    base_path = Path(base_path)
+    return base_path.with_name(f"{base_path.name}.{sensor_type}{FILE_SUFFIX}")
+
+
+class BinaryRecordingWriter:
+    """Append records to the per-sensor files of one recording"""
+
+    def __init__(self, base_path):
+        self.base_path = Path(base_path)
+        self.files = {}
+        self.paths = {}
+
+    def _file_for(self, code):
+        """Open (creating with a header if needed) the file for a sensor code"""
+        f = self.files.get(code)
+        if f is None:
+            path = sensor_file_path(self.base_path, SENSOR_NAMES.get(code, 'unknown'))
+            path.parent.mkdir(parents=True, exist_ok=True)
+            f = open(path, 'ab')
+            if f.tell() == 0:
+                f.write(HEADER.pack(MAGIC, VERSION, code, RECORD_SIZE, 0))
+            elif read_header(path)[1] != RECORD_DTYPE:
+                f.close()
+                raise ValueError(f"{path}: cannot append to an older recording version")
+            self.files[code] = f
+            self.paths[code] = path
+        return f
+
+    def write_records(self, records):
+        """Append a record array, splitting it by sensor code.
+
+        Returns [(path, offset, records)] for each per-sensor file written to.
+        """
+        codes = records['sensor']
+        written = []
+        for code in np.unique(codes):
+            f = self._file_for(int(code))
+            selected = records[codes == code]
+            written.append((self.paths[int(code)], f.tell(), selected))
+            f.write(selected.tobytes())
+        return written
+
+    def flush(self):
+        for f in self.files.values():
+            f.flush()
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        self.paths = {}
+
+
+def read_header(path):
+    """Read and validate the header of a per-sensor file, returning (sensor code, record dtype)"""
+    with open(path, 'rb') as f:
+        raw = f.read(HEADER_SIZE)
+    if len(raw) < HEADER_SIZE:
+        raise ValueError(f"{path}: file too short for a recording header")
+    magic, version, code, record_size, _ = HEADER.unpack(raw)
+    if magic != MAGIC:
+        raise ValueError(f"{path}: not a binary sensor recording")
+    dtype = RECORD_DTYPES.get(version)
+    if dtype is None or record_size != dtype.itemsize:
+        raise ValueError(f"{path}: unsupported recording version {version}")
+    return code, dtype
+
+
+def open_records(path):
+    """Memory-map a per-sensor file as a read-only structured array (version 1 files are converted)"""
+    _, dtype = read_header(path)
+    count = (Path(path).stat().st_size - HEADER_SIZE) // dtype.itemsize
+    if count == 0:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    records = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE, shape=(count,))
+    return records if dtype == RECORD_DTYPE else upgrade_records(records)
+
+
+def read_records(path, offset, length):
+    """Read the records in `length` bytes from byte `offset` of a per-sensor file, as RECORD_DTYPE"""
+    _, dtype = read_header(path)
+    records = np.fromfile(path, dtype=dtype, count=length // dtype.itemsize, offset=offset)
+    return records if dtype == RECORD_DTYPE else upgrade_records(records)
+
+
+def read_recording(base_path):
+    """Return {sensor_type: records} for every sensor file of a recording"""
+    base_path = Path(base_path)
+    recording = {}
+    for path in sorted(base_path.parent.glob(f"{base_path.name}.*{FILE_SUFFIX}")):
+        sensor_type = path.name[len(base_path.name) + 1:-len(FILE_SUFFIX)]
+        recording[sensor_type] = open_records(path)
+    return recording
+
+
+def iter_recordings(directory):
+    """Yield (base_path, sensor_type, records) for every binary recording in a directory"""
+    for path in sorted(Path(directory).glob(f"*{FILE_SUFFIX}")):
+        base_name, sensor_type = path.name[:-len(FILE_SUFFIX)].rsplit('.', 1)
+        yield path.with_name(base_name), sensor_type, open_records(path)
+
+
+def read_jsonl(path):
+    """Parse a legacy JSON-lines recording into a record array"""
+    with open(path, 'rb') as f:
+        return parse_jsonl(f.read())
+
+
+def convert_jsonl(paths, base_path):
+    """Convert legacy JSON-lines files (in order) into one binary recording"""
+    writer = BinaryRecordingWriter(base_path)
+    total = 0
+    try:
+        for path in paths:
+            records = read_jsonl(path)
+            writer.write_records(records)
+            total += len(records)
+    finally:
+        writer.close()
+    return total
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Binary sensor recording tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert = subparsers.add_parser('convert', help="Convert legacy sensor_data_*.json recordings")
+    convert.add_argument('inputs', nargs='+', help="JSON-lines files or directories containing them")
+    convert.add_argument('-o', '--output', default='recordings/converted',
+                         help="Output directory (default: recordings/converted)")
+    convert.add_argument('--name', default=None,
+                         help="Recording name (default: name of the first input file)")
+
+    info = subparsers.add_parser('info', help="Show the contents of binary recordings")
+    info.add_argument('directory', help="Directory containing .bin recordings")
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'convert':
+        paths = []
+        for item in args.inputs:
+            item = Path(item)
+            if item.is_dir():
+                paths.extend(sorted(item.glob('sensor_data_*.json')))
+            else:
+                paths.append(item)
+        if not paths:
+            print("No JSON recordings found")
+            return 1
+        name = args.name or paths[0].stem
+        base_path = Path(args.output) / name
+        total = convert_jsonl(paths, base_path)
+        print(f"Converted {len(paths)} files ({total} samples) into {base_path}.*{FILE_SUFFIX}")
+    elif args.command == 'info':
+        for base_path, sensor_type, records in iter_recordings(args.directory):
+            span = ''
+            if len(records):
+                span = f", {records['timestamp'][0]:.3f} .. {records['timestamp'][-1]:.3f}"
+            print(f"{base_path.name} {sensor_type}: {len(records)} samples{span}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
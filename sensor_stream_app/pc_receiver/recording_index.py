@@ -0,0 +1,323 @@
+"""Persistent index of the recordings directory, and time-range queries over it.
+
+The index is a SQLite database (recordings/index.sqlite) listing, for every
+recording file, chunks of it: byte offset and length, and per sensor the
+sample count and time span. The recorder adds a chunk for every batch it
+writes; update() indexes whatever else is in the directory (older or
+converted recordings), starting where the index left off in each file.
+Session archives (session_archive.py) are indexed one chunk per compressed
+block, so a session stays queryable after it has been compacted.
+
+query() then reads only the chunks that overlap the requested time range:
+
+    index = RecordingIndex('recordings')
+    data = index.query(start, end, sensors=['gyroscope'])
+    data['gyroscope']['x']
+
+Or from the command line:
+
+    python recording_index.py update recordings
+    python recording_index.py query recordings --start 2024-05-01T14:00 --end 2024-05-01T14:10
+"""
+import argparse
+import datetime
+import re
+import sqlite3
+import sys
+from pathlib import Path
+
+import numpy as np
+
+from recording_format import (HEADER_SIZE, RECORD_DTYPE, SENSOR_NAMES, FILE_SUFFIX, read_header, read_records,
+                              parse_jsonl)
+from session_archive import ARCHIVE_SUFFIX, HEADER as ARCHIVE_HEADER, SessionArchive
+
+INDEX_NAME = 'index.sqlite'
+
+# Legacy/JSON recordings picked up by update() (other .json files are not recordings)
+JSON_PATTERN = 'sensor_data_*.json'
+
+# Size of the chunks update() splits files into: bytes of JSON lines, or binary records
+SCAN_BYTES = 1024 * 1024
+SCAN_RECORDS = 64 * 1024
+
+# <prefix>_<YYYYmmdd_HHMMSS>[_<device>].json, .<sensor>.bin or .ssa
+RECORDING_NAME = re.compile(r'_(\d{8}_\d{6})(?:_([A-Za-z0-9_-]+?))?(?:\.json|\.[a-z]+\.bin|\.ssa)$')
+
+# files.format of each recording suffix, and where its first chunk starts
+FORMATS = {
+    '.json': ('json', 0),
+    FILE_SUFFIX: ('binary', HEADER_SIZE),
+    ARCHIVE_SUFFIX: ('archive', ARCHIVE_HEADER.size),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    format TEXT NOT NULL,
+    device TEXT,
+    indexed_bytes INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    path TEXT NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    sensor TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    t_start REAL NOT NULL,
+    t_end REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunks_by_time ON chunks (t_start, t_end);
+CREATE INDEX IF NOT EXISTS chunks_by_path ON chunks (path);
+"""
+
+
+def to_timestamp(value):
+    """Epoch seconds from a datetime, an ISO string or a number (None passes through)"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value)
+    return value.timestamp()
+
+
+class RecordingIndex:
+    """SQLite index of the recordings in one directory.
+
+    A connection belongs to the thread that created it, so every writer
+    thread opens its own RecordingIndex on the same directory.
+    """
+
+    def __init__(self, directory, name=INDEX_NAME):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.directory / name, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # No fsync per batch; after a crash update() re-indexes whatever was lost
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def add_chunk(self, path, offset, length, records):
+        """Index `length` bytes written at `offset` of a recording file, holding `records`.
+
+        Chunks must arrive in file order; a chunk that is already indexed
+        (or would leave a gap) is ignored and False is returned.
+        """
+        path = Path(path)
+        name = path.name
+        with self.db:
+            row = self.db.execute('SELECT indexed_bytes FROM files WHERE path = ?', (name,)).fetchone()
+            if row is None:
+                file_format, indexed = FORMATS[path.suffix]
+                match = RECORDING_NAME.search(name)
+                self.db.execute('INSERT INTO files VALUES (?, ?, ?, ?)', (
+                    name, file_format, match.group(2) if match else None, indexed))
+            else:
+                indexed = row[0]
+            if offset != indexed:
+                return False
+
+            codes = records['sensor']
+            rows = []
+            for code in np.unique(codes):
+                timestamps = records['timestamp'][codes == code]
+                rows.append((name, offset, length, SENSOR_NAMES.get(int(code), 'unknown'),
+                             len(timestamps), float(timestamps.min()), float(timestamps.max())))
+            self.db.executemany('INSERT INTO chunks VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+            self.db.execute('UPDATE files SET indexed_bytes = ? WHERE path = ?', (offset + length, name))
+        return True
+
+    def _forget(self, name):
+        with self.db:
+            self.db.execute('DELETE FROM chunks WHERE path = ?', (name,))
+            self.db.execute('DELETE FROM files WHERE path = ?', (name,))
+
+    def _indexed_bytes(self, name):
+        row = self.db.execute('SELECT indexed_bytes FROM files WHERE path = ?', (name,)).fetchone()
+        return row[0] if row else None
+
+    def update(self):
+        """Index the parts of the directory's recordings that are not indexed yet; returns new chunk count"""
+        added = 0
+        paths = (sorted(self.directory.glob(JSON_PATTERN)) + sorted(self.directory.glob(f"*{FILE_SUFFIX}"))
+                 + sorted(self.directory.glob(f"*{ARCHIVE_SUFFIX}")))
+        known = {row[0] for row in self.db.execute('SELECT path FROM files')}
+        for name in known - {path.name for path in paths}:
+            self._forget(name)
+
+        for path in paths:
+            size = path.stat().st_size
+            indexed = self._indexed_bytes(path.name)
+            if indexed is not None and size < indexed:
+                # The file was replaced or truncated: start over
+                self._forget(path.name)
+                indexed = None
+            if path.suffix == '.json':
+                added += self._scan_jsonl(path, indexed or 0, size)
+            elif path.suffix == ARCHIVE_SUFFIX:
+                added += self._scan_archive(path, indexed or ARCHIVE_HEADER.size)
+            else:
+                added += self._scan_binary(path, indexed or HEADER_SIZE, size)
+        return added
+
+    def _scan_jsonl(self, path, offset, size):
+        added = 0
+        with open(path, 'rb') as f:
+            while offset < size:
+                f.seek(offset)
+                data = f.read(SCAN_BYTES)
+                # Only whole lines; a partly written last line waits for the next update
+                end = data.rfind(b'\n') + 1
+                if end == 0:
+                    if len(data) < SCAN_BYTES:
+                        break
+                    end = len(data)
+                added += self.add_chunk(path, offset, end, parse_jsonl(data[:end]))
+                offset += end
+        return added
+
+    def _scan_binary(self, path, offset, size):
+        try:
+            _, dtype = read_header(path)
+        except ValueError:
+            return 0
+        count = (size - offset) // dtype.itemsize
+        added = 0
+        for first in range(0, count, SCAN_RECORDS):
+            n = min(SCAN_RECORDS, count - first)
+            length = n * dtype.itemsize
+            added += self.add_chunk(path, offset, length, read_records(path, offset, length))
+            offset += length
+        return added
+
+    def _scan_archive(self, path, offset):
+        try:
+            archive = SessionArchive(path)
+        except ValueError:
+            return 0
+        added = 0
+        for i in np.flatnonzero(archive.blocks['offset'] >= offset):
+            block = archive.blocks[i]
+            added += self.add_chunk(path, int(block['offset']), int(block['size']), archive.read_block(i))
+        return added
+
+    def files(self, device=None):
+        """[(path, format, device)] of the indexed files"""
+        sql, args = 'SELECT path, format, device FROM files', ()
+        if device is not None:
+            sql, args = sql + ' WHERE device = ?', (device,)
+        return self.db.execute(sql + ' ORDER BY path', args).fetchall()
+
+    def summary(self, start=None, end=None, device=None):
+        """{sensor: (count, first, last)} over the chunks overlapping [start, end], without reading any data"""
+        where, args = self._where(start, end, None, device)
+        rows = self.db.execute(
+            f'SELECT c.sensor, SUM(c.count), MIN(c.t_start), MAX(c.t_end) FROM chunks c '
+            f'JOIN files f ON f.path = c.path {where} GROUP BY c.sensor', args)
+        return {sensor: (count, first, last) for sensor, count, first, last in rows}
+
+    def _where(self, start, end, sensors, device):
+        clauses, args = [], []
+        if start is not None:
+            clauses.append('c.t_end >= ?')
+            args.append(to_timestamp(start))
+        if end is not None:
+            clauses.append('c.t_start <= ?')
+            args.append(to_timestamp(end))
+        if sensors:
+            clauses.append(f"c.sensor IN ({', '.join('?' * len(sensors))})")
+            args.extend(sensors)
+        if device is not None:
+            clauses.append('f.device = ?')
+            args.append(device)
+        return ('WHERE ' + ' AND '.join(clauses)) if clauses else '', args
+
+    def query(self, start=None, end=None, sensors=None, device=None):
+        """Return {sensor: record array sorted by time} of the samples in [start, end].
+
+        start/end are datetimes, ISO strings or epoch seconds (None for
+        unbounded). Only the chunks of the index that overlap the range are
+        read from disk.
+        """
+        where, args = self._where(start, end, sensors, device)
+        chunks = self.db.execute(
+            f'SELECT DISTINCT c.path, c.offset, c.length, f.format FROM chunks c '
+            f'JOIN files f ON f.path = c.path {where} ORDER BY c.path, c.offset', args).fetchall()
+
+        parts = []
+        archives = {}
+        for name, offset, length, file_format in chunks:
+            path = self.directory / name
+            if file_format == 'archive':
+                archive = archives.get(name) or archives.setdefault(name, SessionArchive(path))
+                parts.append(archive.read_block(int(np.searchsorted(archive.blocks['offset'], offset))))
+            elif file_format == 'binary':
+                parts.append(read_records(path, offset, length))
+            else:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    parts.append(parse_jsonl(f.read(length)))
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+
+        # Chunks are coarse: trim to the exact range
+        keep = np.ones(len(records), dtype=bool)
+        if start is not None:
+            keep &= records['timestamp'] >= to_timestamp(start)
+        if end is not None:
+            keep &= records['timestamp'] <= to_timestamp(end)
+        records = records[keep]
+
+        result = {}
+        codes = records['sensor']
+        for code in np.unique(codes):
+            sensor = SENSOR_NAMES.get(int(code), 'unknown')
+            if sensors and sensor not in sensors:
+                continue
+            selected = records[codes == code]
+            result[sensor] = selected[np.argsort(selected['timestamp'], kind='stable')]
+        for sensor in sensors or []:
+            result.setdefault(sensor, np.empty(0, dtype=RECORD_DTYPE))
+        return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and query sensor recordings")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    update = subparsers.add_parser('update', help="Index new recordings and new data in growing ones")
+    update.add_argument('directory', nargs='?', default='recordings')
+
+    query = subparsers.add_parser('query', help="Count the samples in a time range")
+    query.add_argument('directory', nargs='?', default='recordings')
+    query.add_argument('--start', help="ISO date/time (default: beginning)")
+    query.add_argument('--end', help="ISO date/time (default: end)")
+    query.add_argument('--sensors', nargs='+', help="Sensor types (default: all)")
+    query.add_argument('--device', help="Only this device")
+    query.add_argument('-o', '--output', help="Save the samples to this .npz file")
+
+    args = parser.parse_args(argv)
+    index = RecordingIndex(args.directory)
+    try:
+        if args.command == 'update':
+            print(f"Indexed {index.update()} new chunks")
+        elif args.command == 'query':
+            index.update()
+            data = index.query(args.start, args.end, args.sensors, args.device)
+            for sensor, records in sorted(data.items()):
+                span = ''
+                if len(records):
+                    span = f", {records['timestamp'][0]:.3f} .. {records['timestamp'][-1]:.3f}"
+                print(f"{sensor}: {len(records)} samples{span}")
+            if args.output:
+                np.savez(args.output, **data)
+                print(f"Saved to {args.output}")
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,162 @@
+"""Phone renderers for the visualizer.
+
+Every renderer creates its artists once and then only moves them:
+draw(vertices, arrow, status) takes the 8 phone corners (already rotated
+and axis-mapped), the tip of the screen-normal arrow and the status text
+(None if unchanged).
+
+    matplotlib  3D axes in the visualizer figure, redrawn by blitting
+    pyqtgraph   OpenGL window (needs pyqtgraph, PyOpenGL and a Qt binding)
+"""
+import time
+from collections import deque
+import numpy as np
+from mpl_toolkits.mplot3d.art3d import Poly3DCollection
+from matplotlib.colors import to_rgba
+
+# Corner indices of the phone faces: back, screen, then the four edges
+PHONE_FACES = np.array([
+    [0, 1, 2, 3],  # back (gray)
+    [4, 5, 6, 7],  # screen (blue)
+    [0, 1, 5, 4],  # front edge
+    [1, 2, 6, 5],  # right
+    [2, 3, 7, 6],  # back edge
+    [3, 0, 4, 7],  # left
+])
+FACE_COLORS = [to_rgba(color, alpha) for color, alpha in [
+    ('gray', 0.7), ('blue', 0.7), ('r', 0.4), ('g', 0.4), ('c', 0.4), ('m', 0.4)]]
+
+BACKENDS = ('matplotlib', 'pyqtgraph')
+
+
+class FrameRateMeter:
+    """Frames per second over the last `window` frames"""
+
+    def __init__(self, window=60):
+        self.times = deque(maxlen=window)
+
+    def tick(self):
+        self.times.append(time.perf_counter())
+
+    @property
+    def fps(self):
+        if len(self.times) < 2:
+            return 0.0
+        return (len(self.times) - 1) / max(self.times[-1] - self.times[0], 1e-9)
+
+
+class MatplotlibRenderer:
+    """Draw the phone into a 3D axes, reusing the same artists every frame.
+
+    The phone, arrow and status text are animated artists: a full figure
+    draw (startup, resize, button hover, view rotation) caches the static
+    background, and each frame only restores it and redraws the phone.
+    Text rendering is slow, so the status text is drawn into a second
+    cached background only when it changes.
+    """
+
+    def __init__(self, fig, ax, status_text):
+        self.fig = fig
+        self.ax = ax
+        self.canvas = fig.canvas
+        self.status_text = status_text
+        self.background = None
+        self.status_background = None
+
+        self.phone = Poly3DCollection(np.zeros((len(PHONE_FACES), 4, 3)), facecolors=FACE_COLORS,
+                                      edgecolors='k', animated=True)
+        ax.add_collection3d(self.phone)
+        self.arrow, = ax.plot([0, 0], [0, 0], [0, 0], color='blue', linewidth=2, animated=True)
+        self.arrow_head, = ax.plot([0], [0], [0], 'o', color='blue', markersize=4, animated=True)
+        status_text.set_animated(True)
+
+        self.canvas.mpl_connect('draw_event', self._on_draw)
+
+    def _on_draw(self, event):
+        """A full redraw happened: cache the new background and put the artists back on it"""
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_status()
+        self._draw_phone()
+
+    def _draw_status(self):
+        """Draw the status text onto the background and cache the result"""
+        self.canvas.restore_region(self.background)
+        self.fig.draw_artist(self.status_text)
+        self.status_background = self.canvas.copy_from_bbox(self.fig.bbox)
+
+    def _draw_phone(self):
+        # Axes3D.draw projects 3D collections; blitting has to do it itself
+        self.phone.do_3d_projection()
+        for artist in (self.phone, self.arrow, self.arrow_head):
+            self.ax.draw_artist(artist)
+
+    def draw(self, vertices, arrow, status=None):
+        self.phone.set_verts(vertices[PHONE_FACES])
+        self.arrow.set_data_3d([0, arrow[0]], [0, arrow[1]], [0, arrow[2]])
+        self.arrow_head.set_data_3d([arrow[0]], [arrow[1]], [arrow[2]])
+        if status is not None:
+            self.status_text.set_text(status)
+
+        if self.background is None or not self.canvas.supports_blit:
+            self.canvas.draw_idle()
+            return
+        if status is not None:
+            self._draw_status()
+        else:
+            self.canvas.restore_region(self.status_background)
+        self._draw_phone()
+        self.canvas.blit(self.fig.bbox)
+
+    def close(self):
+        pass
+
+
+class PyQtGraphRenderer:
+    """Draw the phone in a separate OpenGL window.
+
+    The matplotlib figure keeps the buttons; it must use a Qt backend so
+    both windows run on the same event loop.
+    """
+
+    def __init__(self):
+        try:
+            import pyqtgraph as pg
+            import pyqtgraph.opengl as gl
+            from pyqtgraph.Qt import QtWidgets
+        except ImportError as e:
+            raise ImportError("The pyqtgraph backend needs pyqtgraph, PyOpenGL and PyQt/PySide") from e
+
+        pg.mkQApp()
+        self.window = QtWidgets.QWidget()
+        self.window.setWindowTitle('Phone Orientation (Realtime)')
+        layout = QtWidgets.QVBoxLayout(self.window)
+
+        self.view = gl.GLViewWidget()
+        self.view.setCameraPosition(distance=3.5, elevation=30, azimuth=45)
+        self.view.addItem(gl.GLGridItem(size=pg.Vector(2, 2, 1), spacing=pg.Vector(0.25, 0.25, 1)))
+        layout.addWidget(self.view, stretch=1)
+
+        self.status_label = QtWidgets.QLabel()
+        layout.addWidget(self.status_label)
+
+        # Each quad face becomes two triangles with the face's color
+        self.triangles = np.concatenate([PHONE_FACES[:, [0, 1, 2]], PHONE_FACES[:, [0, 2, 3]]])
+        self.triangle_colors = np.array(FACE_COLORS * 2)
+        self.phone = gl.GLMeshItem(vertexes=np.zeros((8, 3)), faces=self.triangles,
+                                   faceColors=self.triangle_colors, drawEdges=True,
+                                   edgeColor=(0, 0, 0, 1), smooth=False, glOptions='translucent')
+        self.view.addItem(self.phone)
+        self.arrow = gl.GLLinePlotItem(pos=np.zeros((2, 3)), color=(0, 0, 1, 1), width=3, antialias=True)
+        self.view.addItem(self.arrow)
+
+        self.window.resize(700, 700)
+        self.window.show()
+
+    def draw(self, vertices, arrow, status=None):
+        self.phone.setMeshData(vertexes=vertices, faces=self.triangles, faceColors=self.triangle_colors)
+        self.arrow.setData(pos=np.array([[0.0, 0.0, 0.0], arrow]))
+        if status is not None:
+            self.status_label.setText(status)
+
+    def close(self):
+        self.window.close()
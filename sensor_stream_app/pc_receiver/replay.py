@@ -0,0 +1,215 @@
+"""Replay stored sessions into the server, as if the phone were streaming them.
+
+Reads JSON-lines recordings, binary recordings and session archives, and
+re-sends their samples with the original spacing of the device timestamps,
+sped up N times, or as fast as possible (--speed 0, in fixed FAST_BATCH
+batches, so runs are repeatable):
+
+    python replay.py recordings/session_20250323_041719.ssa --uri ws://127.0.0.1:8082
+    python replay.py recordings/ --speed 10 --format json
+    python replay.py recordings/sensor_data_20250323_0417*.json --direct --speed 0 -o /tmp/replayed
+
+Over WebSocket the samples go to a running server (binary batch frames, or
+one JSON message per sample like older app versions). With --direct an
+in-process server is started and the samples are handed straight to its
+handlers, skipping the network.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+import backends
+from bulk_loader import find_recordings, load_file
+from protocol import records_to_frame
+from recording_format import RECORD_DTYPE, FILE_SUFFIX, records_to_samples
+from recording_index import RECORDING_NAME
+from session_archive import ARCHIVE_SUFFIX, SessionArchive
+from timestamps import NS_PER_SECOND, now_ns
+
+# Real-time replay sends whatever is due every tick (seconds)
+REPLAY_TICK = 0.005
+
+# As-fast-as-possible replay sends batches of this many samples
+FAST_BATCH = 1000
+
+# Where --direct records the replayed session (kept apart from the recordings it replays)
+REPLAY_DIR = Path('recordings') / 'replay'
+
+
+def expand_inputs(inputs):
+    """Recording files for files, directories and binary recording base paths"""
+    paths = []
+    for item in inputs:
+        item = Path(item)
+        if not item.exists():
+            # A binary recording is named by its base path: <base>.<sensor>.bin
+            paths.extend(sorted(item.parent.glob(f"{item.name}.*{FILE_SUFFIX}")))
+        else:
+            paths.extend(find_recordings(item))
+    return paths
+
+
+def session_device(paths):
+    """The device id in the recordings' names or archive metadata (None if there is none)"""
+    for path in paths:
+        if path.suffix == ARCHIVE_SUFFIX:
+            device = SessionArchive(path).metadata.get('device')
+        else:
+            match = RECORDING_NAME.search(path.name)
+            device = match.group(2) if match else None
+        if device:
+            return device
+    return None
+
+
+def load_session(paths):
+    """Load recordings into one record array in arrival order.
+
+    JSON-lines files keep the order their lines were written in; binary
+    recordings and archives, which store sensors separately, are merged by
+    timestamp.
+    """
+    parts = [load_file(path) for path in paths]
+    if not parts:
+        return np.empty(0, dtype=RECORD_DTYPE)
+    records = np.concatenate(parts)
+    if any(path.suffix in (FILE_SUFFIX, ARCHIVE_SUFFIX) for path in paths):
+        records = records[np.argsort(records['timestamp'], kind='stable')]
+    return records
+
+
+def shift_to_now(records):
+    """Shift device times (timestamp and device_ns together) so the first sample is now"""
+    shift = now_ns() - int(records['device_ns'][0])
+    records['device_ns'] += shift
+    records['timestamp'] += shift / NS_PER_SECOND
+
+
+def send_times(records, speed):
+    """Seconds after the start at which each sample is due (samples stepping back in time go at once)"""
+    if not len(records):
+        return np.empty(0)
+    elapsed = np.maximum.accumulate(records['timestamp']) - records['timestamp'][0]
+    return elapsed / speed
+
+
+async def replay(records, send, speed=1.0, tick=REPLAY_TICK, batch=FAST_BATCH):
+    """Pass records to `await send(batch)` on the original schedule sped up `speed` times.
+
+    speed 0 sends FAST_BATCH samples at a time without waiting. Returns
+    (samples sent, seconds taken).
+    """
+    start = time.perf_counter()
+    if speed <= 0:
+        for first in range(0, len(records), batch):
+            await send(records[first:first + batch])
+        return len(records), time.perf_counter() - start
+
+    due = send_times(records, speed)
+    sent = 0
+    while sent < len(records):
+        # Sleep until the next sample is due, then send everything due by now
+        wait = due[sent] - (time.perf_counter() - start)
+        await asyncio.sleep(max(wait, 0.0))
+        end = int(np.searchsorted(due, time.perf_counter() - start + tick / 2, side='right'))
+        await send(records[sent:end])
+        sent = end
+    return sent, time.perf_counter() - start
+
+
+async def replay_websocket(uri, records, device, speed=1.0, format='binary'):
+    """Stream records to a running server over WebSocket as device `device`"""
+    import websockets
+
+    async with websockets.connect(f"{uri.rstrip('/')}/?device={device}") as websocket:
+        async def send(batch):
+            if format == 'binary':
+                await websocket.send(records_to_frame(batch))
+                return
+            for sample in records_to_samples(batch):
+                await websocket.send(backends.dumps(sample))
+        return await replay(records, send, speed)
+
+
+async def replay_direct(server, records, device, speed=1.0):
+    """Feed records straight into a running SensorStreamServer's handlers as device `device`"""
+    session = server.open_session(device)
+    try:
+        async def send(batch):
+            # Bookkept like a received message: one per batch
+            receive_ns = now_ns()
+            session.stats.messages += 1
+            session.stats.message_received(receive_ns)
+            batch = np.array(batch)
+            batch['receive_ns'] = receive_ns
+            await server.handle_sensor_batch(batch, session)
+            # Never-drop recording: give the writer time to catch up, like a phone held back by TCP
+            while session.recorder.over_capacity:
+                await asyncio.sleep(0.01)
+        return await replay(records, send, speed)
+    finally:
+        server.release_session(session)
+
+
+async def run_direct(records, device, speed, output=REPLAY_DIR):
+    """Start an in-process server (recording into `output`) and replay into it"""
+    import server as server_module
+
+    server_module.RECORDINGS_DIR = Path(output)
+    server_module.RECORDINGS_DIR.mkdir(parents=True, exist_ok=True)
+    server = server_module.SensorStreamServer(host='127.0.0.1', port=0, metrics_port=0)
+    server_task = asyncio.create_task(server.start_server())
+    # Wait for the shared buffers (the live view) to be set up
+    await server.ready.wait()
+    try:
+        return await replay_direct(server, records, device, speed)
+    finally:
+        server.stop()
+        await server_task
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay recorded sessions into the sensor stream server")
+    parser.add_argument('inputs', nargs='+', help="Recording files, directories or binary recording base paths")
+    parser.add_argument('--uri', default='ws://127.0.0.1:8082', help="Server to stream to")
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help="Playback speed: 1 real time, N times faster, 0 as fast as possible")
+    parser.add_argument('--device', help="Device id to replay as (default: from the file names, else 'replay')")
+    parser.add_argument('--format', choices=['binary', 'json'], default='binary',
+                        help="WebSocket messages: binary batch frames or one JSON message per sample")
+    parser.add_argument('--now', action='store_true',
+                        help="Shift the timestamps so the session starts now (default: original times)")
+    parser.add_argument('--direct', action='store_true',
+                        help="Replay into an in-process server instead of over WebSocket")
+    parser.add_argument('-o', '--output', default=REPLAY_DIR,
+                        help=f"Recordings directory of the in-process server (--direct, default: {REPLAY_DIR})")
+    args = parser.parse_args(argv)
+
+    paths = expand_inputs(args.inputs)
+    records = load_session(paths)
+    if not len(records):
+        print("No samples found")
+        return 1
+    if args.now:
+        shift_to_now(records)
+    device = args.device or session_device(paths) or 'replay'
+    duration = float(records['timestamp'].max() - records['timestamp'][0])
+    print(f"Replaying {len(records)} samples ({duration:.1f} s) from {len(paths)} files as {device}")
+
+    try:
+        if args.direct:
+            sent, elapsed = backends.run(run_direct(records, device, args.speed, args.output))
+        else:
+            sent, elapsed = backends.run(replay_websocket(args.uri, records, device, args.speed, args.format))
+    except KeyboardInterrupt:
+        return 1
+    print(f"Sent {sent} samples in {elapsed:.2f} s ({sent / max(elapsed, 1e-9):.0f} samples/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+"""Resample accelerometer, gyroscope and magnetometer streams onto one fixed-rate clock.
+
+The sensors report at different, jittery rates. The resampler interpolates
+each sensor linearly at grid times that are multiples of 1/rate (epoch
+seconds), giving N x 9 frames:
+
+    accel x, y, z | gyro x, y, z | mag x, y, z
+
+A sensor's columns are NaN at grid times its samples do not bracket within
+`max_gap` seconds (sensor missing, or stalled); frames with no sensor at
+all are left out. The batch function and the streaming stage use the same
+grid and produce the same frames:
+
+    times, frames = resample(read_jsonl('recordings/sensor_data_....json'))
+
+    resampler = StreamingResampler()
+    times, frames = resampler.add(records)  # frames completed by this batch
+
+Or for recorded files:
+
+    python resampler.py recordings/sensor_data_20240501_140000_pixel7.json -o frames.npz
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from recording_format import RECORD_DTYPE, SENSOR_CODES
+
+DEFAULT_RATE = 100.0  # Hz
+
+# Longest time between two samples of a sensor that is still interpolated (seconds)
+MAX_GAP = 0.25
+
+FRAME_SENSORS = ('accelerometer', 'gyroscope', 'magnetometer')
+FRAME_COLUMNS = [f"{sensor}_{axis}" for sensor in FRAME_SENSORS for axis in 'xyz']
+
+# Frames as records, for the shared memory ring buffer
+FRAME_DTYPE = np.dtype([
+    ('timestamp', '<f8'),
+    ('values', '<f4', (len(FRAME_COLUMNS),)),
+])
+
+
+def interpolate(timestamps, values, grid, max_gap=MAX_GAP):
+    """Interpolate N x 3 values (sorted by timestamp) at the grid times.
+
+    Rows are NaN where no pair of samples at most max_gap apart brackets
+    the grid time.
+    """
+    out = np.full((len(grid), values.shape[1]), np.nan)
+    n = len(timestamps)
+    if n == 0 or len(grid) == 0:
+        return out
+    right = np.searchsorted(timestamps, grid, side='left')  # first sample at or after t
+    r = np.minimum(right, n - 1)
+    l = np.maximum(right - 1, 0)
+    t_right, t_left = timestamps[r], timestamps[l]
+    exact = (right < n) & (t_right == grid)
+    between = (right > 0) & (right < n) & (t_right - t_left <= max_gap)
+
+    span = t_right - t_left
+    weight = np.divide(grid - t_left, span, out=np.zeros_like(span), where=span > 0)
+    np.add(values[l], weight[:, None] * (values[r] - values[l]), out=out, where=between[:, None])
+    out[exact] = values[r[exact]]
+    return out
+
+
+def _sensor_streams(records, codes):
+    """[(timestamps, N x 3 values)] per sensor code, sorted by time"""
+    streams = []
+    for code in codes:
+        selected = records[records['sensor'] == code]
+        selected = selected[np.argsort(selected['timestamp'], kind='stable')]
+        streams.append((selected['timestamp'].astype(np.float64),
+                        np.column_stack([selected['x'], selected['y'], selected['z']]).astype(np.float64)))
+    return streams
+
+
+def _grid_indices(timestamps, rate, max_gap):
+    """Grid indices covering the sorted timestamps, skipping gaps longer than max_gap"""
+    if len(timestamps) == 0:
+        return np.empty(0, dtype=np.int64)
+    breaks = np.flatnonzero(np.diff(timestamps) > max_gap)
+    starts = np.ceil(timestamps[np.concatenate([[0], breaks + 1])] * rate).astype(np.int64)
+    ends = np.floor(timestamps[np.concatenate([breaks, [len(timestamps) - 1]])] * rate).astype(np.int64)
+    return np.concatenate([np.arange(start, end + 1) for start, end in zip(starts, ends)])
+
+
+def _frames(streams, indices, rate, max_gap):
+    """Interpolate every stream at the grid indices; drops the frames without any sensor"""
+    grid = indices / rate
+    frames = np.hstack([interpolate(timestamps, values, grid, max_gap) for timestamps, values in streams])
+    keep = ~np.isnan(frames).all(axis=1)
+    return grid[keep], frames[keep]
+
+
+def resample(records, rate=DEFAULT_RATE, max_gap=MAX_GAP, sensors=FRAME_SENSORS):
+    """Resample a record array (one device) into (times, N x 9 frames)"""
+    records = np.asarray(records, dtype=RECORD_DTYPE)
+    streams = _sensor_streams(records, [SENSOR_CODES[sensor] for sensor in sensors])
+    timestamps = np.sort(np.concatenate([timestamps for timestamps, _ in streams]))
+    return _frames(streams, _grid_indices(timestamps, rate, max_gap), rate, max_gap)
+
+
+def to_frame_records(times, frames):
+    """(times, frames) as a FRAME_DTYPE array"""
+    out = np.empty(len(times), dtype=FRAME_DTYPE)
+    out['timestamp'] = times
+    out['values'] = frames
+    return out
+
+
+class StreamingResampler:
+    """Incremental resample(): feed record batches, get the frames they complete.
+
+    A grid time is emitted once every sensor that is still reporting has a
+    sample at or after it, so the frames match what resample() gives for
+    the whole recording. Sensors silent for more than max_gap (relative to
+    the newest sample) do not hold the stream back; their columns are NaN.
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, max_gap=MAX_GAP, sensors=FRAME_SENSORS):
+        self.rate = rate
+        self.max_gap = max_gap
+        self.codes = [SENSOR_CODES[sensor] for sensor in sensors]
+        self.streams = [(np.empty(0), np.empty((0, 3))) for _ in self.codes]
+        self.next_index = None
+
+    def add(self, records):
+        """Feed a record array (any sensors, any order); returns (times, frames) now complete"""
+        empty = (np.empty(0), np.empty((0, 3 * len(self.codes))))
+        for i, (timestamps, values) in enumerate(_sensor_streams(records, self.codes)):
+            if len(timestamps):
+                old_timestamps, old_values = self.streams[i]
+                timestamps = np.concatenate([old_timestamps, timestamps])
+                values = np.vstack([old_values, values])
+                order = np.argsort(timestamps, kind='stable')
+                self.streams[i] = (timestamps[order], values[order])
+
+        lasts = [timestamps[-1] for timestamps, _ in self.streams if len(timestamps)]
+        if not lasts:
+            return empty
+        newest = max(lasts)
+        watermark = min(last for last in lasts if last >= newest - self.max_gap)
+
+        # First sample at or after the next grid time, over all sensors
+        next_time = -np.inf if self.next_index is None else self.next_index / self.rate
+        pending = [timestamps[np.searchsorted(timestamps, next_time)] for timestamps, _ in self.streams
+                   if len(timestamps) and timestamps[-1] >= next_time]
+        if not pending:
+            return empty
+        first = min(pending)
+        if self.next_index is None:
+            self.next_index = int(np.ceil(first * self.rate))
+        else:
+            # Grid times more than max_gap before any pending sample can only be empty frames
+            self.next_index = max(self.next_index, int(np.ceil((first - self.max_gap) * self.rate)))
+
+        last_index = int(np.floor(watermark * self.rate))
+        if last_index < self.next_index:
+            return empty
+        indices = np.arange(self.next_index, last_index + 1)
+        times, frames = _frames(self.streams, indices, self.rate, self.max_gap)
+        self.next_index = last_index + 1
+
+        # Keep one sample before the next grid time to interpolate from
+        emitted = last_index / self.rate
+        for i, (timestamps, values) in enumerate(self.streams):
+            keep = max(np.searchsorted(timestamps, emitted, side='right') - 1, 0)
+            self.streams[i] = (timestamps[keep:], values[keep:])
+        return times, frames
+
+
+def main(argv=None):
+    from bulk_loader import load_recordings
+
+    parser = argparse.ArgumentParser(description="Resample recordings into aligned N x 9 sensor frames")
+    parser.add_argument('inputs', nargs='+', help="Recording files or directories (one device)")
+    parser.add_argument('-o', '--output', required=True, help="Output .npz (times, frames, columns)")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help=f"Frame rate in Hz (default: {DEFAULT_RATE:.0f})")
+    parser.add_argument('--max-gap', type=float, default=MAX_GAP,
+                        help=f"Longest gap to interpolate over, seconds (default: {MAX_GAP})")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    data = load_recordings(args.inputs, workers=1, sensors=list(FRAME_SENSORS))
+    if not sum(len(records) for records in data.values()):
+        print("No samples found")
+        return 1
+    times, frames = resample(np.concatenate(list(data.values())), args.rate, args.max_gap)
+    np.savez(args.output, times=times, frames=frames, columns=np.array(FRAME_COLUMNS))
+    complete = int((~np.isnan(frames).any(axis=1)).sum())
+    print(f"{len(frames)} frames ({complete} with all sensors) in {time.perf_counter() - start:.2f} s, saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,65 +1,102 @@
-import subprocess
+"""Sensor Stream Receiver: one entry point for the server, the visualizer and the audio player.
+
+    python run_receiver.py                              server and visualizer
+    python run_receiver.py --server-only --port 8082    headless server
+    python run_receiver.py --audio-player
+
+Options it does not know itself (--port, --pool, --metrics-port, ...) go to
+the server. Each subsystem is imported only when it is used, so a headless
+server never loads matplotlib or PyAudio. With the visualizer, the server
+runs in a child process and reports when it is listening; the visualizer
+starts then (its matplotlib import overlaps the server's startup).
+"""
+import argparse
+import multiprocessing
 import sys
 import time
-import os
-import argparse
-import signal
-from pathlib import Path
 
-def run_server_and_visualizer(server_only=False):
+STARTED = time.perf_counter()
+
+# How long the visualizer waits for the server to listen
+READY_TIMEOUT = 30  # seconds
+
+
+def report_ready():
+    print(f"Server ready in {time.perf_counter() - STARTED:.2f} s", flush=True)
+
+
+def serve(server_args, ready=None):
+    """Run the server in this process; `ready` (a multiprocessing Event) is set once it listens"""
+    import server
+    server.run(server_args, on_ready=ready.set if ready is not None else report_ready)
+
+
+def wait_until_ready(process, ready, timeout=READY_TIMEOUT):
+    """Wait for the server process to listen; False if it exited or timed out first"""
+    deadline = time.monotonic() + timeout
+    while not ready.wait(0.05):
+        if not process.is_alive() or time.monotonic() > deadline:
+            return False
+    return True
+
+
+def run_server_and_visualizer(server_args, server_only=False):
     """Run the WebSocket server and optionally the visualizer"""
     print("Starting Sensor Stream Receiver...")
-    
-    # Create the recordings directory if it doesn't exist
-    Path("recordings").mkdir(exist_ok=True)
-    
-    # Start the WebSocket server in a separate process
-    server_process = subprocess.Popen([sys.executable, "server.py"])
-    
-    # Start the visualizer in the current process if not server_only
-    visualizer_process = None
-    if not server_only:
-        print("Starting data visualizer...")
-        time.sleep(1)  # Give the server a moment to start
-        visualizer_process = subprocess.Popen([sys.executable, "visualizer.py"])
-    
+
+    if server_only:
+        serve(server_args)
+        print("Sensor Stream Receiver stopped")
+        return 0
+
+    # Spawned, so the server does not inherit the visualizer's GUI state
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    server_process = context.Process(target=serve, args=(server_args, ready), name='sensor-stream-server')
+    server_process.start()
     try:
-        # Wait for the processes to complete
-        server_process.wait()
-        if visualizer_process:
-            visualizer_process.wait()
+        print("Starting data visualizer...")
+        import visualizer
+        if not wait_until_ready(server_process, ready):
+            print("Server failed to start")
+            return 1
+        report_ready()
+        visualizer.main([])
+        # The server keeps recording after the visualizer window is closed
+        server_process.join()
     except KeyboardInterrupt:
         print("\nShutting down...")
-        # Clean shutdown of processes
-        if server_process.poll() is None:
-            if os.name == 'nt':  # Windows
-                server_process.terminate()
-            else:  # Unix/Linux
-                os.kill(server_process.pid, signal.SIGTERM)
-        
-        if visualizer_process and visualizer_process.poll() is None:
-            if os.name == 'nt':  # Windows
-                visualizer_process.terminate()
-            else:  # Unix/Linux
-                os.kill(visualizer_process.pid, signal.SIGTERM)
-    
+    finally:
+        # SIGTERM on Unix, so the server flushes its recordings
+        if server_process.is_alive():
+            server_process.terminate()
+        server_process.join()
+
     print("Sensor Stream Receiver stopped")
+    return 0
+
 
 def play_audio_recordings():
     """Run the audio player"""
     print("Starting audio player...")
-    subprocess.run([sys.executable, "audio_player.py", "--interactive"])
+    import audio_player
+    audio_player.main(['--interactive'])
+    return 0
+
 
-def main():
-    parser = argparse.ArgumentParser(description="Sensor Stream Receiver")
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sensor Stream Receiver",
+                                     epilog="Other options are passed to the server (see server.py --help)")
     parser.add_argument("--server-only", action="store_true", help="Run only the server without visualizer")
     parser.add_argument("--audio-player", action="store_true", help="Run the audio player for recordings")
-    args = parser.parse_args()
-    
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Server log level (DEBUG logs every message)")
+    args, server_args = parser.parse_known_args(argv)
+
     if args.audio_player:
-        play_audio_recordings()
-    else:
-        run_server_and_visualizer(server_only=args.server_only)
+        return play_audio_recordings()
+    return run_server_and_visualizer(server_args + ['--log-level', args.log_level], args.server_only)
+
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    sys.exit(main())
@@ -1,34 +1,255 @@
 import asyncio
+import argparse
 import json
-import base64
 import websockets
 import socket
 import datetime
 import os
+import signal
+import time
 from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+import backends
+from shared_buffer import SensorBuffers, OrientationBuffer, SharedRingBuffer, buffer_name, SHARED_BUFFER_PREFIX
+from resampler import FRAME_DTYPE
+from session import ClientSession, safe_device_id
+from ingest_pool import IngestPool, MessageQueue, POOLS, DEFAULT_POOL, DEFAULT_WORKERS
+from logging_utils import get_logger, setup_logging, ThroughputSummary, SUMMARY_INTERVAL
+from timestamps import now_ns
+from backpressure import parse_policies, RECEIVE_QUEUE, BLOCK, DROP_OLDEST, RECORD_POLICIES, LIVE_POLICIES
+from fanout import FanOut, SUBSCRIBE_PATH
+from protocol import HELLO
+from metrics import MetricsRegistry, Histogram, serve_metrics, METRICS_HOST, METRICS_PORT
+
+logger = get_logger('server')
 
 # Create directories for storing received data
 RECORDINGS_DIR = Path("recordings")
 RECORDINGS_DIR.mkdir(exist_ok=True)
 
+# Sensor recording format: 'json' (JSON lines, read by the visualizer) or 'binary'
+RECORDING_FORMAT = 'json'
+
+# How often the collected samples are run through the orientation filter
+FUSION_INTERVAL = 0.02  # seconds
+
+# How often a device held back for its recorder checks whether it may continue
+BACKPRESSURE_POLL = 0.01  # seconds
+
 class SensorStreamServer:
-    def __init__(self, host='0.0.0.0', port=8082):
+    def __init__(self, host='0.0.0.0', port=8082, shared_prefix=SHARED_BUFFER_PREFIX, metrics_port=METRICS_PORT,
+                 record_policies=RECORD_POLICIES, live_policies=LIVE_POLICIES,
+                 pool=DEFAULT_POOL, workers=DEFAULT_WORKERS):
         self.host = host
         self.port = port
+        self.server = None
+        # Set once the server is listening
+        self.ready = asyncio.Event()
+        
+        # Where received messages get decoded (see ingest_pool.py)
+        self.ingest_pool = IngestPool(pool, workers)
+        
+        # Per-sensor load shedding of the recording and live stages (see backpressure.py)
+        self.record_policies = record_policies
+        self.live_policies = live_policies
+        
+        # Prometheus endpoint (0 or None: disabled); everything is collected when scraped
+        self.metrics_port = metrics_port
+        self.metrics = MetricsRegistry()
+        self.metrics.add_collector(self.collect_metrics)
+        self.parse_seconds = {'json': Histogram(), 'binary': Histogram()}
         self.active_connections = set()
-        self.audio_file = None
         
-    async def start_server(self):
-        """Start the WebSocket server"""
-        server = await websockets.serve(self.handle_connection, self.host, self.port)
+        # Consumers of the live samples, connected on SUBSCRIBE_PATH
+        self.fanout = FanOut()
+        
+        # One session (writers, buffers, stats) per device id
+        self.sessions = {}
+        
+        # Live view of one device through shared memory
+        self.shared_prefix = shared_prefix
+        self.shared_buffers = None
+        self.orientation_buffer = None
+        self.frame_buffer = None
+        
+    async def start_server(self, on_ready=None):
+        """Start the WebSocket server; on_ready() is called once it is listening"""
+        # Publish live samples to the visualizer through shared memory
+        try:
+            self.shared_buffers = SensorBuffers.create(self.shared_prefix)
+            self.orientation_buffer = OrientationBuffer.create(self.shared_prefix)
+            self.frame_buffer = SharedRingBuffer.create(buffer_name('frames', self.shared_prefix), dtype=FRAME_DTYPE)
+        except Exception as e:
+            logger.warning("Shared memory buffers unavailable, live view disabled: %s", e)
+        
+        # Pool workers start in the background: listening does not wait for them, early messages do
+        pool_start = asyncio.create_task(self.ingest_pool.start())
+        # A bounded receive queue: once it is full websockets stops reading and TCP pushes back on the phone
+        server = self.server = await websockets.serve(self.handle_connection, self.host, self.port,
+                                                      max_queue=RECEIVE_QUEUE)
+        metrics_server = None
+        if self.metrics_port:
+            try:
+                metrics_server = await serve_metrics(self.metrics, METRICS_HOST, self.metrics_port)
+                logger.info("Metrics on http://%s:%s/metrics", METRICS_HOST, self.metrics_port)
+            except OSError as e:
+                logger.warning("Metrics endpoint unavailable: %s", e)
+        fusion_task = asyncio.create_task(self.run_fusion())
+        summary_task = asyncio.create_task(self.report_throughput())
+        
+        # Stop cleanly on SIGTERM (sent by run_receiver.py) so recordings get flushed
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, server.close)
+        except (NotImplementedError, AttributeError):
+            pass  # Not supported on Windows
         
         # Get the local IP address
         local_ip = self.get_local_ip()
-        print(f"Server running on ws://{local_ip}:{self.port}")
-        print(f"Use this IP address in your Flutter app")
+        logger.info("Server running on ws://%s:%s", local_ip, self.port)
+        logger.info("Use this IP address in your Flutter app")
+        described = backends.describe()
+        logger.info("Backends: JSON %s, event loop %s", described['json'], described['loop'])
+        self.ready.set()
+        if on_ready:
+            on_ready()
         
         # Start the server
-        await server.wait_closed()
+        try:
+            await server.wait_closed()
+        finally:
+            pool_start.cancel()
+            fusion_task.cancel()
+            summary_task.cancel()
+            if metrics_server:
+                metrics_server.close()
+            self.close()
+            self.ingest_pool.close()
+            
+    async def report_throughput(self, interval=SUMMARY_INTERVAL):
+        """Periodically log aggregated samples/s per sensor per client"""
+        summary = ThroughputSummary(logger)
+        while True:
+            await asyncio.sleep(interval)
+            summary.report(list(self.sessions.values()))
+            
+    async def run_fusion(self):
+        """Periodically fuse each session's collected samples into its orientation and aligned frames"""
+        while True:
+            await asyncio.sleep(FUSION_INTERVAL)
+            live_session = self.live_session
+            for session in list(self.sessions.values()):
+                try:
+                    moved, frames = session.process()
+                    if session is live_session:
+                        if moved and self.orientation_buffer:
+                            self.orientation_buffer.publish(session.fusion.timestamp, session.fusion.quaternion)
+                        if frames is not None and len(frames) and self.frame_buffer:
+                            self.frame_buffer.publish(frames)
+                except Exception as e:
+                    logger.error("Error fusing sensor data from %s: %s", session.device_id, e)
+                # Let ingest run between sessions
+                await asyncio.sleep(0)
+            
+    def stop(self):
+        """Stop accepting connections; start_server() then returns after cleaning up"""
+        if self.server:
+            self.server.close()
+            
+    def collect_metrics(self):
+        """Metric families for MetricsRegistry, read from the sessions' counters"""
+        sessions = list(self.sessions.values())
+        def per_device(value):
+            return [({'device': s.device_id}, value(s)) for s in sessions]
+        def per_sensor(counters):
+            return [({'device': s.device_id, 'sensor': sensor}, count)
+                    for s in sessions for sensor, count in sorted(counters(s).items())]
+        return [
+            ('sensor_stream_sessions', 'gauge', 'Open device sessions', [({}, len(sessions))]),
+            ('sensor_stream_connections', 'gauge', 'Open WebSocket connections',
+             [({}, len(self.active_connections))]),
+            ('sensor_stream_subscribers', 'gauge', 'Connected live subscribers', [({}, len(self.fanout))]),
+            ('sensor_stream_fanout_sent_samples_total', 'counter', 'Samples sent to subscribers',
+             [({}, self.fanout.sent)]),
+            ('sensor_stream_fanout_dropped_samples_total', 'counter', 'Samples dropped by slow subscribers',
+             [({}, self.fanout.dropped)]),
+            ('sensor_stream_messages_total', 'counter', 'Messages received', per_device(lambda s: s.stats.messages)),
+            ('sensor_stream_received_bytes_total', 'counter', 'Message bytes received',
+             per_device(lambda s: s.stats.bytes)),
+            ('sensor_stream_samples_total', 'counter', 'Sensor samples received',
+             per_sensor(lambda s: s.stats.samples)),
+            ('sensor_stream_audio_bytes_total', 'counter', 'Audio bytes received',
+             per_device(lambda s: s.stats.audio_bytes)),
+            ('sensor_stream_errors_total', 'counter', 'Messages that could not be handled',
+             per_device(lambda s: s.stats.errors)),
+            ('sensor_stream_message_interval_seconds', 'histogram', 'Time between two messages of a device',
+             per_device(lambda s: s.stats.message_intervals)),
+            ('sensor_stream_timestamp_gaps_total', 'counter',
+             'Consecutive samples of a sensor more than TIMESTAMP_GAP apart', per_sensor(lambda s: s.stats.gaps)),
+            ('sensor_stream_timestamp_backwards_total', 'counter',
+             'Samples older than the previous sample of their sensor', per_sensor(lambda s: s.stats.backwards)),
+            ('sensor_stream_parse_seconds', 'histogram', 'Time to decode one message',
+             [({'format': name}, histogram) for name, histogram in self.parse_seconds.items()]),
+            ('sensor_stream_recorder_queue_depth', 'gauge', 'Items waiting for the recording writer thread',
+             per_device(lambda s: s.recorder.queue_depth)),
+            ('sensor_stream_recorder_backlog_samples', 'gauge', 'Samples received but not yet written',
+             per_device(lambda s: s.recorder.backlog)),
+            ('sensor_stream_recorder_written_samples_total', 'counter', 'Samples written to the recording',
+             per_device(lambda s: s.recorder.samples_written)),
+            ('sensor_stream_recorder_dropped_samples_total', 'counter', 'Samples lost to write errors',
+             per_device(lambda s: s.recorder.samples_dropped)),
+            ('sensor_stream_recorder_write_seconds', 'histogram', 'Time to write one batch of samples',
+             per_device(lambda s: s.recorder.write_seconds)),
+            ('sensor_stream_recorder_write_lag_seconds', 'histogram',
+             'Time the oldest sample of a batch waited to be written', per_device(lambda s: s.recorder.write_lag)),
+            ('sensor_stream_shed_samples_total', 'counter', 'Samples dropped by a stage falling behind',
+             [({'device': s.device_id, 'stage': stage, 'sensor': sensor}, count)
+              for s in sessions for stage, shedder in (('record', s.recorder.shedder), ('live', s.live))
+              for sensor, count in sorted(shedder.dropped.items())]),
+            ('sensor_stream_backpressure_seconds_total', 'counter',
+             'Time spent not reading from a device while its recorder caught up',
+             per_device(lambda s: s.stats.backpressure_seconds)),
+            ('sensor_stream_clock_offset_seconds', 'gauge', 'Estimated device clock minus this clock',
+             [({'device': s.device_id}, s.clock.offset_ns / 1e9) for s in sessions if s.clock.offset_ns is not None]),
+        ]
+        
+    @property
+    def live_session(self):
+        """The session shown in the live view: the longest-connected device"""
+        return next(iter(self.sessions.values()), None)
+        
+    def open_session(self, device_id):
+        """Get the session for a device, creating it on its first connection"""
+        session = self.sessions.get(device_id)
+        if session is None:
+            session = ClientSession(device_id, RECORDINGS_DIR, RECORDING_FORMAT,
+                                    record_policies=self.record_policies, live_policies=self.live_policies)
+            session.start()
+            self.sessions[device_id] = session
+        session.connections += 1
+        return session
+        
+    def release_session(self, session):
+        """Drop a connection from its session, closing the session with its last connection"""
+        session.connections -= 1
+        if session.connections <= 0 and self.sessions.get(session.device_id) is session:
+            del self.sessions[session.device_id]
+            session.close()
+            logger.info("Session closed for %s: %s", session.device_id, session.stats.summary())
+            
+    def close(self):
+        """Flush and close any open recordings"""
+        for session in list(self.sessions.values()):
+            session.close()
+        self.sessions = {}
+        if self.shared_buffers:
+            self.shared_buffers.close()
+            self.shared_buffers = None
+        if self.orientation_buffer:
+            self.orientation_buffer.close()
+            self.orientation_buffer = None
+        if self.frame_buffer:
+            self.frame_buffer.close()
+            self.frame_buffer = None
         
     def get_local_ip(self):
         """Get the local IP address of the machine"""
@@ -43,116 +264,196 @@ class SensorStreamServer:
             s.close()
         return local_ip
         
-    async def handle_connection(self, websocket, path):
+    def request_path(self, websocket, path):
+        """The path (with query) the client connected to"""
+        if path is None:
+            # Newer websockets versions no longer pass the path to the handler
+            request = getattr(websocket, 'request', None)
+            path = getattr(request, 'path', None) or getattr(websocket, 'path', '') or ''
+        return path
+        
+    def get_device_id(self, websocket, path):
+        """Identify the device: ?device=<id> in the URL, else the client address"""
+        path = self.request_path(websocket, path)
+        device = parse_qs(urlparse(path).query).get('device')
+        if device and device[0]:
+            return safe_device_id(device[0])
+        return safe_device_id(websocket.remote_address[0])
+        
+    async def handle_connection(self, websocket, path=None):
         """Handle a WebSocket connection"""
+        path = self.request_path(websocket, path)
+        if urlparse(path).path == SUBSCRIBE_PATH:
+            await self.fanout.serve(websocket, path)
+            return
+        
         # Add the connection to the set of active connections
         self.active_connections.add(websocket)
         client = websocket.remote_address[0]
-        print(f"New connection from {client}")
+        session = self.open_session(self.get_device_id(websocket, path))
+        logger.info("New connection from %s (device %s)", client, session.device_id)
         
+        # This loop only queues messages; the consumer has them decoded and applies them in order
+        messages = MessageQueue()
+        consumer = asyncio.create_task(self.consume_messages(messages, session))
         try:
-            # Process incoming messages
+            # Lets the app switch from JSON messages to binary frames
+            await websocket.send(HELLO)
             async for message in websocket:
-                await self.process_message(message, client)
+                arrival = now_ns()
+                session.stats.messages += 1
+                session.stats.bytes += len(message)
+                session.stats.message_received(arrival)
+                messages.put(message, arrival)
+                if messages.full:
+                    await messages.wait_for_room()
+                if session.recorder.over_capacity:
+                    await self.wait_for_recorder(websocket, session)
         except websockets.ConnectionClosed:
-            print(f"Connection closed from {client}")
+            logger.info("Connection closed from %s", client)
         finally:
+            # Apply whatever is still queued before the session can close
+            messages.close()
+            await consumer
             # Remove the connection from the set of active connections
             self.active_connections.remove(websocket)
-            
-            # Close the audio file if it's open
-            if self.audio_file:
-                self.audio_file.close()
-                self.audio_file = None
+            self.release_session(session)
                 
-    async def process_message(self, message, client):
-        """Process an incoming message"""
-        try:
-            # Parse the JSON message
-            print(f"Received message: {message}")
-            
-            try:
-                data = json.loads(message)
-                print(f"Parsed JSON: {data}")
-            except:
-                print(f"Error parsing JSON, treating as raw message")
-                # If it's not JSON, just save as raw data
-                filename = RECORDINGS_DIR / f"unknown_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
-                with open(filename, 'w') as f:
-                    f.write(message)
+    async def wait_for_recorder(self, websocket, session):
+        """Stop reading from a device until its recorder is back under capacity"""
+        logger.warning("Recorder of %s is %d samples behind, holding the device back",
+                       session.device_id, session.recorder.backlog)
+        started = time.monotonic()
+        while session.recorder.over_capacity and websocket.close_code is None:
+            await asyncio.sleep(BACKPRESSURE_POLL)
+        session.stats.backpressure_seconds += time.monotonic() - started
+        
+    async def consume_messages(self, messages, session):
+        """Decode a connection's queued messages in batches on the ingest pool and apply them in order"""
+        encode_lines = session.recorder.format == 'json'
+        while True:
+            batch = await messages.get_batch()
+            if batch is None:
                 return
+            raw, arrivals = batch
+            try:
+                items, timings = await self.ingest_pool.decode(raw, encode_lines, arrivals)
+            except Exception as e:
+                session.stats.errors += len(raw)
+                logger.error("Error decoding %d messages from %s: %s", len(raw), session.device_id, e)
+                continue
+            for message_format, seconds in timings:
+                self.parse_seconds[message_format].observe(seconds)
+            for item in items:
+                try:
+                    await self.apply_item(item, session)
+                except Exception as e:
+                    session.stats.errors += 1
+                    logger.error("Error processing message: %s", e)
+                    
+    async def apply_item(self, item, session):
+        """Apply one decoded item (see ingest_pool.decode_messages)"""
+        kind = item[0]
+        if kind == 'records':
+            _, records, lines = item
+            await self.handle_sensor_batch(records, session, lines)
+        elif kind == 'audio':
+            self.write_audio(item[1], session)
+        elif kind == 'error':
+            session.stats.errors += 1
+            logger.warning("%s from %s", item[1], session.device_id)
+        elif kind == 'raw':
+            logger.warning("Error parsing JSON, treating as raw message")
+            # If it's not JSON, just save as raw data
+            filename = RECORDINGS_DIR / f"unknown_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            message = item[1]
+            with open(filename, 'wb' if isinstance(message, bytes) else 'w') as f:
+                f.write(message)
+        else:
+            data = item[1]
+            logger.warning("Unknown message type: %s", data.get('type'))
+            # Save the unknown data
+            filename = RECORDINGS_DIR / f"unknown_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+            with open(filename, 'w') as f:
+                json.dump(data, f, indent=2)
             
-            # Check the message type
-            message_type = data.get('type')
-            
-            # If the message contains sensorType, values, and timestamp, it's sensor data
-            if 'sensorType' in data and 'values' in data and 'timestamp' in data:
-                await self.handle_sensor_data({"data": data}, client)
-            # If the message has the explicit type field
-            elif message_type == 'sensor':
-                await self.handle_sensor_data(data, client)
-            elif message_type == 'audio':
-                await self.handle_audio_data(data, client)
-            else:
-                print(f"Unknown message type: {message_type}")
-                # Save the unknown data
-                filename = RECORDINGS_DIR / f"unknown_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-                with open(filename, 'w') as f:
-                    json.dump(data, f, indent=2)
-        except Exception as e:
-            print(f"Error processing message: {e}")
-            
-    async def handle_sensor_data(self, data, client):
-        """Handle sensor data"""
-        sensor_data = data.get('data', {})
-        sensor_type = sensor_data.get('sensorType', 'unknown')
-        timestamp = sensor_data.get('timestamp', '')
-        values = sensor_data.get('values', {})
-        
-        # Format the values as a string
-        values_str = ', '.join([f"{key}: {value}" for key, value in values.items()])
-        
-        # Print the sensor data
-        print(f"Sensor data from {client} - {sensor_type}: {values_str}")
-        
-        # Save the sensor data to a file
-        filename = RECORDINGS_DIR / f"sensor_data_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(filename, 'a') as f:
-            json.dump(sensor_data, f)
-            f.write('\n')
-            
-    async def handle_audio_data(self, data, client):
-        """Handle audio data"""
-        audio_base64 = data.get('data', '')
-        timestamp = data.get('timestamp', '')
+    async def handle_sensor_batch(self, records, session, lines=None):
+        """Handle a batch of sensor records (and their JSON recording lines, if already serialized)"""
+        logger.debug("Sensor batch from %s - %d samples", session.device_id, len(records))
+        session.add_records(records, lines)
         
-        try:
-            # Decode the base64 audio data
-            audio_data = base64.b64decode(audio_base64)
-            
-            # Create a filename based on the timestamp
-            timestamp_obj = datetime.datetime.fromisoformat(timestamp)
-            filename = RECORDINGS_DIR / f"audio_{timestamp_obj.strftime('%Y%m%d_%H%M%S')}.pcm"
+        # Publish the samples to the live view
+        if self.shared_buffers and session is self.live_session:
+            self.shared_buffers.publish_mixed(records)
+        self.fanout.publish(session.device_id, records)
             
-            # Open the file if it's not already open
-            if not self.audio_file or self.audio_file.name != str(filename):
-                if self.audio_file:
-                    self.audio_file.close()
-                self.audio_file = open(filename, 'wb')
-                
-            # Write the audio data to the file
-            self.audio_file.write(audio_data)
-            self.audio_file.flush()
-            
-            # Print a message
-            print(f"Received audio data from {client} - size: {len(audio_data)} bytes")
+    def write_audio(self, pcm, session):
+        """Append raw PCM to the session's WAV recording"""
+        try:
+            session.add_audio(pcm)
+            logger.debug("Received audio data from %s - size: %d bytes", session.device_id, len(pcm))
         except Exception as e:
-            print(f"Error handling audio data: {e}")
+            session.stats.errors += 1
+            logger.error("Error writing audio data: %s", e)
             
-async def main():
+async def main(port=8082, metrics_port=METRICS_PORT, record_policies=RECORD_POLICIES, live_policies=LIVE_POLICIES,
+               pool=DEFAULT_POOL, workers=DEFAULT_WORKERS, on_ready=None):
     """Main function"""
-    server = SensorStreamServer()
-    await server.start_server()
+    server = SensorStreamServer(port=port, metrics_port=metrics_port,
+                                record_policies=record_policies, live_policies=live_policies,
+                                pool=pool, workers=workers)
+    await server.start_server(on_ready)
+    
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sensor Stream WebSocket server")
+    parser.add_argument("--port", type=int, default=8082, help="Port to listen on")
+    parser.add_argument("--log-level", default="INFO",
+                        choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        help="Console log level (DEBUG prints every message)")
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT,
+                        help=f"Port of the local Prometheus metrics endpoint, 0 to disable (default: {METRICS_PORT})")
+    parser.add_argument("--record-policy", action="append", metavar="SENSOR=POLICY",
+                        help="Load shedding of the recording per sensor ('*' for all): block (default), "
+                             "drop-newest or decimate; repeatable")
+    parser.add_argument("--live-policy", action="append", metavar="SENSOR=POLICY",
+                        help="Load shedding of the live view per sensor ('*' for all): drop-oldest (default), "
+                             "drop-newest or decimate; repeatable")
+    parser.add_argument("--pool", choices=POOLS, default=DEFAULT_POOL,
+                        help=f"Where messages are decoded: on the event loop, a thread pool or a process pool "
+                             f"(default: {DEFAULT_POOL})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"Threads or processes of the pool (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--json-backend", choices=(backends.AUTO,) + backends.JSON_BACKENDS,
+                        help=f"JSON codec (default: ${backends.JSON_ENV}, else the fastest installed)")
+    parser.add_argument("--loop", choices=(backends.AUTO,) + backends.LOOP_BACKENDS,
+                        help=f"Event loop (default: ${backends.LOOP_ENV}, else uvloop if installed)")
+    parser.add_argument("--log-queue", action="store_true",
+                        help="Format and write log output on a background thread")
+    args = parser.parse_args(argv)
+    try:
+        args.record_policies = parse_policies(args.record_policy, RECORD_POLICIES)
+        args.live_policies = parse_policies(args.live_policy, LIVE_POLICIES)
+        backends.configure(args.json_backend, args.loop)
+    except ValueError as e:
+        parser.error(str(e))
+    if DROP_OLDEST in args.record_policies.values():
+        parser.error("--record-policy cannot be drop-oldest: queued samples are already on their way to disk")
+    if BLOCK in args.live_policies.values():
+        parser.error("--live-policy cannot be block: the live view never holds the phone back")
+    return args
+    
+def run(argv=None, on_ready=None):
+    """Parse the command line and serve until stopped (run_receiver.py runs the server this way)"""
+    args = parse_args(argv)
+    listener = setup_logging(args.log_level, use_queue=args.log_queue)
+    try:
+        backends.run(main(args.port, args.metrics_port, args.record_policies, args.live_policies,
+                          args.pool, args.workers, on_ready))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if listener:
+            listener.stop()
     
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    run() 
\ No newline at end of file
@@ -0,0 +1,158 @@
+import re
+import time
+from collections import defaultdict
+import numpy as np
+from recorder import SensorRecorder, AudioRecorder, ClockLog
+from recording_format import pack_records, SENSOR_NAMES
+from fusion import SensorFusion, MadgwickFilter
+from resampler import StreamingResampler, to_frame_records
+from timestamps import ClockOffsetEstimator
+from metrics import Histogram, INTERVAL_BUCKETS
+from backpressure import LoadShedder, BLOCK, LIVE_CAPACITY, LIVE_POLICIES, RECORD_POLICIES
+
+# Time between two samples of one sensor that counts as a gap in the stream (seconds)
+TIMESTAMP_GAP = 0.25
+
+
+def safe_device_id(device_id):
+    """Make a device id usable in file names"""
+    return re.sub(r'[^A-Za-z0-9_-]+', '-', str(device_id)).strip('-')[:64] or 'unknown'
+
+
+class SessionStats:
+    """Counters for one client session (updated on the event loop thread only)"""
+
+    def __init__(self):
+        self.connected_at = time.time()
+        self.messages = 0
+        self.bytes = 0
+        self.samples = defaultdict(int)
+        self.audio_bytes = 0
+        self.errors = 0
+        # Time the server stopped reading from the device for the recorder to catch up
+        self.backpressure_seconds = 0.0
+
+        # Time between messages, and per sensor: device timestamp gaps and steps backwards
+        self.message_intervals = Histogram(INTERVAL_BUCKETS)
+        self.last_receive_ns = None
+        self.gaps = defaultdict(int)
+        self.backwards = defaultdict(int)
+        self.last_timestamps = {}
+
+    def message_received(self, receive_ns):
+        if self.last_receive_ns is not None:
+            self.message_intervals.observe((receive_ns - self.last_receive_ns) / 1e9)
+        self.last_receive_ns = receive_ns
+
+    def check_timestamps(self, sensor, timestamps):
+        """Count gaps and backwards steps in an array of one sensor's timestamps, in arrival order"""
+        last = self.last_timestamps.get(sensor)
+        steps = np.diff(timestamps, prepend=timestamps[0] if last is None else last)
+        self.gaps[sensor] += int(np.count_nonzero(steps > TIMESTAMP_GAP))
+        self.backwards[sensor] += int(np.count_nonzero(steps < 0))
+        self.last_timestamps[sensor] = float(timestamps[-1])
+
+    def summary(self):
+        elapsed = max(time.time() - self.connected_at, 1e-9)
+        rates = ', '.join(f"{sensor}: {count / elapsed:.0f}/s" for sensor, count in sorted(self.samples.items()))
+        return (f"{self.messages} messages, {self.bytes} bytes, {sum(self.samples.values())} samples "
+                f"({rates or 'no samples'}), {self.audio_bytes} audio bytes, {self.errors} errors")
+
+
+class ClientSession:
+    """Everything the server keeps for one device: its writers, buffers and stats.
+
+    Sessions are keyed by device id, so a phone that reconnects (or holds
+    several connections) keeps writing to the same files. The recorder and
+    the live stage (samples waiting for process()) shed load per sensor
+    according to their policies (see backpressure.py).
+    """
+
+    def __init__(self, device_id, recordings_dir, recording_format='json', index=True,
+                 record_policies=RECORD_POLICIES, live_policies=LIVE_POLICIES):
+        # Nothing holds a device back for the live stage, so it cannot block
+        live_policies = {**LIVE_POLICIES, **live_policies}
+        if BLOCK in live_policies.values():
+            raise ValueError("The live stage cannot block: it only ever drops samples")
+        self.device_id = device_id
+        self.recordings_dir = recordings_dir
+        self.connections = 0
+        self.stats = SessionStats()
+
+        self.recorder = SensorRecorder(recordings_dir, format=recording_format, device_id=device_id, index=index,
+                                       policies=record_policies)
+        self.audio = AudioRecorder(recordings_dir, device_id=device_id)
+
+        # Device clock vs this PC's clock (int64 ns), from the records' device_ns and receive_ns
+        self.clock = ClockOffsetEstimator()
+        self.clock_log = ClockLog(recordings_dir, device_id=device_id)
+
+        # Orientation estimate and aligned 9-axis frames for this device, updated in batches by process()
+        self.fusion = SensorFusion(MadgwickFilter())
+        self.resampler = StreamingResampler()
+        self.pending_records = []
+        self.pending_samples = 0
+        self.live = LoadShedder(LIVE_CAPACITY, live_policies)
+
+    def start(self):
+        self.recorder.start()
+
+    def add_records(self, records, lines=None):
+        """Record a batch of samples (recording_format.RECORD_DTYPE array), optionally with their JSON lines.
+
+        The newest sample's device_ns and receive_ns (if it has one) are
+        paired for the clock offset estimate.
+        """
+        codes = records['sensor']
+        for code, count in enumerate(np.bincount(codes)):
+            if count:
+                sensor = SENSOR_NAMES.get(code, 'unknown')
+                self.stats.samples[sensor] += int(count)
+                self.stats.check_timestamps(sensor, records['timestamp'][codes == code])
+        if len(records):
+            newest = records[int(np.argmax(records['device_ns']))]
+            if newest['receive_ns']:
+                self._sync_clock(int(newest['device_ns']), int(newest['receive_ns']))
+        self.recorder.write_records(records, lines)
+        live = self.live.admit_records(records, self.pending_samples)
+        if len(live):
+            self._add_pending(live, len(live))
+
+    def _add_pending(self, records, count):
+        """Queue samples for process(), dropping the oldest once the live stage is full"""
+        self.pending_records.append(records)
+        self.pending_samples += count
+        if self.pending_samples > self.live.capacity:
+            records = self.live.trim(pack_records(self.pending_records))
+            self.pending_records = [records]
+            self.pending_samples = len(records)
+
+    def _sync_clock(self, device_ns, receive_ns):
+        """Pair the newest device time of a message with its arrival time"""
+        self.clock.add(device_ns, receive_ns)
+        self.clock_log.add(device_ns, receive_ns, self.clock.offset_ns)
+
+    def process(self):
+        """Run the pending samples through the orientation filter and the resampler.
+
+        Returns (moved, frames): whether the orientation changed, and the
+        frames the samples completed (resampler.FRAME_DTYPE array)
+        """
+        if not self.pending_records:
+            return False, None
+        records = pack_records(self.pending_records)
+        self.pending_records = []
+        self.pending_samples = 0
+        moved = len(self.fusion.update_records(records)) > 0
+        return moved, to_frame_records(*self.resampler.add(records))
+
+    def add_audio(self, pcm):
+        """Append a chunk of raw PCM to the session's WAV recording"""
+        self.audio.write(pcm)
+        self.stats.audio_bytes += len(pcm)
+
+    def close(self):
+        """Flush and close this session's recordings"""
+        self.recorder.close()
+        self.audio.close()
+        self.clock_log.close()
@@ -0,0 +1,326 @@
+"""Compressed session archives, and compaction of JSON recordings into them.
+
+An archive (``session_<time>[_<device>].ssa``) holds all samples of one
+session sorted by time, as blocks of recording_format records that are
+compressed one by one (zstd if the `zstandard` package is installed,
+gzip otherwise). A block index at the end of the file gives every block's
+time span, so reading a time range only decompresses the blocks it needs.
+
+    header    magic 'SSAR', version, codec, block count, index offset, metadata length
+    blocks    compressed RECORD_DTYPE arrays (version 1: without device_ns, receive_ns)
+    index     BLOCK_DTYPE array (offset, size, count, first and last timestamp)
+    metadata  JSON: device, source files
+
+Compact the per-second/per-session JSON files of finished sessions (the
+originals are deleted only once the archive has been read back and
+verified). A session with lines that are not samples is left alone unless
+--lossy is given, since the archive would not hold them:
+
+    python session_archive.py compact recordings
+    python session_archive.py info recordings/session_20240501_140000_pixel7.ssa
+"""
+import argparse
+import datetime
+import gzip
+import json
+import os
+import re
+import struct
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from recording_format import RECORD_DTYPE, RECORD_DTYPE_V1, SENSOR_CODES, SENSOR_NAMES, parse_jsonl, upgrade_records
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MAGIC = b'SSAR'
+VERSION = 2
+ARCHIVE_SUFFIX = '.ssa'
+
+# Header: magic, version, codec, block count, index offset, metadata length, reserved
+HEADER = struct.Struct('<4sHHIQQI')
+
+# Record layout by archive version
+RECORD_DTYPES = {1: RECORD_DTYPE_V1, VERSION: RECORD_DTYPE}
+
+CODECS = {'gzip': 1, 'zstd': 2}
+CODEC_NAMES = {code: name for name, code in CODECS.items()}
+DEFAULT_CODEC = 'zstd' if zstandard else 'gzip'
+
+BLOCK_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('size', '<u4'),
+    ('count', '<u4'),
+    ('t_start', '<f8'),
+    ('t_end', '<f8'),
+])
+
+# Records per compressed block (~384 KiB uncompressed)
+BLOCK_RECORDS = 16 * 1024
+
+# Files further apart than this (seconds between their start times) belong to different sessions
+MAX_GAP = 5.0
+
+# Files modified more recently than this (seconds) may belong to a running session
+MIN_AGE = 60.0
+
+# sensor_data_<YYYYmmdd_HHMMSS>[_<device>].json
+JSON_RECORDING = re.compile(r'^sensor_data_(\d{8}_\d{6})(?:_([A-Za-z0-9_-]+))?\.json$')
+
+
+def _compress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd archives need the zstandard package")
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def _decompress(data, codec):
+    if codec == 'zstd':
+        if zstandard is None:
+            raise RuntimeError("zstd archives need the zstandard package")
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+
+def write_archive(path, records, metadata=None, codec=DEFAULT_CODEC, block_records=BLOCK_RECORDS):
+    """Write records (sorted by time here) into a new archive"""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec: {codec}")
+    records = np.asarray(records, dtype=RECORD_DTYPE)
+    records = records[np.argsort(records['timestamp'], kind='stable')]
+    meta = json.dumps(metadata or {}).encode()
+
+    path = Path(path)
+    tmp_path = path.with_name(path.name + '.tmp')
+    blocks = np.zeros((len(records) + block_records - 1) // block_records, dtype=BLOCK_DTYPE)
+    with open(tmp_path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS[codec], 0, 0, 0, 0))
+        for i, first in enumerate(range(0, len(records), block_records)):
+            block = records[first:first + block_records]
+            data = _compress(block.tobytes(), codec)
+            blocks[i] = (f.tell(), len(data), len(block), block['timestamp'][0], block['timestamp'][-1])
+            f.write(data)
+        index_offset = f.tell()
+        f.write(blocks.tobytes())
+        f.write(meta)
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, CODECS[codec], len(blocks), index_offset, len(meta), 0))
+    os.replace(tmp_path, path)
+    return path
+
+
+class SessionArchive:
+    """Read a session archive, decompressing only the blocks a query needs"""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with open(self.path, 'rb') as f:
+            raw = f.read(HEADER.size)
+            if len(raw) < HEADER.size:
+                raise ValueError(f"{path}: file too short for an archive header")
+            magic, version, codec, block_count, index_offset, meta_length, _ = HEADER.unpack(raw)
+            if magic != MAGIC:
+                raise ValueError(f"{path}: not a session archive")
+            if version not in RECORD_DTYPES or codec not in CODEC_NAMES:
+                raise ValueError(f"{path}: unsupported archive version {version}")
+            f.seek(index_offset)
+            self.blocks = np.frombuffer(f.read(block_count * BLOCK_DTYPE.itemsize), dtype=BLOCK_DTYPE)
+            self.metadata = json.loads(f.read(meta_length) or b'{}')
+        self.codec = CODEC_NAMES[codec]
+        self.record_dtype = RECORD_DTYPES[version]
+
+    def __len__(self):
+        return int(self.blocks['count'].sum())
+
+    @property
+    def start(self):
+        return float(self.blocks['t_start'][0]) if len(self.blocks) else None
+
+    @property
+    def end(self):
+        return float(self.blocks['t_end'][-1]) if len(self.blocks) else None
+
+    def read_block(self, i):
+        """Records of block `i`"""
+        return self._read_blocks([i])
+
+    def _read_blocks(self, indices):
+        parts = []
+        with open(self.path, 'rb') as f:
+            for i in indices:
+                block = self.blocks[i]
+                f.seek(int(block['offset']))
+                data = _decompress(f.read(int(block['size'])), self.codec)
+                records = np.frombuffer(data, dtype=self.record_dtype)
+                parts.append(records if self.record_dtype == RECORD_DTYPE else upgrade_records(records))
+        return np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+
+    def read(self, start=None, end=None, sensors=None):
+        """Records with start <= timestamp <= end (epoch seconds; None for unbounded)"""
+        selected = np.ones(len(self.blocks), dtype=bool)
+        if start is not None:
+            selected &= self.blocks['t_end'] >= start
+        if end is not None:
+            selected &= self.blocks['t_start'] <= end
+        records = self._read_blocks(np.flatnonzero(selected))
+
+        keep = np.ones(len(records), dtype=bool)
+        if start is not None:
+            keep &= records['timestamp'] >= start
+        if end is not None:
+            keep &= records['timestamp'] <= end
+        if sensors is not None:
+            codes = [code for code, name in SENSOR_NAMES.items() if name in sensors]
+            keep &= np.isin(records['sensor'], codes)
+        return records[keep]
+
+    def read_offset(self, offset, duration):
+        """Records from `offset` seconds into the session, for `duration` seconds"""
+        if self.start is None:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return self.read(self.start + offset, self.start + offset + duration)
+
+
+def find_sessions(directory, max_gap=MAX_GAP):
+    """Group a directory's JSON recordings into sessions: [(device, [paths])], oldest first"""
+    by_device = {}
+    for path in Path(directory).glob('sensor_data_*.json'):
+        match = JSON_RECORDING.match(path.name)
+        if match:
+            started = datetime.datetime.strptime(match.group(1), '%Y%m%d_%H%M%S')
+            by_device.setdefault(match.group(2), []).append((started, path))
+
+    sessions = []
+    for device, files in by_device.items():
+        files.sort()
+        current = [files[0][1]]
+        for (previous, _), (started, path) in zip(files, files[1:]):
+            if (started - previous).total_seconds() > max_gap:
+                sessions.append((device, current))
+                current = []
+            current.append(path)
+        sessions.append((device, current))
+    return sorted(sessions, key=lambda session: session[1][0].name)
+
+
+def compact_session(paths, directory, device=None, codec=DEFAULT_CODEC, keep=False, lossy=False):
+    """Merge a session's JSON files into one archive; returns (archive path, samples).
+
+    Every non-empty source line must be a sample of a known sensor
+    (ValueError otherwise; with `lossy` the other lines are dropped), and
+    the archive is read back and compared with the
+    source records before any source file is deleted.
+    """
+    parts, lines = [], 0
+    for path in paths:
+        data = Path(path).read_bytes()
+        parts.append(parse_jsonl(data))
+        lines += sum(1 for line in data.splitlines() if line.strip())
+    records = np.concatenate(parts)
+    # parse_jsonl skips lines that are not samples; samples of sensors it does not know become 'unknown'
+    records = records[records['sensor'] != SENSOR_CODES['unknown']]
+    if len(records) != lines and not lossy:
+        raise ValueError(f"{lines - len(records)} of {lines} lines are not samples; sources kept "
+                         f"(use --lossy to compact anyway)")
+    name = JSON_RECORDING.match(Path(paths[0]).name).group(1)
+    archive_path = Path(directory) / f"session_{name}{'_' + device if device else ''}{ARCHIVE_SUFFIX}"
+    write_archive(archive_path, records, {
+        'device': device,
+        'sources': [Path(path).name for path in paths],
+    }, codec=codec)
+
+    # Verify before deleting anything
+    archived = SessionArchive(archive_path).read()
+    expected = records[np.argsort(records['timestamp'], kind='stable')]
+    if len(archived) != len(expected) or archived.tobytes() != expected.tobytes():
+        archive_path.unlink()
+        raise ValueError(f"Verification of {archive_path.name} failed; sources kept")
+    if not keep:
+        for path in paths:
+            Path(path).unlink()
+    return archive_path, len(records)
+
+
+def compact_directory(directory, min_age=MIN_AGE, max_gap=MAX_GAP, codec=DEFAULT_CODEC,
+                      keep=False, dry_run=False, lossy=False, log=print):
+    """Compact every finished session in a directory; returns the archives written.
+
+    An existing recording index of the directory is updated afterwards, so
+    its queries find the archives instead of the deleted files.
+    """
+    archives = []
+    now = time.time()
+    for device, paths in find_sessions(directory, max_gap):
+        newest = max(os.path.getmtime(path) for path in paths)
+        if now - newest < min_age:
+            continue  # Possibly still being recorded
+        if dry_run:
+            log(f"Would compact {len(paths)} files of {device or 'unknown device'} from {paths[0].name}")
+            continue
+        try:
+            archive_path, samples = compact_session(paths, directory, device, codec, keep, lossy)
+        except Exception as e:
+            log(f"Error compacting {paths[0].name}: {e}")
+            continue
+        log(f"Compacted {len(paths)} files ({samples} samples) into {archive_path.name}")
+        archives.append(archive_path)
+
+    from recording_index import RecordingIndex, INDEX_NAME
+    if archives and (Path(directory) / INDEX_NAME).exists():
+        index = RecordingIndex(directory)
+        try:
+            index.update()
+        finally:
+            index.close()
+    return archives
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Session archive tools")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact = subparsers.add_parser('compact', help="Merge finished sessions' JSON files into archives")
+    compact.add_argument('directory', nargs='?', default='recordings')
+    compact.add_argument('--codec', choices=sorted(CODECS), default=DEFAULT_CODEC)
+    compact.add_argument('--min-age', type=float, default=MIN_AGE,
+                         help=f"Skip sessions written to in the last N seconds (default: {MIN_AGE:.0f})")
+    compact.add_argument('--max-gap', type=float, default=MAX_GAP,
+                         help=f"Seconds between files that still counts as one session (default: {MAX_GAP:.0f})")
+    compact.add_argument('--keep', action='store_true', help="Keep the original files")
+    compact.add_argument('--dry-run', action='store_true', help="Only list what would be compacted")
+    compact.add_argument('--lossy', action='store_true',
+                         help="Also compact sessions with lines that are not samples (they are lost)")
+    compact.add_argument('--watch', type=float, default=None, metavar='SECONDS',
+                         help="Keep running, compacting every N seconds")
+
+    info = subparsers.add_parser('info', help="Show the blocks of an archive")
+    info.add_argument('archive')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'compact':
+        while True:
+            compact_directory(args.directory, args.min_age, args.max_gap, args.codec, args.keep, args.dry_run,
+                              args.lossy)
+            if args.watch is None:
+                break
+            time.sleep(args.watch)
+    elif args.command == 'info':
+        archive = SessionArchive(args.archive)
+        print(f"{archive.path.name}: {len(archive)} samples in {len(archive.blocks)} {archive.codec} blocks, "
+              f"device {archive.metadata.get('device')}, {len(archive.metadata.get('sources', []))} source files")
+        if len(archive.blocks):
+            print(f"{archive.start:.3f} .. {archive.end:.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
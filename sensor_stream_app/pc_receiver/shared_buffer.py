@@ -0,0 +1,304 @@
+import sys
+import zlib
+import numpy as np
+from multiprocessing import shared_memory
+from recording_format import RECORD_DTYPE, SENSOR_CODES
+
+# Shared memory segments are named <prefix>_<sensor>
+SHARED_BUFFER_PREFIX = 'sensor_stream'
+
+# Number of samples kept per sensor (~40 s at 100 Hz)
+DEFAULT_CAPACITY = 4096
+
+# Header: sequence counter (total samples ever written), capacity, and the
+# record size and a checksum of the record dtype, so a segment left over from
+# another record layout is never read as this one
+HEADER_DTYPE = np.dtype([('sequence', '<i8'), ('capacity', '<i8'), ('itemsize', '<i8'), ('layout', '<u8')])
+HEADER_SIZE = 64  # keep the records cache-line aligned
+
+# Sensors that get their own ring buffer
+SENSOR_TYPES = [name for name in SENSOR_CODES if name != 'unknown']
+
+# Segments created by this process (their resource tracker entry must stay)
+_created_here = set()
+
+
+def buffer_name(sensor_type, prefix=SHARED_BUFFER_PREFIX):
+    return f"{prefix}_{sensor_type}"
+
+
+def _segment_size(capacity, dtype=RECORD_DTYPE):
+    return HEADER_SIZE + capacity * dtype.itemsize
+
+
+def _layout(dtype):
+    return zlib.crc32(str(np.dtype(dtype).descr).encode())
+
+
+def _header_matches(shm, capacity, dtype):
+    """Whether a segment's header describes `capacity` records of `dtype` (capacity None: any)"""
+    if shm.size < HEADER_SIZE:
+        return False
+    header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+    capacity = int(header['capacity'][0]) if capacity is None else capacity
+    matches = (shm.size >= _segment_size(capacity, dtype) and header['capacity'][0] == capacity
+               and header['itemsize'][0] == dtype.itemsize and header['layout'][0] == _layout(dtype))
+    del header
+    return matches
+
+
+def _create_segment(name, capacity, dtype):
+    """Create a segment for `capacity` records of `dtype`; returns (shm, reused).
+
+    A segment left over from a previous run is reused if its header matches,
+    and replaced otherwise.
+    """
+    size = _segment_size(capacity, dtype)
+    try:
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        shm = shared_memory.SharedMemory(name=name)
+        if _header_matches(shm, capacity, dtype):
+            _created_here.add(name)
+            return shm, True
+        shm.close()
+        shm.unlink()
+        shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+    header['sequence'] = 0
+    header['capacity'] = capacity
+    header['itemsize'] = dtype.itemsize
+    header['layout'] = _layout(dtype)
+    del header
+    _created_here.add(name)
+    return shm, False
+
+
+def _attach(name):
+    """Attach to an existing segment without letting this process unlink it on exit"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Python < 3.13: attach, then stop the resource tracker from destroying it
+        shm = shared_memory.SharedMemory(name=name)
+        if sys.platform != 'win32' and name not in _created_here:
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+
+class SharedRingBuffer:
+    """Single-writer, multi-reader ring buffer of sensor records in shared memory.
+
+    The writer stores records and then advances the sequence counter; readers
+    keep their own cursor into the sequence and copy out only new entries.
+    Other fixed-size records (e.g. resampler frames) work too, given the
+    same dtype on both sides.
+    """
+
+    def __init__(self, shm, owner, dtype=RECORD_DTYPE):
+        if not _header_matches(shm, None, dtype):
+            raise ValueError(f"Shared buffer {shm.name} holds records of a different layout")
+        self.shm = shm
+        self.owner = owner
+        self.header = np.ndarray((1,), dtype=HEADER_DTYPE, buffer=shm.buf)
+        self.capacity = int(self.header['capacity'][0])
+        self.records = np.ndarray((self.capacity,), dtype=dtype,
+                                  buffer=shm.buf, offset=HEADER_SIZE)
+        self.cursor = 0
+        self.dropped = 0
+
+    @classmethod
+    def create(cls, name, capacity=DEFAULT_CAPACITY, dtype=RECORD_DTYPE):
+        """Create the segment (reusing a compatible one left over from a previous run)"""
+        # A reused segment keeps its sequence counter running, so attached readers carry on
+        shm, _ = _create_segment(name, capacity, dtype)
+        return cls(shm, owner=True, dtype=dtype)
+
+    @classmethod
+    def attach(cls, name, dtype=RECORD_DTYPE):
+        """Attach to a segment created by the server (FileNotFoundError if absent, ValueError if its
+        records are not `dtype`)"""
+        shm = _attach(name)
+        try:
+            buffer = cls(shm, owner=False, dtype=dtype)
+        except ValueError:
+            shm.close()
+            raise
+        # Start reading from the current position, not from stale history
+        buffer.cursor = buffer.sequence
+        return buffer
+
+    @property
+    def sequence(self):
+        return int(self.header['sequence'][0])
+
+    def publish(self, records):
+        """Append one record or an array of records (writer side)"""
+        records = np.atleast_1d(records)
+        count = len(records)
+        if count == 0:
+            return
+        if count > self.capacity:
+            records = records[-self.capacity:]
+        seq = self.sequence
+        # Only the newest `capacity` records survive an oversized batch
+        start = (seq + count - len(records)) % self.capacity
+        first = min(len(records), self.capacity - start)
+        self.records[start:start + first] = records[:first]
+        if first < len(records):
+            self.records[:len(records) - first] = records[first:]
+        self.header['sequence'] = seq + count
+
+    def read_new(self):
+        """Return a copy of the records written since the last call (reader side)"""
+        seq = self.sequence
+        if seq < self.cursor:
+            # The writer restarted with a fresh counter
+            self.cursor = 0
+        if seq - self.cursor > self.capacity:
+            self.dropped += seq - self.cursor - self.capacity
+            self.cursor = seq - self.capacity
+        if seq == self.cursor:
+            return self.records[:0].copy()
+
+        start = self.cursor % self.capacity
+        end = seq % self.capacity
+        if start < end:
+            batch = self.records[start:end].copy()
+        else:
+            batch = np.concatenate([self.records[start:], self.records[:end]])
+
+        # Anything the writer overwrote while we were copying is unreliable
+        overrun = self.sequence - self.capacity - self.cursor
+        if overrun > 0:
+            self.dropped += overrun
+            batch = batch[overrun:]
+        self.cursor = seq
+        return batch
+
+    def close(self):
+        del self.header, self.records
+        self.shm.close()
+        if self.owner:
+            _created_here.discard(self.shm.name.lstrip('/'))
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class SensorBuffers:
+    """One shared ring buffer per sensor type"""
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+
+    @classmethod
+    def create(cls, prefix=SHARED_BUFFER_PREFIX, capacity=DEFAULT_CAPACITY):
+        return cls({sensor: SharedRingBuffer.create(buffer_name(sensor, prefix), capacity)
+                    for sensor in SENSOR_TYPES})
+
+    @classmethod
+    def attach(cls, prefix=SHARED_BUFFER_PREFIX):
+        buffers = {}
+        try:
+            for sensor in SENSOR_TYPES:
+                buffers[sensor] = SharedRingBuffer.attach(buffer_name(sensor, prefix))
+        except (FileNotFoundError, ValueError):
+            for buffer in buffers.values():
+                buffer.close()
+            raise
+        return cls(buffers)
+
+    def publish(self, sensor_type, records):
+        buffer = self.buffers.get(sensor_type)
+        if buffer is not None:
+            buffer.publish(records)
+
+    def publish_mixed(self, records):
+        """Publish a record array holding several sensors into their buffers"""
+        codes = records['sensor']
+        for sensor, buffer in self.buffers.items():
+            selected = records[codes == SENSOR_CODES[sensor]]
+            if len(selected):
+                buffer.publish(selected)
+
+    def read_new(self):
+        """Return {sensor_type: new records} for every sensor"""
+        return {sensor: buffer.read_new() for sensor, buffer in self.buffers.items()}
+
+    def close(self):
+        for buffer in self.buffers.values():
+            buffer.close()
+        self.buffers = {}
+
+
+# Latest fused orientation: a single slot (after the same header as the ring
+# buffers) guarded by a sequence counter that is odd while the writer is updating it
+ORIENTATION_DTYPE = np.dtype([
+    ('sequence', '<i8'),
+    ('timestamp', '<f8'),
+    ('quaternion', '<f8', (4,)),
+])
+
+
+class OrientationBuffer:
+    """Latest orientation quaternion published by the server"""
+
+    def __init__(self, shm, owner):
+        if not _header_matches(shm, 1, ORIENTATION_DTYPE):
+            raise ValueError(f"Shared buffer {shm.name} does not hold an orientation")
+        self.shm = shm
+        self.owner = owner
+        self.slot = np.ndarray((1,), dtype=ORIENTATION_DTYPE, buffer=shm.buf, offset=HEADER_SIZE)
+
+    @classmethod
+    def create(cls, prefix=SHARED_BUFFER_PREFIX):
+        shm, reused = _create_segment(buffer_name('orientation', prefix), 1, ORIENTATION_DTYPE)
+        buffer = cls(shm, owner=True)
+        if reused:
+            # Keep an even sequence so readers never wait on a stale odd value
+            buffer.slot['sequence'] = buffer.slot['sequence'][0] & ~1
+        else:
+            buffer.slot['sequence'] = 0
+        return buffer
+
+    @classmethod
+    def attach(cls, prefix=SHARED_BUFFER_PREFIX):
+        """Attach to the server's orientation slot (FileNotFoundError if absent, ValueError if stale)"""
+        shm = _attach(buffer_name('orientation', prefix))
+        try:
+            return cls(shm, owner=False)
+        except ValueError:
+            shm.close()
+            raise
+
+    def publish(self, timestamp, quaternion):
+        seq = int(self.slot['sequence'][0])
+        self.slot['sequence'] = seq + 1
+        self.slot['timestamp'] = timestamp
+        self.slot['quaternion'] = quaternion
+        self.slot['sequence'] = seq + 2
+
+    def read(self):
+        """Return (sequence, timestamp, quaternion), or None before the first update"""
+        for _ in range(10):
+            seq = int(self.slot['sequence'][0])
+            if seq & 1:
+                continue
+            timestamp = float(self.slot['timestamp'][0])
+            quaternion = self.slot['quaternion'][0].copy()
+            if int(self.slot['sequence'][0]) == seq:
+                return (seq, timestamp, quaternion) if seq else None
+        return None
+
+    def close(self):
+        del self.slot
+        self.shm.close()
+        if self.owner:
+            _created_here.discard(self.shm.name.lstrip('/'))
+            try:
+                self.shm.unlink()
+            except FileNotFoundError:
+                pass
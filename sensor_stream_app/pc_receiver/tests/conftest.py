@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The receiver's modules are imported as top-level modules, like the scripts do
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+import server
+from backpressure import BLOCK, DECIMATE, DROP_NEWEST, DROP_OLDEST, LoadShedder, parse_policies
+from recording_format import RECORD_DTYPE, SENSOR_CODES
+
+
+def make_records(sensors):
+    records = np.zeros(len(sensors), dtype=RECORD_DTYPE)
+    records['sensor'] = [SENSOR_CODES[sensor] for sensor in sensors]
+    records['timestamp'] = np.arange(len(sensors))
+    return records
+
+
+def test_below_high_water_everything_is_admitted():
+    shedder = LoadShedder(100, {'*': DROP_NEWEST})
+    records = make_records(['accelerometer'] * 10)
+    assert len(shedder.admit_records(records, backlog=49)) == 10
+
+
+def test_a_full_stage_drops_new_samples_except_for_blocking_sensors():
+    shedder = LoadShedder(100, {'*': DROP_NEWEST, 'gyroscope': BLOCK})
+    kept = shedder.admit_records(make_records(['accelerometer', 'gyroscope'] * 3), backlog=100)
+    assert kept['sensor'].tolist() == [SENSOR_CODES['gyroscope']] * 3
+    assert dict(shedder.dropped) == {'accelerometer': 3}
+
+
+def test_decimation_starts_at_high_water_and_carries_across_batches():
+    shedder = LoadShedder(100, {'*': DECIMATE}, decimate=4, high_water=0.5)
+    first = shedder.admit_records(make_records(['accelerometer'] * 6), backlog=60)
+    second = shedder.admit_records(make_records(['accelerometer'] * 6), backlog=60)
+    assert first['timestamp'].tolist() == [0, 4]
+    assert second['timestamp'].tolist() == [2]
+    assert len(shedder.admit_records(make_records(['accelerometer'] * 6), backlog=100)) == 0
+    assert shedder.dropped['accelerometer'] == 15
+
+
+def test_trim_drops_the_oldest_samples_of_drop_oldest_sensors_only():
+    shedder = LoadShedder(4, {'*': DROP_OLDEST, 'magnetometer': DROP_NEWEST})
+    records = make_records(['magnetometer', 'accelerometer', 'accelerometer', 'magnetometer', 'accelerometer',
+                            'accelerometer'])
+    trimmed = shedder.trim(records)
+    assert trimmed['timestamp'].tolist() == [0, 3, 4, 5]
+    assert dict(shedder.dropped) == {'accelerometer': 2}
+
+
+def test_policies_are_validated():
+    assert parse_policies(['magnetometer=decimate'], {'*': BLOCK}) == {'*': BLOCK, 'magnetometer': DECIMATE}
+    with pytest.raises(ValueError):
+        parse_policies(['magnetometer=sometimes'])
+    with pytest.raises(SystemExit):
+        server.parse_args(['--live-policy', '*=block'])
+    with pytest.raises(SystemExit):
+        server.parse_args(['--record-policy', '*=drop-oldest'])
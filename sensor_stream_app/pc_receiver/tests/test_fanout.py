@@ -0,0 +1,48 @@
+import numpy as np
+import pytest
+
+from fanout import Subscription
+from recording_format import RECORD_DTYPE, SENSOR_CODES
+
+
+def make_records(sensors, first=0):
+    records = np.zeros(len(sensors), dtype=RECORD_DTYPE)
+    records['sensor'] = [SENSOR_CODES[sensor] for sensor in sensors]
+    records['timestamp'] = np.arange(first, first + len(sensors))
+    return records
+
+
+def queued(subscription):
+    return [(device, records['timestamp'].tolist()) for device, records in subscription._batches()]
+
+
+def test_decimation_is_per_sensor_and_carries_across_batches():
+    subscription = Subscription(decimate=3)
+    subscription.offer('a', make_records(['accelerometer', 'gyroscope'] * 4))
+    subscription.offer('a', make_records(['accelerometer'] * 4, first=8))
+    # accelerometer at 0, 2, 4, 6, 8..11 keeps its 1st, 4th and 7th; gyroscope its 1st and 4th
+    assert queued(subscription) == [('a', [0, 1, 6, 7, 10])]
+
+
+def test_device_and_sensor_filters():
+    subscription = Subscription(sensors=['gyroscope'], devices=['b'])
+    subscription.offer('a', make_records(['gyroscope']))
+    subscription.offer('b', make_records(['accelerometer', 'gyroscope', 'magnetometer'], first=10))
+    assert queued(subscription) == [('b', [11])]
+
+
+def test_a_full_queue_drops_its_oldest_batches():
+    subscription = Subscription(queue_size=2)
+    for first in range(0, 8, 2):
+        subscription.offer('a' if first < 4 else 'b', make_records(['accelerometer'] * 2, first=first))
+    assert subscription.dropped == 4
+    assert queued(subscription) == [('b', [4, 5, 6, 7])]
+
+
+def test_from_path_parses_the_query():
+    subscription = Subscription.from_path('/subscribe?sensors=accelerometer,gyroscope&decimate=4&device=pixel7'
+                                          '&format=binary')
+    assert subscription.codes.tolist() == [SENSOR_CODES['accelerometer'], SENSOR_CODES['gyroscope']]
+    assert (subscription.devices, subscription.decimate, subscription.format) == ({'pixel7'}, 4, 'binary')
+    with pytest.raises(ValueError):
+        Subscription.from_path('/subscribe?sensors=foo')
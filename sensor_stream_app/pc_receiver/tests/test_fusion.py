@@ -0,0 +1,21 @@
+import math
+
+import numpy as np
+import pytest
+
+from fusion import ComplementaryFilter, MadgwickFilter, _OrientationFilter, quaternion_to_euler
+
+
+@pytest.mark.parametrize('cls', [ComplementaryFilter, MadgwickFilter])
+def test_gyro_only_batches_integrate_the_rotation(cls):
+    f = cls()
+    timestamps = np.arange(101) * 0.01
+    gyro = np.tile([0.0, 0.0, math.pi / 2], (101, 1))
+    out = f.update_batch(timestamps, gyro)
+    assert out.shape == (101, 4)
+    assert quaternion_to_euler(f.q)[2] == pytest.approx(math.pi / 2, abs=1e-3)
+
+
+def test_the_base_filter_has_no_step():
+    with pytest.raises(TypeError):
+        _OrientationFilter()
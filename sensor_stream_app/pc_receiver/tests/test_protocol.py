@@ -0,0 +1,60 @@
+import json
+
+import numpy as np
+import pytest
+
+from protocol import (FRAME_AUDIO, FRAME_SENSOR_BATCH, HEADER_SIZE, HELLO, PROTOCOL_VERSION, ProtocolError,
+                      decode_frame, encode_audio, encode_sensor_batch, encode_samples, is_binary_frame,
+                      records_to_frame, wire_to_records)
+from recording_format import SENSOR_CODES
+
+
+def test_sensor_batch_round_trip():
+    timestamps = [1700000000000123, 1700000000020456]
+    frame = encode_sensor_batch(['accelerometer', 'gyroscope'], timestamps, [[1, 2, 3], [0.5, -0.25, 9.75]])
+    assert is_binary_frame(frame)
+    frame_type, wire = decode_frame(frame)
+    assert frame_type == FRAME_SENSOR_BATCH
+    records = wire_to_records(wire)
+    assert list(records['sensor']) == [SENSOR_CODES['accelerometer'], SENSOR_CODES['gyroscope']]
+    assert list(records['device_ns']) == [t * 1000 for t in timestamps]
+    np.testing.assert_allclose(records['timestamp'], np.array(timestamps) / 1e6)
+    np.testing.assert_array_equal(records['z'], [3, 9.75])
+    assert not records['receive_ns'].any()
+    assert records_to_frame(records) == frame
+
+
+def test_flutter_samples_encode_milliseconds():
+    frame = encode_samples([{'sensorType': 'magnetometer', 'timestamp': 1700000000123,
+                             'values': {'x': 1.0, 'y': 2.0}}])
+    _, wire = decode_frame(frame)
+    assert wire['timestamp'][0] == 1700000000123000
+    assert (wire['x'][0], wire['y'][0], wire['z'][0]) == (1, 2, 0)
+
+
+def test_audio_frame():
+    pcm = bytes(range(10))
+    frame_type, payload = decode_frame(encode_audio(pcm))
+    assert frame_type == FRAME_AUDIO
+    assert bytes(payload) == pcm
+
+
+@pytest.mark.parametrize('mangle', [
+    lambda frame: frame[:HEADER_SIZE - 1],
+    lambda frame: frame[:-1],
+    lambda frame: b'XX' + frame[2:],
+    lambda frame: frame[:2] + bytes([PROTOCOL_VERSION + 1]) + frame[3:],
+    lambda frame: frame[:3] + b'\x09' + frame[4:],
+])
+def test_bad_frames_raise(mangle):
+    frame = encode_sensor_batch([1], [0], [[0, 0, 0]])
+    with pytest.raises(ProtocolError):
+        decode_frame(mangle(frame))
+
+
+def test_text_messages_are_not_frames():
+    assert not is_binary_frame('{"type": "sensor"}')
+
+
+def test_hello_announces_the_protocol_version():
+    assert json.loads(HELLO) == {'type': 'hello', 'binary': PROTOCOL_VERSION}
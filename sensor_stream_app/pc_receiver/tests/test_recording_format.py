@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import recording_format
+from recording_format import parse_jsonl, SENSOR_CODES
+
+# As SensorManager and benchmarks/simulator.py send it, and the server records it
+APP_LINE = b'{"sensorType": "accelerometer", "timestamp": 1700000000123, "values": {"x": 0.5, "y": -1, "z": 9.81}}'
+COMPACT_APP_LINE = b'{"sensorType":"gyroscope","timestamp":1700000000500,"values":{"x":1.5,"y":2,"z":3}}'
+LEGACY_LINE = b'{"sensorType": "magnetometer", "values": {"x": 20.5, "y": -1.25, "z": -30}, "timestamp": 1700000001000}'
+
+
+def test_app_key_order_takes_the_fast_path():
+    data = b'\n'.join([APP_LINE, COMPACT_APP_LINE]) + b'\n'
+    assert len(recording_format._SAMPLE_LINE.findall(data)) == 2
+
+    records = parse_jsonl(data)
+    assert records['sensor'].tolist() == [SENSOR_CODES['accelerometer'], SENSOR_CODES['gyroscope']]
+    np.testing.assert_allclose(records['timestamp'], [1700000000.123, 1700000000.5])
+    np.testing.assert_allclose(records['x'], [0.5, 1.5])
+    np.testing.assert_allclose(records['z'], [9.81, 3], rtol=1e-6)
+
+
+def test_mixed_key_orders_and_bad_lines_keep_their_order():
+    data = b'\n'.join([LEGACY_LINE, APP_LINE, b'not json', COMPACT_APP_LINE])
+    records = parse_jsonl(data)
+    assert records['sensor'].tolist() == [SENSOR_CODES['magnetometer'], SENSOR_CODES['accelerometer'],
+                                          SENSOR_CODES['gyroscope']]
+    np.testing.assert_allclose(records['y'], [-1.25, -1, 2])
+
+
+def test_device_ns_is_exact_on_both_parse_paths():
+    data = b'\n'.join([APP_LINE, b'{"timestamp": "2023-11-14T22:13:20.000123", "sensorType": "gyroscope", '
+                                  b'"values": {"x": 1, "y": 2, "z": 3}}'])
+    fast = parse_jsonl(APP_LINE)
+    slow = parse_jsonl(data)
+    assert fast['device_ns'].tolist() == [1700000000123000000]
+    assert slow['device_ns'][0] == fast['device_ns'][0]
+    assert slow['device_ns'][1] % 1_000_000_000 == 123000
+    assert slow['receive_ns'].tolist() == [0, 0]
+
+
+def test_version_1_files_are_still_read(tmp_path):
+    records = parse_jsonl(b'\n'.join([APP_LINE, LEGACY_LINE]))
+    path = tmp_path / 'old.accelerometer.bin'
+    old = records[list(recording_format.RECORD_DTYPE_V1.names)].astype(recording_format.RECORD_DTYPE_V1)
+    path.write_bytes(recording_format.HEADER.pack(recording_format.MAGIC, 1, SENSOR_CODES['accelerometer'],
+                                                  old.itemsize, 0) + old.tobytes())
+
+    read = recording_format.open_records(path)
+    assert read.dtype == recording_format.RECORD_DTYPE
+    assert read['device_ns'].tolist() == records['device_ns'].tolist()
+    assert read['receive_ns'].tolist() == [0, 0]
+    with pytest.raises(ValueError):
+        recording_format.BinaryRecordingWriter(tmp_path / 'old').write_records(records[:1])
+
+
+def test_fallback_keeps_fast_lines_and_skips_messages_that_are_not_samples():
+    bad_number = b'{"sensorType": "gyroscope", "timestamp": 1700000000200, "values": {"x": 1e, "y": 0, "z": 0}}'
+    wrapped = b'{"type": "sensor", "data": {"sensorType": "magnetometer", "values": {"x": 7, "y": 8, "z": 9}, ' \
+              b'"timestamp": 1700000000300}}'
+    data = b'\n'.join([APP_LINE, b'{"type": "status", "battery": 80}', bad_number, wrapped,
+                       b'{"type": "audio", "data": ""}', b'[1, 2]', COMPACT_APP_LINE])
+    records = parse_jsonl(data)
+    assert records['sensor'].tolist() == [SENSOR_CODES['accelerometer'], SENSOR_CODES['magnetometer'],
+                                          SENSOR_CODES['gyroscope']]
+    assert SENSOR_CODES['unknown'] not in records['sensor']
+    np.testing.assert_allclose(records['timestamp'], [1700000000.123, 1700000000.3, 1700000000.5])
@@ -0,0 +1,56 @@
+import asyncio
+
+import numpy as np
+
+from recording_format import RECORD_DTYPE
+from replay import replay, send_times, shift_to_now
+from timestamps import NS_PER_US, now_ns, ns_to_seconds
+
+START = 1700000000.0
+
+
+def make_records(offsets):
+    records = np.zeros(len(offsets), dtype=RECORD_DTYPE)
+    records['timestamp'] = START + np.asarray(offsets, dtype=np.float64)
+    records['device_ns'] = np.round(records['timestamp'] * 1e6).astype(np.int64) * NS_PER_US
+    return records
+
+
+def test_shift_to_now_moves_timestamp_and_device_ns_together():
+    records = make_records([0, 0.5, 1.25])
+    before = now_ns()
+    shift_to_now(records)
+    assert before <= records['device_ns'][0] <= now_ns()
+    np.testing.assert_allclose(ns_to_seconds(records['device_ns']), records['timestamp'], atol=1e-6)
+    np.testing.assert_allclose(np.diff(records['timestamp']), [0.5, 0.75], atol=1e-6)
+
+
+def test_send_times_keep_the_spacing_and_send_backward_steps_at_once():
+    records = make_records([0, 1, 0.5, 3])
+    np.testing.assert_allclose(send_times(records, 2.0), [0, 0.5, 0.5, 1.5])
+
+
+def test_fast_replay_sends_fixed_batches_in_order():
+    records = make_records(np.arange(25) / 10)
+    batches = []
+
+    async def send(batch):
+        batches.append(batch.copy())
+
+    sent, _ = asyncio.run(replay(records, send, speed=0, batch=10))
+    assert sent == 25
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    np.testing.assert_array_equal(np.concatenate(batches), records)
+
+
+def test_timed_replay_waits_for_each_sample():
+    records = make_records([0, 0.1, 0.2])
+    sent_at = []
+
+    async def send(batch):
+        sent_at.extend([asyncio.get_running_loop().time()] * len(batch))
+
+    sent, elapsed = asyncio.run(replay(records, send, speed=2.0, tick=0.001))
+    assert sent == 3
+    assert elapsed >= 0.1
+    assert sent_at[2] - sent_at[0] >= 0.09
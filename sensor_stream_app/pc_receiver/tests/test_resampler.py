@@ -0,0 +1,54 @@
+import numpy as np
+
+from recording_format import RECORD_DTYPE, SENSOR_CODES
+from resampler import StreamingResampler, interpolate, resample
+
+START = 1700000000.0
+
+
+def test_interpolate_is_linear_exact_at_samples_and_nan_across_gaps():
+    timestamps = np.array([0.0, 0.1, 0.2, 1.0])
+    values = np.array([[0.0, 0, 0], [1.0, 0, 0], [3.0, 0, 0], [5.0, 0, 0]])
+    out = interpolate(timestamps, values, np.array([-0.05, 0.0, 0.05, 0.15, 0.2, 0.5, 1.05]), max_gap=0.25)
+    np.testing.assert_allclose(out[:, 0], [np.nan, 0.0, 0.5, 2.0, 3.0, np.nan, np.nan])
+
+
+def make_session(seconds=2.0):
+    """Accelerometer at ~200 Hz, gyroscope at ~50 Hz with jitter, magnetometer missing"""
+    rng = np.random.default_rng(1)
+    parts = []
+    for sensor, rate in (('accelerometer', 200), ('gyroscope', 50)):
+        times = START + np.arange(0, seconds, 1 / rate) + rng.uniform(0, 0.002, int(seconds * rate))
+        part = np.zeros(len(times), dtype=RECORD_DTYPE)
+        part['timestamp'] = times
+        part['sensor'] = SENSOR_CODES[sensor]
+        part['x'] = times - START
+        parts.append(part)
+    records = np.concatenate(parts)
+    return records[np.argsort(records['timestamp'], kind='stable')]
+
+
+def test_resample_puts_every_sensor_on_the_100_hz_grid():
+    times, frames = resample(make_session())
+    np.testing.assert_allclose(np.diff(times), 0.01, atol=1e-6)
+    assert np.allclose(times * 100, np.round(times * 100))
+    # x holds the sample time, so a linear interpolation gives back the grid time
+    np.testing.assert_allclose(frames[:, 0], times - START, atol=1e-6)
+    # The gyroscope starts and ends a little later and earlier than the accelerometer
+    gyro = ~np.isnan(frames[:, 3])
+    assert gyro[3:-3].all()
+    np.testing.assert_allclose(frames[gyro, 3], times[gyro] - START, atol=1e-6)
+    assert np.isnan(frames[:, 6:]).all()
+
+
+def test_streaming_in_batches_gives_the_batch_frames():
+    records = make_session()
+    expected_times, expected = resample(records)
+    resampler = StreamingResampler()
+    parts = [resampler.add(batch) for batch in np.array_split(records, 37)]
+    times = np.concatenate([part[0] for part in parts])
+    frames = np.vstack([part[1] for part in parts])
+    # The last frames wait for samples that never come
+    assert 0 < len(expected_times) - len(times) <= 3
+    np.testing.assert_allclose(times, expected_times[:len(times)])
+    np.testing.assert_allclose(frames, expected[:len(frames)])
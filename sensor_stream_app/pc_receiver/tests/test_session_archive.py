@@ -0,0 +1,51 @@
+import json
+
+import numpy as np
+import pytest
+
+from recording_index import RecordingIndex
+from session_archive import compact_directory, compact_session
+
+START = 1700000000.0
+
+
+def write_session(directory, lines_per_file=50, files=3, extra=()):
+    """JSON recordings of one session, one file per second, as the server writes them"""
+    paths = []
+    for i in range(files):
+        path = directory / f"sensor_data_20231114_2213{20 + i:02d}_pixel7.json"
+        lines = [json.dumps({'sensorType': 'accelerometer', 'timestamp': (START + i + n / lines_per_file) * 1000,
+                             'values': {'x': n, 'y': i, 'z': 9.81}}) for n in range(lines_per_file)]
+        path.write_text('\n'.join(lines + list(extra)) + '\n')
+        paths.append(path)
+    return paths
+
+
+def test_query_after_compaction(tmp_path):
+    write_session(tmp_path)
+    index = RecordingIndex(tmp_path)
+    index.update()
+    before = index.query(START + 0.5, START + 2.5)['accelerometer']
+    assert len(before) == 101
+
+    archives = compact_directory(tmp_path, min_age=0, log=lambda message: None)
+    assert len(archives) == 1
+    assert not list(tmp_path.glob('sensor_data_*.json'))
+
+    index.update()
+    after = index.query(START + 0.5, START + 2.5)['accelerometer']
+    np.testing.assert_array_equal(after, before)
+    assert [row[1] for row in index.files()] == ['archive']
+    index.close()
+
+
+def test_lines_that_are_not_samples_keep_the_sources(tmp_path):
+    paths = write_session(tmp_path, files=1, extra=['{"type": "status", "battery": 80}'])
+    with pytest.raises(ValueError):
+        compact_session(paths, tmp_path, 'pixel7')
+    assert paths[0].exists()
+    assert not list(tmp_path.glob('*.ssa'))
+
+    archive_path, samples = compact_session(paths, tmp_path, 'pixel7', lossy=True)
+    assert samples == 50
+    assert not paths[0].exists()
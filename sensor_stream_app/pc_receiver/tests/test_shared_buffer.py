@@ -0,0 +1,94 @@
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from recording_format import RECORD_DTYPE
+from shared_buffer import OrientationBuffer, SharedRingBuffer, buffer_name
+
+PREFIX = f"sensor_stream_test_{os.getpid()}"
+
+
+def make_records(first, count):
+    records = np.zeros(count, dtype=RECORD_DTYPE)
+    records['timestamp'] = np.arange(first, first + count)
+    return records
+
+
+@pytest.fixture
+def ring():
+    writer = SharedRingBuffer.create(buffer_name('ring', PREFIX), capacity=8)
+    reader = SharedRingBuffer.attach(buffer_name('ring', PREFIX))
+    yield writer, reader
+    reader.close()
+    writer.close()
+
+
+def test_reads_across_the_wraparound(ring):
+    writer, reader = ring
+    writer.publish(make_records(0, 6))
+    assert reader.read_new()['timestamp'].tolist() == list(range(6))
+    writer.publish(make_records(6, 5))
+    assert reader.read_new()['timestamp'].tolist() == list(range(6, 11))
+    assert len(reader.read_new()) == 0
+
+
+def test_a_reader_that_falls_behind_counts_what_it_lost(ring):
+    writer, reader = ring
+    writer.publish(make_records(0, 5))
+    writer.publish(make_records(5, 7))
+    assert reader.read_new()['timestamp'].tolist() == list(range(4, 12))
+    assert reader.dropped == 4
+
+
+def test_an_oversized_batch_keeps_its_newest_records(ring):
+    writer, reader = ring
+    writer.publish(make_records(0, 20))
+    assert writer.sequence == 20
+    assert reader.read_new()['timestamp'].tolist() == list(range(12, 20))
+
+
+def test_a_segment_of_another_layout_is_recreated():
+    name = buffer_name('stale', PREFIX)
+    old = SharedRingBuffer.create(name, capacity=8, dtype=np.dtype([('timestamp', '<f8'), ('v', '<f4')]))
+    old.publish(np.ones(3, dtype=old.records.dtype))
+    with pytest.raises(ValueError):
+        SharedRingBuffer.attach(name)
+    new = SharedRingBuffer.create(name, capacity=8)
+    try:
+        assert new.sequence == 0
+        assert new.records.dtype == RECORD_DTYPE
+    finally:
+        old.shm.close()
+        new.close()
+
+
+def test_orientation_slot_is_seqlocked():
+    writer = OrientationBuffer.create(PREFIX)
+    reader = OrientationBuffer.attach(PREFIX)
+    try:
+        assert reader.read() is None
+        writer.publish(12.5, [0.0, 1.0, 0.0, 0.0])
+        seq, timestamp, quaternion = reader.read()
+        assert (seq, timestamp, quaternion.tolist()) == (2, 12.5, [0.0, 1.0, 0.0, 0.0])
+        # A writer caught mid-update (odd sequence) is never read
+        writer.slot['sequence'] = 3
+        assert reader.read() is None
+    finally:
+        reader.close()
+        writer.close()
+
+
+def test_a_stale_orientation_segment_is_recreated():
+    name = buffer_name('orientation', PREFIX)
+    stale = shared_memory.SharedMemory(name=name, create=True, size=56)
+    stale.buf[:8] = b'\x01' * 8
+    with pytest.raises(ValueError):
+        OrientationBuffer.attach(PREFIX)
+    buffer = OrientationBuffer.create(PREFIX)
+    try:
+        assert buffer.read() is None
+    finally:
+        stale.close()
+        buffer.close()
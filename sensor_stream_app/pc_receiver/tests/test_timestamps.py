@@ -0,0 +1,35 @@
+import numpy as np
+
+from timestamps import NS_PER_MS, NS_PER_SECOND, ClockOffsetEstimator, iso_to_epoch_ns, ns_to_seconds, to_epoch_ns
+
+DEVICE = 1700000000 * NS_PER_SECOND
+OFFSET = 5 * NS_PER_SECOND
+
+
+def test_offset_is_the_smallest_difference_in_the_window():
+    clock = ClockOffsetEstimator(window=10 * NS_PER_SECOND)
+    assert clock.offset_ns is None
+    for i, delay_ms in enumerate([30, 4, 12, 25]):
+        device = DEVICE + i * NS_PER_SECOND
+        clock.add(device, device + OFFSET + delay_ms * NS_PER_MS)
+    assert clock.offset_ns == OFFSET + 4 * NS_PER_MS
+
+
+def test_offset_follows_drift_once_the_minimum_leaves_the_window():
+    clock = ClockOffsetEstimator(window=2 * NS_PER_SECOND)
+    clock.add(DEVICE, DEVICE + OFFSET + NS_PER_MS)
+    for i in range(1, 5):
+        device = DEVICE + i * NS_PER_SECOND
+        clock.add(device, device + OFFSET + 10 * NS_PER_MS)
+    assert clock.offset_ns == OFFSET + 10 * NS_PER_MS
+
+
+def test_epoch_numbers_and_iso_strings_to_ns():
+    assert to_epoch_ns(1700000000123) == 1700000000123 * NS_PER_MS
+    assert to_epoch_ns(1700000000.5) == 1700000000500000000
+    assert to_epoch_ns(1700000000123.456) == 1700000000123456000
+    strings = np.array(['2023-11-14T22:13:20.000123', '2023-11-14T22:13:21'])
+    ns = iso_to_epoch_ns(strings)
+    assert ns[1] - ns[0] == NS_PER_SECOND - 123000
+    assert ns[0] == to_epoch_ns(str(strings[0]))
+    np.testing.assert_allclose(ns_to_seconds(ns), ns / 1e9)
@@ -0,0 +1,128 @@
+"""Numeric timestamps: int64 nanoseconds since the epoch.
+
+Two clocks are involved for every sample: the phone's (device time, sent
+as millisecondsSinceEpoch, or microseconds in binary frames) and this
+PC's (receive time, time.time_ns() when the message arrived).
+ClockOffsetEstimator tracks the offset between them per device.
+
+Record arrays (recording_format.RECORD_DTYPE) keep device time both as
+float64 seconds and as exact int64 nanoseconds, next to the receive time
+of each sample's message; the helpers here convert between seconds,
+nanoseconds and the ISO strings found in legacy recordings, vectorized
+over NumPy arrays.
+"""
+import datetime
+import time
+import warnings
+from collections import deque
+
+import numpy as np
+
+NS_PER_SECOND = 1_000_000_000
+NS_PER_MS = 1_000_000
+NS_PER_US = 1_000
+
+# Epoch numbers above this are milliseconds, below it seconds
+_MS_THRESHOLD = 1e11
+
+# Clock offset: smallest (receive - device) over this long a window
+CLOCK_WINDOW = 30 * NS_PER_SECOND
+
+now_ns = time.time_ns
+
+
+def to_epoch_ns(timestamp, default=None):
+    """Convert one timestamp (epoch ms/s number or ISO string) to epoch nanoseconds"""
+    if isinstance(timestamp, int) and not isinstance(timestamp, bool):
+        return timestamp * NS_PER_MS if timestamp > _MS_THRESHOLD else timestamp * NS_PER_SECOND
+    if isinstance(timestamp, float):
+        # To the microsecond: nanoseconds of today's epoch are beyond float64 precision
+        if timestamp > _MS_THRESHOLD:
+            return round(timestamp * 1_000) * NS_PER_US
+        return round(timestamp * 1_000_000) * NS_PER_US
+    if isinstance(timestamp, str) and timestamp:
+        try:
+            parsed = datetime.datetime.fromisoformat(timestamp)
+        except ValueError:
+            pass
+        else:
+            # Whole seconds are exact as floats; the microseconds are added as integers
+            whole = int(parsed.replace(microsecond=0).timestamp())
+            return whole * NS_PER_SECOND + parsed.microsecond * NS_PER_US
+    return default if default is not None else now_ns()
+
+
+def ns_to_seconds(ns):
+    """Epoch nanoseconds (int or array) to float64 seconds, the record timestamp unit"""
+    if np.ndim(ns):
+        # Split first: int64 nanoseconds do not convert to float64 exactly
+        whole, fraction = np.divmod(np.asarray(ns, dtype=np.int64), NS_PER_SECOND)
+        return whole + fraction / NS_PER_SECOND
+    return ns / NS_PER_SECOND
+
+
+def iso_to_epoch_ns(strings):
+    """Convert an array of ISO timestamps (str or bytes, naive = local time) to int64 nanoseconds.
+
+    NumPy parses the whole array at once; the local UTC offset is looked up
+    only for the earliest and latest value, and the array falls back to one
+    datetime.fromisoformat call per value if they differ (a DST switch) or
+    if NumPy cannot parse a value.
+    """
+    strings = np.asarray(strings)
+    if strings.dtype.kind == 'S':
+        decode = bytes.decode
+    else:
+        strings = strings.astype(str)
+        decode = str
+
+    def one_by_one():
+        return np.array([to_epoch_ns(decode(s)) for s in strings], dtype=np.int64)
+
+    if len(strings) == 0:
+        return np.empty(0, dtype=np.int64)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            parsed = strings.astype('datetime64[ns]')
+    except ValueError:
+        return one_by_one()
+    if np.isnat(parsed).any():
+        return one_by_one()
+    # NumPy reads naive times as UTC, they are local time: take the UTC
+    # offset from the first and last sample, unless a DST switch lies between
+    ns = parsed.astype(np.int64)
+    ends = [int(np.argmin(ns)), int(np.argmax(ns))]
+    offsets = [to_epoch_ns(decode(strings[i])) - int(ns[i]) for i in ends]
+    if offsets[0] != offsets[1]:
+        return one_by_one()
+    return ns + offsets[0]
+
+
+class ClockOffsetEstimator:
+    """Offset between a device's clock and this PC's, from (device, receive) time pairs.
+
+    Every receive time is device time + clock offset + a positive, varying
+    transport delay, so the smallest receive - device difference seen in
+    the last `window` nanoseconds estimates the offset (plus the minimum
+    delay). The window slides, so slow clock drift is followed.
+    """
+
+    def __init__(self, window=CLOCK_WINDOW):
+        self.window = window
+        # (receive_ns, difference) with increasing differences: the window minimum is first
+        self._minima = deque()
+
+    def add(self, device_ns, receive_ns):
+        """Add a pair: the newest sample time of a message and the time it arrived"""
+        difference = receive_ns - device_ns
+        while self._minima and self._minima[-1][1] >= difference:
+            self._minima.pop()
+        self._minima.append((receive_ns, difference))
+        while self._minima[0][0] < receive_ns - self.window:
+            self._minima.popleft()
+
+    @property
+    def offset_ns(self):
+        """Estimated PC time minus device time (None before the first pair)"""
+        return self._minima[0][1] if self._minima else None
@@ -1,14 +1,18 @@
-import json
+import argparse
 import os
 import time
 import numpy as np
 import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D
-from mpl_toolkits.mplot3d.art3d import Poly3DCollection
-import matplotlib.animation as animation
 from collections import deque
 from pathlib import Path
 import math
+import backends
+from shared_buffer import SensorBuffers, OrientationBuffer
+from recording_format import to_epoch_seconds
+from orientation import GyroIntegrator, AxisTransform
+from fusion import quaternion_to_matrix, quaternion_to_euler, quaternion_multiply, quaternion_conjugate, IDENTITY
+from renderers import MatplotlibRenderer, PyQtGraphRenderer, FrameRateMeter, BACKENDS
 
 # Path to recordings
 RECORDINGS_DIR = Path("recordings")
@@ -16,24 +20,38 @@ RECORDINGS_DIR.mkdir(exist_ok=True)
 
 # Very fast update interval
 UPDATE_INTERVAL = 30  # milliseconds
+TARGET_FPS = 1000 / UPDATE_INTERVAL
+
+# The status text only changes this often (seconds); text layout is slow
+STATUS_INTERVAL = 0.25
+
+ARROW_LENGTH = 0.8
+
+# How often to retry attaching to the server's shared buffers, and how long
+# they may stay silent before re-attaching (the server may have restarted)
+ATTACH_RETRY_INTERVAL = 1.0  # seconds
+SHARED_IDLE_TIMEOUT = 2.0  # seconds
 
 class SensorDataVisualizer:
-    def __init__(self):
+    def __init__(self, backend='matplotlib'):
         # Create figure - simple and focused
+        self.backend = backend
         self.fig = plt.figure(figsize=(8, 8))
         
-        # Create 3D axes for phone orientation
-        self.ax = self.fig.add_subplot(111, projection='3d')
-        self.ax.set_title('Phone Orientation (Realtime)')
-        self.ax.set_xlim(-1, 1)
-        self.ax.set_ylim(-1, 1)
-        self.ax.set_zlim(-1, 1)
-        self.ax.set_xlabel('X')
-        self.ax.set_ylabel('Y')
-        self.ax.set_zlabel('Z')
-        
-        # Set fixed viewing angle to reduce computation
-        self.ax.view_init(elev=30, azim=45)
+        # Create 3D axes for phone orientation (the pyqtgraph backend draws in its own window)
+        self.ax = None
+        if backend == 'matplotlib':
+            self.ax = self.fig.add_subplot(111, projection='3d')
+            self.ax.set_title('Phone Orientation (Realtime)')
+            self.ax.set_xlim(-1, 1)
+            self.ax.set_ylim(-1, 1)
+            self.ax.set_zlim(-1, 1)
+            self.ax.set_xlabel('X')
+            self.ax.set_ylabel('Y')
+            self.ax.set_zlabel('Z')
+            
+            # Set fixed viewing angle to reduce computation
+            self.ax.view_init(elev=30, azim=45)
         
         # Axis mapping (for swapping axes)
         self.axis_mapping = {
@@ -49,6 +67,10 @@ class SensorDataVisualizer:
             'z': 1
         }
         
+        # Rotation, swaps and flips composed into one cached matrix
+        self.transform = AxisTransform(self.axis_mapping, self.axis_signs)
+        self.drawn_version = None
+        
         # Phone dimensions
         self.is_portrait = True
         self.update_phone_model()
@@ -70,15 +92,31 @@ class SensorDataVisualizer:
         # Calibration flags for each axis
         self.calibrated_axes = {'pitch': False, 'roll': False, 'yaw': False}
         
-        # Keep track of last processed file time
+        # Live samples from the server (None until attached)
+        self.shared_buffers = None
+        self.next_attach_time = 0
+        self.last_shared_data_time = 0
+        
+        # Orientation fused by the server (quaternion), used when fusion mode is on
+        self.orientation_buffer = None
+        self.fused_quaternion = None
+        self.fusion_reference = IDENTITY.copy()
+        self.use_fusion = False
+        
+        # Fallback: keep track of the file being followed and how far it has been read
         self.last_file_time = 0
+        self.current_file = None
+        self.file_offset = 0
         
         # Initialize sensor data buffers
         self.accel_data = {'x': 0, 'y': 0, 'z': 0}
         self.gyro_data = {'x': 0, 'y': 0, 'z': 0}
         
-        # Last update time for dt calculation
-        self.last_update_time = time.time()
+        # Gyro samples (timestamp, x, y, z) received since the last frame
+        self.pending_gyro = []
+        
+        # Integrates every gyro sample with its own timestamp
+        self.gyro_integrator = GyroIntegrator(gain=0.8)  # Higher gain = more responsive
         
         # Add buttons for calibration and axis swapping
         plt.subplots_adjust(bottom=0.3)  # Make more room for buttons
@@ -138,11 +176,22 @@ class SensorDataVisualizer:
         self.orientation_button = plt.Button(self.orientation_button_ax, 'Toggle Portrait/Landscape')
         self.orientation_button.on_clicked(self.toggle_orientation)
         
-        # Status text
-        self.status_text = self.fig.text(
-            0.02, 0.02, "", fontsize=9,
-            bbox=dict(facecolor='white', alpha=0.7)
-        )
+        # Create gyro/fusion source toggle button
+        self.fusion_button_ax = plt.axes([0.6, 0.35, button_width, button_height])
+        self.fusion_button = plt.Button(self.fusion_button_ax, 'Gyro/Fusion')
+        self.fusion_button.on_clicked(self.toggle_fusion)
+        
+        # The renderer creates the phone artists (and status text) once and then only moves them
+        self.next_status_time = 0
+        if backend == 'pyqtgraph':
+            self.renderer = PyQtGraphRenderer()
+        else:
+            status_text = self.fig.text(
+                0.02, 0.02, "", fontsize=9,
+                bbox=dict(facecolor='white', alpha=0.7)
+            )
+            self.renderer = MatplotlibRenderer(self.fig, self.ax, status_text)
+        self.frame_rate = FrameRateMeter()
     
     def calibrate_axis(self, axis):
         """Calibrate a specific axis using current sensor data"""
@@ -198,10 +247,17 @@ class SensorDataVisualizer:
         for axis in ['pitch', 'roll', 'yaw']:
             self.calibrate_axis(axis)
         
+        # The fused orientation is shown relative to the pose at calibration
+        if self.fused_quaternion is not None:
+            self.fusion_reference = quaternion_conjugate(self.fused_quaternion)
+        
         print("Full calibration complete")
     
     def rotation_matrix(self):
-        """Create rotation matrix from Euler angles with calibration offsets"""
+        """Create rotation matrix from Euler angles with calibration offsets, or from the fused quaternion"""
+        if self.use_fusion and self.fused_quaternion is not None:
+            return quaternion_to_matrix(quaternion_multiply(self.fusion_reference, self.fused_quaternion))
+        
         # Apply calibration offsets
         pitch = self.pitch + self.pitch_offset
         roll = self.roll + self.roll_offset
@@ -220,15 +276,76 @@ class SensorDataVisualizer:
         
         return R
     
-    def update_orientation(self, gyro_x, gyro_y, gyro_z, dt):
-        """Update orientation using gyroscope data"""
-        # Apply gyro readings with light filtering
-        filter_factor = 0.8  # Higher value = more responsive
-        self.roll += gyro_x * dt * filter_factor
-        self.pitch += gyro_y * dt * filter_factor
-        self.yaw += gyro_z * dt * filter_factor
+    def update_orientation(self, gyro_samples):
+        """Update orientation from all gyro samples (timestamp, x, y, z) since the last frame"""
+        if len(gyro_samples) == 0:
+            return
+        signs = np.array([self.axis_signs['x'], self.axis_signs['y'], self.axis_signs['z']])
+        d_roll, d_pitch, d_yaw = self.gyro_integrator.integrate(
+            gyro_samples[:, 0], gyro_samples[:, 1:] * signs)
+        self.roll += d_roll
+        self.pitch += d_pitch
+        self.yaw += d_yaw
     
     def check_new_data(self):
+        """Read new samples from the server's shared buffers, or from recordings as a fallback"""
+        now = time.time()
+        if self.shared_buffers is None and now >= self.next_attach_time:
+            self.attach_shared_buffers()
+            
+        if self.shared_buffers is not None:
+            self.read_shared_buffers(now)
+        else:
+            self.check_new_files()
+    
+    def attach_shared_buffers(self):
+        """Attach to the ring buffers published by the server"""
+        try:
+            self.shared_buffers = SensorBuffers.attach()
+            self.last_shared_data_time = time.time()
+            try:
+                self.orientation_buffer = OrientationBuffer.attach()
+            except (FileNotFoundError, ValueError):
+                self.orientation_buffer = None
+            print("Attached to live sensor buffers")
+        except FileNotFoundError:
+            self.next_attach_time = time.time() + ATTACH_RETRY_INTERVAL
+        except Exception as e:
+            print(f"Error attaching to shared buffers: {e}")
+            self.next_attach_time = time.time() + ATTACH_RETRY_INTERVAL
+    
+    def read_shared_buffers(self, now):
+        """Consume the samples published since the last frame"""
+        new_data = self.shared_buffers.read_new()
+        
+        accel = new_data.get('accelerometer')
+        if accel is not None and len(accel):
+            last = accel[-1]
+            self.accel_data = {'x': float(last['x']), 'y': float(last['y']), 'z': float(last['z'])}
+            
+        gyro = new_data.get('gyroscope')
+        if gyro is not None and len(gyro):
+            last = gyro[-1]
+            self.gyro_data = {'x': float(last['x']), 'y': float(last['y']), 'z': float(last['z'])}
+            self.pending_gyro.append(np.column_stack(
+                [gyro['timestamp'], gyro['x'], gyro['y'], gyro['z']]))
+            
+        if self.orientation_buffer is not None:
+            latest = self.orientation_buffer.read()
+            if latest is not None:
+                self.fused_quaternion = latest[2]
+            
+        if any(len(records) for records in new_data.values()):
+            self.last_shared_data_time = now
+        elif now - self.last_shared_data_time > SHARED_IDLE_TIMEOUT:
+            # Nothing new for a while: re-attach in case the server was restarted
+            self.shared_buffers.close()
+            self.shared_buffers = None
+            if self.orientation_buffer is not None:
+                self.orientation_buffer.close()
+                self.orientation_buffer = None
+    
+    def check_new_files(self):
         """Check for new sensor data files - minimized file system access"""
         try:
             # Only check the most recent file
@@ -245,24 +362,39 @@ class SensorDataVisualizer:
             if file_time <= self.last_file_time:
                 return
                 
-            # Process the file
-            with open(latest_file, 'r') as f:
-                for line in f:
-                    try:
-                        data = json.loads(line.strip())
-                        sensor_type = data.get('sensorType', '')
-                        values = data.get('values', {})
-                        
-                        if sensor_type == 'accelerometer':
-                            self.accel_data['x'] = values.get('x', 0)
-                            self.accel_data['y'] = values.get('y', 0)
-                            self.accel_data['z'] = values.get('z', 0)
-                        elif sensor_type == 'gyroscope':
-                            self.gyro_data['x'] = values.get('x', 0)
-                            self.gyro_data['y'] = values.get('y', 0)
-                            self.gyro_data['z'] = values.get('z', 0)
-                    except json.JSONDecodeError:
-                        continue
+            # Sessions are recorded into one growing file, so only read what was appended
+            if latest_file != self.current_file:
+                self.current_file = latest_file
+                self.file_offset = 0
+                
+            # Process the new lines of the file
+            with open(latest_file, 'rb') as f:
+                f.seek(self.file_offset)
+                chunk = f.read()
+                
+            # Leave a partially written last line for the next pass
+            end = chunk.rfind(b'\n') + 1
+            self.file_offset += end
+            
+            for line in chunk[:end].splitlines():
+                try:
+                    data = backends.loads(line)
+                    sensor_type = data.get('sensorType', '')
+                    values = data.get('values', {})
+                    
+                    if sensor_type == 'accelerometer':
+                        self.accel_data['x'] = values.get('x', 0)
+                        self.accel_data['y'] = values.get('y', 0)
+                        self.accel_data['z'] = values.get('z', 0)
+                    elif sensor_type == 'gyroscope':
+                        self.gyro_data['x'] = values.get('x', 0)
+                        self.gyro_data['y'] = values.get('y', 0)
+                        self.gyro_data['z'] = values.get('z', 0)
+                        self.pending_gyro.append(np.array([[
+                            to_epoch_seconds(data.get('timestamp')),
+                            self.gyro_data['x'], self.gyro_data['y'], self.gyro_data['z']]]))
+                except backends.DecodeError:
+                    continue
                         
             # Update last processed time
             self.last_file_time = file_time
@@ -276,6 +408,7 @@ class SensorDataVisualizer:
         temp = self.axis_mapping[axis1]
         self.axis_mapping[axis1] = self.axis_mapping[axis2]
         self.axis_mapping[axis2] = temp
+        self.transform.set_mapping(self.axis_mapping, self.axis_signs)
         
         # Reset angles after swapping
         self.pitch = 0
@@ -292,6 +425,7 @@ class SensorDataVisualizer:
         """Flip the direction of an axis"""
         print(f"Flipping {axis} axis")
         self.axis_signs[axis] *= -1
+        self.transform.set_mapping(self.axis_mapping, self.axis_signs)
         
         # Reset angles and calibration for the flipped axis
         self.pitch = 0
@@ -306,6 +440,7 @@ class SensorDataVisualizer:
         print("Resetting axes to default configuration")
         self.axis_mapping = {'x': 0, 'y': 1, 'z': 2}
         self.axis_signs = {'x': 1, 'y': 1, 'z': 1}
+        self.transform.set_mapping(self.axis_mapping, self.axis_signs)
         
         # Reset all angles and calibration
         self.pitch = 0
@@ -318,132 +453,82 @@ class SensorDataVisualizer:
         
         print("Axes reset complete")
     
-    def apply_axis_mapping(self, data):
-        """Apply axis mapping and signs to input data"""
-        if isinstance(data, dict):
-            # For dictionary inputs (like accel_data and gyro_data)
-            mapped_data = {}
-            reverse_mapping = {v: k for k, v in self.axis_mapping.items()}
-            for i in range(3):
-                axis = reverse_mapping[i]
-                mapped_data[axis] = data[axis] * self.axis_signs[axis]
-            return mapped_data
-        else:
-            # For array inputs (like vertices)
-            mapped_data = np.zeros_like(data)
-            for i in range(len(data)):
-                mapped_data[i] = [
-                    data[i][self.axis_mapping['x']] * self.axis_signs['x'],
-                    data[i][self.axis_mapping['y']] * self.axis_signs['y'],
-                    data[i][self.axis_mapping['z']] * self.axis_signs['z']
-                ]
-            return mapped_data
+    def orientation_key(self):
+        """What the rotation matrix is built from; the transform is only rebuilt when this changes"""
+        if self.use_fusion and self.fused_quaternion is not None:
+            return ('fusion', *self.fused_quaternion, *self.fusion_reference)
+        return ('gyro', self.pitch + self.pitch_offset, self.roll + self.roll_offset, self.yaw + self.yaw_offset)
     
     def update_plot(self, frame):
         """Update the visualization - simplified for performance"""
         # Get sensor data
         self.check_new_data()
         
-        # Calculate time delta
-        current_time = time.time()
-        dt = current_time - self.last_update_time
-        self.last_update_time = current_time
-        dt = min(dt, 0.1)  # Limit dt to avoid large jumps
-        
         # Auto-calibrate on first significant data
         if not self.calibrated_axes['pitch'] and abs(self.accel_data['z']) > 1.0:
             self.calibrate()
         
-        # Update orientation using mapped gyro data
-        mapped_gyro = self.apply_axis_mapping(self.gyro_data)
-        self.update_orientation(
-            mapped_gyro['x'],
-            mapped_gyro['y'],
-            mapped_gyro['z'],
-            dt
-        )
-        
-        # Clear the axis each frame (most reliable for 3D)
-        self.ax.clear()
-        
-        # Reset axes properties
-        self.ax.set_title('Phone Orientation (Realtime)')
-        self.ax.set_xlim(-1, 1)
-        self.ax.set_ylim(-1, 1)
-        self.ax.set_zlim(-1, 1)
-        self.ax.set_xlabel('X')
-        self.ax.set_ylabel('Y')
-        self.ax.set_zlabel('Z')
-        
-        # Apply rotation
-        R = self.rotation_matrix()
-        rotated_vertices = np.dot(self.vertices, R.T)
-        
-        # Apply axis mapping to rotated vertices
-        mapped_vertices = self.apply_axis_mapping(rotated_vertices)
-        
-        # Draw the phone
-        # Draw back of phone (gray)
-        back_verts = [mapped_vertices[[0, 1, 2, 3]]]
-        back = Poly3DCollection(back_verts, facecolors='gray', edgecolors='k', alpha=0.7)
-        self.ax.add_collection3d(back)
-        
-        # Draw screen of phone (blue)
-        screen_verts = [mapped_vertices[[4, 5, 6, 7]]]
-        screen = Poly3DCollection(screen_verts, facecolors='blue', edgecolors='k', alpha=0.7)
-        self.ax.add_collection3d(screen)
-        
-        # Draw other sides
-        sides = [
-            mapped_vertices[[0, 1, 5, 4]],  # front edge
-            mapped_vertices[[1, 2, 6, 5]],  # right
-            mapped_vertices[[2, 3, 7, 6]],  # back edge
-            mapped_vertices[[3, 0, 4, 7]]   # left
-        ]
-        side_colors = ['r', 'g', 'c', 'm']
-        for i, verts in enumerate(sides):
-            side = Poly3DCollection([verts], facecolors=side_colors[i], edgecolors='k', alpha=0.4)
-            self.ax.add_collection3d(side)
-        
-        # Add direction indicator (z-axis of phone = normal to screen)
-        arrow_length = 0.8
-        origin = np.array([0, 0, 0])
-        z_axis = np.dot(np.array([0, 0, arrow_length]), R.T)
-        self.ax.quiver(
-            origin[0], origin[1], origin[2],
-            z_axis[0], z_axis[1], z_axis[2],
-            color='blue', arrow_length_ratio=0.1
-        )
-        
-        # Update status text with mapped values and axis signs
-        mapped_accel = self.apply_axis_mapping(self.accel_data)
-        mapped_gyro = self.apply_axis_mapping(self.gyro_data)
-        accel_mag = math.sqrt(sum(v*v for v in mapped_accel.values()))
-        status_text = f"Accel: X={mapped_accel['x']:.1f}, Y={mapped_accel['y']:.1f}, Z={mapped_accel['z']:.1f} (Mag={accel_mag:.1f})\n"
-        status_text += f"Gyro: X={mapped_gyro['x']:.1f}, Y={mapped_gyro['y']:.1f}, Z={mapped_gyro['z']:.1f}\n"
+        # Update orientation from every gyro sample received since the last frame
+        if self.pending_gyro:
+            gyro_samples = np.concatenate(self.pending_gyro)
+            self.pending_gyro = []
+            self.update_orientation(gyro_samples)
+        
+        # Rebuild the rotation (and the composed transform) only if the orientation changed
+        self.transform.set_rotation(self.orientation_key(), self.rotation_matrix)
+        
+        # The status text is only rebuilt a few times per second
+        now = time.monotonic()
+        status = None
+        if now >= self.next_status_time:
+            self.next_status_time = now + STATUS_INTERVAL
+            status = self.status()
+        self.frame_rate.tick()
+        
+        # Nothing to redraw if the phone has not moved
+        if status is None and self.transform.version == self.drawn_version:
+            return
+        self.drawn_version = self.transform.version
+        
+        # Rotate and axis-map all vertices in one matmul
+        mapped_vertices = self.transform.apply(self.vertices)
+        
+        # Direction indicator (z-axis of phone = normal to screen)
+        z_axis = self.transform.rotation[:, 2] * ARROW_LENGTH
+        
+        self.renderer.draw(mapped_vertices, z_axis, status)
+    
+    def status(self):
+        """Status text with mapped values and axis signs"""
+        mapped_accel, mapped_gyro = self.transform.map_vectors(np.array([
+            [self.accel_data['x'], self.accel_data['y'], self.accel_data['z']],
+            [self.gyro_data['x'], self.gyro_data['y'], self.gyro_data['z']],
+        ]))
+        accel_mag = np.linalg.norm(mapped_accel)
+        status_text = f"Accel: X={mapped_accel[0]:.1f}, Y={mapped_accel[1]:.1f}, Z={mapped_accel[2]:.1f} (Mag={accel_mag:.1f})\n"
+        status_text += f"Gyro: X={mapped_gyro[0]:.1f}, Y={mapped_gyro[1]:.1f}, Z={mapped_gyro[2]:.1f}\n"
         status_text += f"Angles: P={np.degrees(self.pitch):.0f}°, R={np.degrees(self.roll):.0f}°, Y={np.degrees(self.yaw):.0f}°\n"
         status_text += f"Calibrated: Pitch={self.calibrated_axes['pitch']}, Roll={self.calibrated_axes['roll']}, Yaw={self.calibrated_axes['yaw']}\n"
         status_text += f"Axis Map: X→{list(self.axis_mapping.keys())[list(self.axis_mapping.values()).index(0)]}({self.axis_signs['x']}), "
         status_text += f"Y→{list(self.axis_mapping.keys())[list(self.axis_mapping.values()).index(1)]}({self.axis_signs['y']}), "
         status_text += f"Z→{list(self.axis_mapping.keys())[list(self.axis_mapping.values()).index(2)]}({self.axis_signs['z']})"
-        
-        self.status_text.set_text(status_text)
-        
-        return []  # No blitting for 3D plots
+        if self.fused_quaternion is not None:
+            f_roll, f_pitch, f_yaw = quaternion_to_euler(self.fused_quaternion)
+            status_text += f"\nFused{' (active)' if self.use_fusion else ''}: R={np.degrees(f_roll):.0f}°, P={np.degrees(f_pitch):.0f}°, Y={np.degrees(f_yaw):.0f}°"
+        status_text += f"\nRender: {self.frame_rate.fps:.0f} fps (target {TARGET_FPS:.0f})"
+        return status_text
     
     def start_visualization(self):
         """Start the visualization"""
-        ani = animation.FuncAnimation(
-            self.fig, 
-            self.update_plot, 
-            interval=UPDATE_INTERVAL,
-            blit=False,
-            cache_frame_data=False
-        )
+        # Frames are driven by a GUI timer; the renderer redraws only what moved
+        self.timer = self.fig.canvas.new_timer(interval=UPDATE_INTERVAL)
+        self.timer.add_callback(self.update_plot, None)
+        self.timer.start()
         
         # Show the plot with hardware acceleration if available
         plt.rcParams['figure.autolayout'] = True
         plt.show()
+        self.renderer.close()
 
     def update_phone_model(self):
         """Update phone model vertices based on orientation"""
@@ -472,16 +557,38 @@ class SensorDataVisualizer:
                 [-0.6, 0.3, 0.05]     # 7
             ])
     
+    def toggle_fusion(self, event=None):
+        """Toggle between local gyro integration and the server's fused orientation"""
+        self.use_fusion = not self.use_fusion
+        if self.use_fusion and self.fused_quaternion is None:
+            print("No fused orientation received yet, showing gyro orientation until it arrives")
+        print(f"Orientation source: {'fusion' if self.use_fusion else 'gyro'}")
+    
     def toggle_orientation(self, event=None):
         """Toggle between portrait and landscape orientation"""
         self.is_portrait = not self.is_portrait
         self.update_phone_model()
+        self.transform.invalidate()
         print(f"Switched to {'portrait' if self.is_portrait else 'landscape'} mode")
 
-def main():
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Realtime 3D phone orientation visualizer")
+    parser.add_argument('--backend', choices=BACKENDS, default='matplotlib',
+                        help="Phone renderer (pyqtgraph needs pyqtgraph, PyOpenGL and PyQt/PySide)")
+    args = parser.parse_args(argv)
+    
     print("Starting Realtime 3D Orientation Visualizer")
     print("Monitoring for sensor data in the recordings directory...")
-    visualizer = SensorDataVisualizer()
+    backend = args.backend
+    if backend == 'pyqtgraph':
+        try:
+            import pyqtgraph  # noqa: F401
+            # Share the Qt event loop between the controls and the OpenGL window
+            plt.switch_backend('QtAgg')
+        except ImportError as e:
+            print(f"pyqtgraph backend unavailable ({e}), using matplotlib")
+            backend = 'matplotlib'
+    visualizer = SensorDataVisualizer(backend)
     visualizer.start_visualization()
 
 if __name__ == "__main__":